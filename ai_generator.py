@@ -1,18 +1,372 @@
 import json
 import os
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import httpx
+from openai import OpenAI, DefaultHttpxClient
 from models import ChildScenario, Tag
+from metrics import (registry, llm_requests, llm_request_seconds, llm_tokens, llm_fallbacks, llm_cache_lookups,
+                     llm_cache_evictions, llm_cache_entries)
 import uuid
 
+class LLMResponseCache:
+    """Content-addressed cache for chat completion responses
+    
+    Responses are keyed by a hash of the request (model, messages, temperature,
+    max_tokens, response format). Lookups go through an in-memory LRU first and
+    then an SQLite file shared by every worker, whose entries expire after
+    `ttl_seconds` and are evicted least-recently-used once the stored content
+    exceeds `max_disk_bytes`.
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_memory_entries: int = 256,
+                 ttl_seconds: float = 7 * 24 * 3600, max_disk_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._memory = OrderedDict()  # key -> (stored_at, content)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+    
+    @classmethod
+    def from_environment(cls) -> "LLMResponseCache":
+        """Build the cache from LLM_CACHE_* environment variables"""
+        return cls(
+            path=os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3")) or None,
+            max_memory_entries=int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", 256)),
+            ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+            max_disk_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        )
+    
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """Hash a chat completion request into a cache key"""
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached content for a key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[1]
+            
+            content = self._disk_get(key, now)
+            if content is not None:
+                self._memory_set(key, content, now)
+                self.hits += 1
+                self.disk_hits += 1
+                return content
+            
+            self.misses += 1
+            return None
+    
+    def set(self, key: str, content: str):
+        """Store content under a key in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._memory_set(key, content, now)
+            self._disk_set(key, content, now)
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory)
+        }
+    
+    def _memory_set(self, key: str, content: str, now: float):
+        self._memory[key] = (now, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Connection to the disk tier, reopened after a fork"""
+        if not self.path:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            connection.commit()
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+    
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        try:
+            db = self._db()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT content FROM responses WHERE key = ? AND stored_at > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            return row[0]
+        except sqlite3.Error as e:
+            print(f"LLM cache read failed: {e}")
+            return None
+    
+    def _disk_set(self, key: str, content: str, now: float):
+        try:
+            db = self._db()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, stored_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, content, len(content.encode("utf-8")), now, now)
+            )
+            db.execute("DELETE FROM responses WHERE stored_at <= ?", (now - self.ttl_seconds,))
+            
+            # Evict least recently used entries until the tier fits its budget
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_disk_bytes:
+                for evict_key, size in db.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                    if total <= self.max_disk_bytes:
+                        break
+                    db.execute("DELETE FROM responses WHERE key = ?", (evict_key,))
+                    total -= size
+                    self.evictions += 1
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"LLM cache write failed: {e}")
+
+# Process-wide response cache shared by every generator
+llm_cache = LLMResponseCache.from_environment()
+
+def _collect_cache_metrics():
+    """Copy the response cache counters into the /metrics registry"""
+    stats = llm_cache.stats()
+    llm_cache_lookups.set_total(stats["memory_hits"], "memory_hit")
+    llm_cache_lookups.set_total(stats["disk_hits"], "disk_hit")
+    llm_cache_lookups.set_total(stats["misses"], "miss")
+    llm_cache_evictions.set_total(stats["evictions"])
+    llm_cache_entries.set(stats["memory_entries"])
+
+registry.add_collector(_collect_cache_metrics)
+
+def _record_usage(method: str, usage):
+    """Count the tokens a model response reports using"""
+    if usage is not None:
+        llm_tokens.inc(method, "prompt", amount=usage.prompt_tokens or 0)
+        llm_tokens.inc(method, "completion", amount=usage.completion_tokens or 0)
+
+# Upper bound on concurrent model requests issued by one batch
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 4))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_openai_client() -> OpenAI:
+    """Return the process-wide OpenAI client, creating it on first use
+    
+    The client and its keep-alive connection pool are shared by every thread
+    of a process. A forked worker gets its own client on first use, so
+    connections opened before a fork are never shared between processes.
+    Raises ValueError when OPENAI_API_KEY is not set.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                api_key = os.environ.get("OPENAI_API_KEY")
+                if not api_key:
+                    raise ValueError("OPENAI_API_KEY environment variable is required")
+                http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", 20)),
+                        max_keepalive_connections=int(os.environ.get("LLM_POOL_MAX_KEEPALIVE", 10)),
+                        keepalive_expiry=float(os.environ.get("LLM_POOL_KEEPALIVE_SECONDS", 60))
+                    ),
+                    timeout=httpx.Timeout(float(os.environ.get("LLM_TIMEOUT_SECONDS", 120)), connect=10.0)
+                )
+                _client = OpenAI(api_key=api_key, http_client=http_client)
+                _client_pid = pid
+    return _client
+
+class ChildScenarioStreamParser:
+    """Incrementally extracts completed objects from a streamed JSON array
+    
+    Feed it the text deltas of a JSON-mode response shaped like
+    {"child_scenarios": [{...}, {...}]}; feed() returns each array element as
+    soon as its closing brace arrives, without waiting for the whole document.
+    """
+    
+    def __init__(self, key: str = "child_scenarios"):
+        self._key = json.dumps(key)
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+    
+    @property
+    def finished(self) -> bool:
+        """True once the array has been closed"""
+        return self._finished
+    
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume a text delta and return the objects it completed"""
+        completed = []
+        if self._finished or not text:
+            return completed
+        self._buffer += text
+        
+        if not self._in_array:
+            key_at = self._buffer.find(self._key)
+            if key_at < 0:
+                return completed
+            bracket_at = self._buffer.find("[", key_at + len(self._key))
+            if bracket_at < 0:
+                return completed
+            self._in_array = True
+            self._buffer = self._buffer[bracket_at + 1:]
+            self._pos = 0
+        
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # The child_scenarios array itself has closed
+                    self._finished = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        completed.append(json.loads(buffer[self._object_start:pos + 1]))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed streamed scenario: {e}")
+                    self._object_start = None
+            pos += 1
+        
+        # Keep only the unfinished object (if any) so the buffer stays small
+        keep_from = self._object_start if self._object_start is not None else pos
+        self._buffer = buffer[keep_from:]
+        self._pos = pos - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return completed
+
+def _is_json(content: str) -> bool:
+    """Whether a model reply parses as JSON"""
+    try:
+        json.loads(content)
+    except ValueError:
+        return False
+    return True
+
 class ScenarioGenerator:
     """AI-powered scenario generator using OpenAI"""
     
-    def __init__(self):
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, cache: Optional[LLMResponseCache] = None, client: Optional[OpenAI] = None):
+        self._client = client
+        self.cache = cache if cache is not None else llm_cache
+    
+    @property
+    def client(self) -> OpenAI:
+        """The injected client, or the shared process-wide one"""
+        return self._client or get_openai_client()
+    
+    @client.setter
+    def client(self, client: OpenAI):
+        self._client = client
+    
+    def _chat_completion(self, messages: List[Dict[str, str]], max_tokens: int,
+                         temperature: Optional[float] = None, use_cache: bool = True,
+                         method: str = "chat_completion") -> Optional[str]:
+        """Run a JSON-mode chat completion, going through the response cache when use_cache is set
+        
+        The call is counted, timed and its tokens recorded under the generator method it serves.
+        Only complete replies (finish_reason "stop") that parse as JSON are cached, so a
+        truncated or malformed reply is requested again rather than replayed.
+        """
+        request = {
+            "model": "gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
+            "messages": messages,
+            "response_format": {"type": "json_object"},
+            "max_tokens": max_tokens
+        }
+        if temperature is not None:
+            request["temperature"] = temperature
+        
+        key = LLMResponseCache.make_key(request) if use_cache else None
+        if key:
+            cached = self.cache.get(key)
+            # Entries stored before replies were validated may not parse
+            if cached is not None and _is_json(cached):
+                llm_requests.inc(method, "cached")
+                return cached
+        
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(**request)
+        except Exception:
+            llm_requests.inc(method, "error")
+            raise
+        finally:
+            llm_request_seconds.observe(time.perf_counter() - started, method)
+        llm_requests.inc(method, "success")
+        _record_usage(method, getattr(response, "usage", None))
+        choice = response.choices[0]
+        content = choice.message.content
+        if key and content and choice.finish_reason == "stop" and _is_json(content):
+            self.cache.set(key, content)
+        return content
     
     def _determine_scenario_tag(self, parent_name: str, parent_description: str) -> str:
         """Determine the most appropriate tag based on parent scenario content"""
@@ -66,8 +420,93 @@ class ScenarioGenerator:
         
         return 'Other'
     
-    def generate_child_scenarios(self, parent_name: str, parent_description: str, parent_tag: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Generate child scenarios based on parent scenario information"""
+    def generate_child_scenarios(self, parent_name: str, parent_description: str, parent_tag: Optional[str] = None,
+                                 use_cache: bool = False) -> List[Dict[str, Any]]:
+        """Generate child scenarios based on parent scenario information
+        
+        Generation runs at temperature 0.7 and is not cached unless use_cache is set.
+        """
+        try:
+            return self._request_child_scenarios(parent_name, parent_description, use_cache)
+        except Exception as e:
+            print(f"Error generating scenarios: {e}")
+            llm_fallbacks.inc("generate_child_scenarios")
+            return self._get_fallback_scenarios(parent_name, parent_description)
+    
+    def generate_child_scenarios_batch(self, parents: List[Any], max_concurrency: int = MAX_CONCURRENCY,
+                                       use_cache: bool = False) -> Iterator[Tuple[Any, List[Dict[str, Any]], Optional[str]]]:
+        """Generate child scenarios for many parent scenarios concurrently
+        
+        Runs at most max_concurrency requests at a time and yields
+        (parent, generated scenarios, error) as each parent completes, so
+        callers can attach results as they arrive. A parent whose request fails
+        gets the fallback scenarios and the error message instead of failing
+        the batch.
+        """
+        if not parents:
+            return
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(parents)))) as executor:
+            futures = {
+                executor.submit(self._request_child_scenarios, parent.name, parent.description, use_cache,
+                                "generate_child_scenarios_batch"): parent
+                for parent in parents
+            }
+            for future in as_completed(futures):
+                parent = futures[future]
+                try:
+                    generated = future.result()
+                    error = None if generated else "No child scenarios returned"
+                except Exception as e:
+                    print(f"Error generating scenarios for {parent.name}: {e}")
+                    generated, error = [], str(e)
+                if not generated:
+                    llm_fallbacks.inc("generate_child_scenarios_batch")
+                    generated = self._get_fallback_scenarios(parent.name, parent.description)
+                yield parent, generated, error
+    
+    def stream_child_scenarios(self, parent_name: str, parent_description: str) -> Iterator[Dict[str, Any]]:
+        """Generate child scenarios, yielding each one as soon as the model finishes it
+        
+        Uses the model's streaming mode. If the request fails before any
+        scenario has been produced, the fallback scenarios are yielded instead.
+        """
+        emitted = 0
+        started = time.perf_counter()
+        try:
+            stream = self.client.chat.completions.create(
+                model="gpt-4o",
+                messages=self._child_scenario_messages(parent_name, parent_description),
+                response_format={"type": "json_object"},
+                max_tokens=2000,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            try:
+                parser = ChildScenarioStreamParser()
+                for chunk in stream:
+                    # The last chunk carries no choices, only the token usage
+                    _record_usage("stream_child_scenarios", getattr(chunk, "usage", None))
+                    if not chunk.choices or parser.finished:
+                        continue
+                    for scenario in parser.feed(chunk.choices[0].delta.content or ""):
+                        emitted += 1
+                        yield scenario
+            finally:
+                stream.close()
+            llm_requests.inc("stream_child_scenarios", "success")
+        except Exception as e:
+            print(f"Error streaming scenarios: {e}")
+            llm_requests.inc("stream_child_scenarios", "error")
+            if not emitted:
+                llm_fallbacks.inc("stream_child_scenarios")
+                yield from self._get_fallback_scenarios(parent_name, parent_description)
+        finally:
+            llm_request_seconds.observe(time.perf_counter() - started, "stream_child_scenarios")
+    
+    def _child_scenario_messages(self, parent_name: str, parent_description: str) -> List[Dict[str, str]]:
+        """Build the chat messages that ask for child scenarios of a parent"""
         
         # Combine parent name and description for the prompt
         parent_scenario_text = f"{parent_name}: {parent_description}"
@@ -142,35 +581,39 @@ class ScenarioGenerator:
         - "AESER = 'Y' but AEOUT is blank or missing, verify serious AE has documented outcome."
         
         Keep descriptions under 300 characters and focus on the clinical significance of the validation rule.
+        State the condition that flags a record with variable names, quoted values and =, !=, <, >, IN (...), IS MISSING, AND / OR
+        (e.g. "Rule: When AESER = 'Y' and AEOUT is missing - ...") so dry runs can compile it into a vectorized check.
+        When a pseudo_code check only compares records of the same subject (merging or grouping on USUBJID), begin it with
+        the line PARTITION_BY = 'USUBJID' so dry runs can split the subjects across workers.
         """
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert clinical data quality assurance specialist. Generate realistic, implementable quality checks based on CDISC standards. Always respond with valid JSON."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=2000,
-                temperature=0.7
-            )
-            
-            content = response.choices[0].message.content
-            if content:
-                result = json.loads(content)
-                return result.get("child_scenarios", [])
-            return []
-            
-        except Exception as e:
-            print(f"Error generating scenarios: {e}")
-            return self._get_fallback_scenarios(parent_name, parent_description)
+        return [
+            {
+                "role": "system",
+                "content": "You are an expert clinical data quality assurance specialist. Generate realistic, implementable quality checks based on CDISC standards. Always respond with valid JSON."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    def _request_child_scenarios(self, parent_name: str, parent_description: str,
+                                 use_cache: bool = False,
+                                 method: str = "generate_child_scenarios") -> List[Dict[str, Any]]:
+        """Ask the model for child scenarios; errors propagate to the caller"""
+        content = self._chat_completion(
+            messages=self._child_scenario_messages(parent_name, parent_description),
+            max_tokens=2000,
+            temperature=0.7,
+            use_cache=use_cache,
+            method=method
+        )
+        
+        if content:
+            result = json.loads(content)
+            return result.get("child_scenarios", [])
+        return []
     
     def _get_fallback_scenarios(self, parent_name: str, parent_description: str) -> List[Dict[str, Any]]:
         """Fallback scenarios if AI generation fails"""
@@ -185,14 +628,13 @@ class ScenarioGenerator:
             }
         ]
     
-    def create_child_scenario_objects(self, generated_scenarios: List[Dict[str, Any]], available_tags: List[Tag]) -> List[ChildScenario]:
+    def create_child_scenario_objects(self, generated_scenarios: List[Dict[str, Any]]) -> List[ChildScenario]:
         """Convert generated scenario data to ChildScenario objects"""
         child_scenarios = []
         
         for scenario_data in generated_scenarios:
-            # Find matching tag
-            tag_name = scenario_data.get("tag", "Other")
-            selected_tag = next((tag for tag in available_tags if tag.name == tag_name), available_tags[-1])  # Default to "Other"
+            # Find matching tag, defaulting to "Other"
+            selected_tag = Tag.get(scenario_data.get("tag", "Other")) or Tag.get("Other")
             
             child = ChildScenario(
                 id=str(uuid.uuid4()),
@@ -207,7 +649,7 @@ class ScenarioGenerator:
         
         return child_scenarios
 
-    def _generate_domain_analysis(self, scenario) -> Dict[str, Any]:
+    def _generate_domain_analysis(self, scenario, use_cache: bool = True) -> Dict[str, Any]:
         """Generate domain data analysis for scenario recommendation"""
         # Initialize default values
         domains = set()
@@ -219,14 +661,15 @@ class ScenarioGenerator:
                 domains.update(child.domains)
                 cdash_fields.update(child.required_cdash_items)
             
-            domains_list = list(domains) if domains else ["DM", "AE", "EX"]
+            # Sorted so identical scenarios produce identical prompts (and cache keys)
+            domains_list = sorted(domains) if domains else ["DM", "AE", "EX"]
             
             prompt = f"""
             Analyze the clinical scenario "{scenario.name}" for domain data patterns and risk assessment.
             
             Scenario Description: {scenario.description}
             Domains Involved: {', '.join(domains_list)}
-            CDASH Fields: {', '.join(cdash_fields)}
+            CDASH Fields: {', '.join(sorted(cdash_fields))}
             Child Scenarios: {len(scenario.child_scenarios)}
             
             Provide analysis in JSON format:
@@ -238,17 +681,16 @@ class ScenarioGenerator:
             }}
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            content = self._chat_completion(
                 messages=[
                     {"role": "system", "content": "You are a clinical data analysis expert. Analyze scenarios for data patterns and risk assessment."},
                     {"role": "user", "content": prompt}
                 ],
-                response_format={"type": "json_object"},
-                max_tokens=500
+                max_tokens=500,
+                use_cache=use_cache,
+                method="generate_domain_analysis"
             )
             
-            content = response.choices[0].message.content
             if content:
                 result = json.loads(content)
                 return result
@@ -257,6 +699,7 @@ class ScenarioGenerator:
             
         except Exception as e:
             print(f"Error generating domain analysis: {e}")
+            llm_fallbacks.inc("generate_domain_analysis")
             domains_list = list(domains) if domains else ["DM", "AE", "EX"]
             return {
                 "patterns": [
@@ -269,7 +712,7 @@ class ScenarioGenerator:
                 "risk_explanation": "Standard clinical data validation scenario with moderate complexity"
             }
 
-    def _generate_model_thinking(self, scenario) -> Dict[str, Any]:
+    def _generate_model_thinking(self, scenario, use_cache: bool = True) -> Dict[str, Any]:
         """Generate AI model reasoning for scenario recommendation"""
         try:
             # Collect scenario information
@@ -283,7 +726,7 @@ class ScenarioGenerator:
             Scenario: {scenario.name}
             Description: {scenario.description}
             Tag: {scenario.tag.name if scenario.tag else 'Not specified'}
-            Domains: {', '.join(domains)}
+            Domains: {', '.join(sorted(domains))}
             Number of Child Scenarios: {len(scenario.child_scenarios)}
             
             Provide reasoning in JSON format:
@@ -294,22 +737,21 @@ class ScenarioGenerator:
             }}
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            content = self._chat_completion(
                 messages=[
                     {"role": "system", "content": "You are an AI clinical scenario recommendation expert. Explain your reasoning for scenario selection."},
                     {"role": "user", "content": prompt}
                 ],
-                response_format={"type": "json_object"},
-                max_tokens=500
-            )
-            
-            content = response.choices[0].message.content or ""
+                max_tokens=500,
+                use_cache=use_cache,
+                method="generate_model_thinking"
+            ) or ""
             result = json.loads(content)
             return result
             
         except Exception as e:
             print(f"Error generating model thinking: {e}")
+            llm_fallbacks.inc("generate_model_thinking")
             return {
                 "selection_reasoning": "Selected based on high relevance to specified clinical domains and comprehensive data validation coverage",
                 "priority_logic": "Prioritized due to critical safety implications and regulatory compliance requirements",
@@ -1,6 +1,7 @@
 import os
 import logging
 from flask import Flask
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -9,6 +10,9 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "qad-dev-secret-key-change-in-production")
 
+# Count and time every request for /metrics
+metrics.init_app(app)
+
 # Import routes after app creation to avoid circular imports
 from routes import *
 
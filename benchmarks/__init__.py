@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for the QAD scenario management system.
+
+Run a benchmark as a module from the repository root, e.g.
+``python -m benchmarks.bench_recommend``.
+"""
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Report per-worker memory with OOTB cold fields loaded versus memory-mapped
+
+Compiles a synthetic OOTB catalogue (the shipped one repeated --copies
+times, with distinct cold texts) into a snapshot, then starts --workers
+processes per mode, like gunicorn workers without --preload. Each loads the
+snapshot into ChildScenario objects the way ScenarioStorage does, reads
+every cold field once (as an export would), and reports its memory while
+all workers are alive. Linux only: figures come from /proc/self/status and
+/proc/self/smaps_rollup. PSS splits shared pages between the processes
+mapping them, so it shows what each worker really costs.
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import tempfile
+
+from cold_fields import COLD_FIELDS
+from ootb_snapshot import OOTB_JSON_PATH, build_snapshot, load_ootb_records
+
+MODES = ('memory', 'mmap')
+
+
+def read_memory_kib():
+    """VmRSS, RssAnon, RssFile and Pss of the current process in KiB"""
+    figures = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                figures[key] = int(value.split()[0])
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key == 'Pss':
+                figures['Pss'] = int(value.split()[0])
+    return figures
+
+
+def synthetic_catalogue(copies):
+    """The OOTB catalogue repeated, with distinct names and cold texts per copy"""
+    with open(OOTB_JSON_PATH) as f:
+        raw_scenarios = json.load(f)
+    return [
+        dict(scenario, name=f"{scenario['name']} ({copy})", children=[
+            dict(child,
+                 reasoning_template=f"{child['reasoning_template']} ({copy})",
+                 pseudo_code=f"{child['pseudo_code']}\n# copy {copy}")
+            for child in scenario['children']
+        ])
+        for copy in range(copies)
+        for scenario in raw_scenarios
+    ]
+
+
+def worker(mode, json_path, snapshot, barrier, results):
+    from models import ChildScenario, Tag
+
+    before = read_memory_kib()
+    records, _ = load_ootb_records(json_path, snapshot, map_cold_fields=mode == 'mmap')
+    available_tags = Tag.get_available_tags()
+    children = [
+        ChildScenario(id=child_id, scenario_text=scenario_text,
+                      required_cdash_items=list(required_cdash_items), domains=list(domains),
+                      tag=available_tags[tag_id], reasoning_template=reasoning_template,
+                      pseudo_code=pseudo_code)
+        for _, _, _, _, record_children in records
+        for child_id, scenario_text, required_cdash_items, domains, tag_id,
+            reasoning_template, pseudo_code in record_children
+    ]
+    del records
+    gc.collect()
+
+    cold_bytes = sum(len(getattr(child, name)) for child in children for name in COLD_FIELDS)
+    barrier.wait()
+    after = read_memory_kib()
+    results.put((mode, len(children), before, after, cold_bytes))
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--copies', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'mode':>7} {'worker':>6} {'RSS MB':>8} {'anon MB':>8} {'file MB':>8} {'PSS MB':>8} "
+          f"{'PSS delta MB':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, 'ootb.json')
+        snapshot = os.path.join(directory, 'ootb.snapshot')
+        with open(json_path, 'w') as f:
+            json.dump(synthetic_catalogue(args.copies), f)
+        build_snapshot(json_path, snapshot)
+
+        for mode in MODES:
+            barrier = context.Barrier(args.workers)
+            results = context.Queue()
+            processes = [
+                context.Process(target=worker, args=(mode, json_path, snapshot, barrier, results))
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            reports = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+            for index, (_, child_count, before, after, cold_bytes) in enumerate(reports):
+                print(f"{mode:>7} {index:>6} {after['VmRSS'] / 1024:8.1f} {after['RssAnon'] / 1024:8.1f} "
+                      f"{after['RssFile'] / 1024:8.1f} {after['Pss'] / 1024:8.1f} "
+                      f"{(after['Pss'] - before['Pss']) / 1024:13.1f}")
+        print(f"{child_count} child scenarios per worker, {cold_bytes / 1e6:.1f} MB of cold text")
+
+
+if __name__ == "__main__":
+    main()
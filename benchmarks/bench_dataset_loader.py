@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark the projected dataset loader against reading whole datasets
+
+Writes one synthetic wide domain (--rows rows, --columns columns of
+code-list text) as CSV, Parquet and Arrow IPC, then for each format times
+a whole-file pandas read, as dry runs did before, against read_dataset
+restricted to --read columns, and a dataset cache hit for a subset of those.
+Memory is the deep size of the resulting frame. For CSV and Parquet the
+pyarrow reader is also checked against the pandas-only reader: both must
+give the same dtypes and flag the same rows for RULE.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from rule_compiler import compile_condition
+from study_data import DatasetCache, _read_pandas, read_dataset
+
+VALUES = ('Y', 'N', 'MILD', 'MODERATE', 'SEVERE', 'RECOVERED', 'NOT RECOVERED', 'DRUG WITHDRAWN')
+WRITERS = {
+    '.csv': lambda frame, path: frame.to_csv(path, index=False),
+    '.parquet': lambda frame, path: frame.to_parquet(path, index=False),
+    '.arrow': lambda frame, path: frame.to_feather(path),
+}
+READERS = {
+    '.csv': lambda path: pd.read_csv(path, low_memory=False),
+    '.parquet': pd.read_parquet,
+    '.arrow': pd.read_feather,
+}
+# Compares a date column with a string literal and a number column with a number
+RULE = "AESTDTC > '2021-06-01' and AESEQ > 10"
+
+
+def make_frame(rows, columns, rng):
+    data = {'USUBJID': np.char.add('STUDY-', rng.integers(0, rows // 20 + 1, rows).astype(str)),
+            'AESTDTC': np.datetime_as_string(np.datetime64('2020-01-01') + rng.integers(0, 900, rows), unit='D'),
+            'AESEQ': rng.integers(1, 40, rows)}
+    for index in range(columns - len(data)):
+        data[f'AEX{index:03d}'] = rng.choice(VALUES, rows)
+    return pd.DataFrame(data)
+
+
+def megabytes(frame):
+    return frame.memory_usage(index=True, deep=True).sum() / 1024 / 1024
+
+
+def check_readers_agree(path, columns):
+    """Fail unless the pyarrow and pandas readers give the same dtypes and rule results"""
+    arrow, plain = read_dataset(path, columns), _read_pandas(path, columns)
+    assert arrow.dtypes.to_dict() == plain.dtypes.to_dict(), (arrow.dtypes.to_dict(), plain.dtypes.to_dict())
+    rule = compile_condition(RULE)
+    assert (rule.evaluate(arrow) == rule.evaluate(plain)).all(), f"{RULE} differs between readers"
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--read', type=int, default=8, help="columns the checks need")
+    args = parser.parse_args()
+
+    frame = make_frame(args.rows, args.columns, np.random.default_rng(0))
+    wanted = list(frame.columns[:max(args.read, 3)])
+    print(f"{args.rows} rows x {args.columns} columns, reading {len(wanted)}")
+    print(f"{'format':>8} {'full s':>8} {'full MB':>8} {'projected s':>12} {'projected MB':>13} "
+          f"{'speedup':>8} {'cache hit s':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for extension, write in WRITERS.items():
+            path = os.path.join(directory, f'ae{extension}')
+            write(frame, path)
+            full_seconds, full = timed(READERS[extension], path)
+            projected_seconds, projected = timed(read_dataset, path, wanted)
+            assert list(projected.columns) == wanted and len(projected) == len(full)
+            if extension != '.arrow':
+                check_readers_agree(path, wanted)
+
+            cache = DatasetCache(1024 ** 3)
+            cache.get(path, wanted)
+            hit_seconds, _ = timed(cache.get, path, wanted[:2])
+            print(f"{extension[1:]:>8} {full_seconds:8.2f} {megabytes(full):8.0f} {projected_seconds:12.3f} "
+                  f"{megabytes(projected):13.1f} {full_seconds / projected_seconds:7.0f}x {hit_seconds:12.4f}")
+            del full, projected
+
+
+if __name__ == "__main__":
+    main()
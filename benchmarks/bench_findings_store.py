@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark browsing a large dry run result through the findings store
+
+Stores --rows flagged records for one child check (as the dry run workers
+do, in a separate process) plus a few small checks, then times the pages a
+browser requests: the first page, pages deep into the result reached by
+cursor, a page filtered by subject, and a streamed CSV download of the whole
+result. The serving process's peak memory is compared with loading the
+result whole.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from findings_store import FindingsStore, write_chunk
+from exporter import stream_records_csv
+
+VALUES = ('Y', 'N', 'DRUG WITHDRAWN', 'RECOVERED', 'NOT RECOVERED', 'MILD', 'SEVERE')
+
+
+def make_findings(rows, rng):
+    start = np.datetime64('2021-01-01') + rng.integers(0, 700, rows)
+    return pd.DataFrame({
+        'USUBJID': np.char.add('STUDY-', (np.arange(rows) // 40).astype(str)),
+        'VISIT': np.char.add('VISIT ', rng.integers(1, 12, rows).astype(str)),
+        'AESTDTC': np.datetime_as_string(start, unit='D'),
+        'AEENDTC': np.datetime_as_string(start + rng.integers(-5, 60, rows), unit='D'),
+        'AEACN': rng.choice(VALUES, rows), 'AEOUT': rng.choice(VALUES, rows),
+        'AETERM': rng.choice(['HEADACHE', 'NAUSEA', 'RASH', 'FATIGUE', 'DIZZINESS'], rows),
+    })
+
+
+def store_run(directory, rows):
+    """Write a run the way a dry run does; runs in a child process so its memory is not counted"""
+    store = FindingsStore(directory)
+    run_id = store.new_run()
+    rng = np.random.default_rng(0)
+    children = []
+    for number, count in enumerate((rows, 50, 1_000)):
+        chunk = write_chunk(os.path.join(store.run_dir(run_id), f'{number:05d}.parquet'), make_findings(count, rng))
+        children.append({'child_id': f'check-{number}', 'scenario_id': 'bench', 'child_scenario': f'check {number}',
+                         'status': 'flagged', 'flagged_count': count, 'stored_count': count, 'domains': ['AE'],
+                         'chunks': [chunk]})
+    store.save_index(run_id, {'scenario_name': 'bench'}, children)
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        writer = multiprocessing.get_context('spawn').Process(target=store_run, args=(directory, args.rows))
+        writer.start()
+        writer.join()
+        assert writer.exitcode == 0
+        store = FindingsStore(directory)
+        run_id = store.runs()[0]['run_id']
+        print(f"{args.rows} flagged records stored in {time.perf_counter() - started:.1f}s")
+        baseline_mb = peak_mb()
+
+        print(f"{'request':>28} {'ms':>9} {'records':>8}")
+        seconds, page = timed(store.page, run_id, child='check-0', limit=args.page_size)
+        assert page['total'] == args.rows
+        print(f"{'first page':>28} {seconds * 1000:9.1f} {len(page['records']):>8}")
+        for fraction in (0.5, 0.999):
+            cursor = f'0.0.{int(args.rows * fraction)}'
+            seconds, page = timed(store.page, run_id, child='check-0', cursor=cursor, limit=args.page_size)
+            print(f"{f'page at {fraction:.1%}':>28} {seconds * 1000:9.1f} {len(page['records']):>8}")
+        cursor, pages, walked = None, 0, time.perf_counter()
+        for pages in range(1, 51):
+            page = store.page(run_id, cursor=cursor, limit=args.page_size)
+            cursor = page['next_cursor']
+        print(f"{'next page (mean of 50)':>28} {(time.perf_counter() - walked) / pages * 1000:9.1f} "
+              f"{len(page['records']):>8}")
+        subject = f'STUDY-{args.rows // 40 - 1}'
+        seconds, page = timed(store.page, run_id, subject=subject, limit=args.page_size)
+        assert all(record['USUBJID'] == subject for record in page['records'])
+        print(f"{'subject filter, whole run':>28} {seconds * 1000:9.1f} {len(page['records']):>8}")
+
+        seconds, size = timed(lambda: sum(len(chunk) for chunk in stream_records_csv(
+            store.iter_records(run_id, child='check-0'), store.columns(run_id, child='check-0'))))
+        print(f"{'CSV download':>28} {seconds * 1000:9.1f} {args.rows:>8}  "
+              f"({args.rows / seconds:,.0f} records/s, {size / 1024 / 1024:.0f} MB)")
+        serving_mb = peak_mb() - baseline_mb
+
+        path = os.path.join(store.run_dir(run_id), store.index(run_id)['children'][0]['chunks'][0]['file'])
+        frame = pd.read_parquet(path)
+        frame['AESTDTC'].str.len().sum()
+        print(f"peak memory growth while serving: {serving_mb:.0f} MB; "
+              f"loading the result whole: {peak_mb() - baseline_mb - serving_mb:.0f} MB more "
+              f"({frame.memory_usage(deep=True).sum() / 1024 / 1024:.0f} MB frame)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Differential benchmark of incremental dry runs against full runs
+
+Writes synthetic AE and LB datasets (--subjects subjects, --rows-per-subject
+rows each) and --checks compiled rule checks, half over code lists and half
+comparing dates or numbers held as text, plus one pseudo code check,
+runs them once to record their state, then applies --refreshes rounds of
+changes: the records of --change-percent of the subjects edited, a new and
+a dropped subject, and shuffled rows. After every refresh the checks run
+incrementally and in full, and every check report must match; the script
+fails on the first difference. Timings exclude dataset loading, which both
+paths share.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dry_run import plan_scans, run_scan
+from models import ChildScenario
+from study_data import dataset_cache
+
+CODES = {'AE': ('AEACN', 'AEOUT', 'AESER', 'AESEV'), 'LB': ('LBNRIND', 'LBSTAT', 'LBBLFL', 'LBFAST')}
+VALUES = ('Y', 'N', 'DRUG WITHDRAWN', 'RECOVERED', 'NOT RECOVERED', 'HIGH', 'LOW', '')
+# Rules over dates and numbers held as text, as EDC extracts deliver them, the costly kind: text ordering and numeric conversion
+TEXT_RULES = {'AE': "When AEENDTC < AESTDTC and AEOUT = 'RECOVERED'",
+              'LB': "When LBORRES > LBORNRHI and LBNRIND != 'HIGH'"}
+COMPARED = ('status', 'flagged_count', 'records', 'message')
+CODE_CHECK = '''
+def validate_scenario(ae_df):
+    return ae_df[(ae_df['AESER'] == 'Y') & (ae_df['AEOUT'] != 'RECOVERED')]
+'''
+
+
+def make_domain(domain, subjects, rows_per_subject, rng):
+    rows = subjects * rows_per_subject
+    data = {'USUBJID': np.char.add('S-', np.repeat(np.arange(subjects), rows_per_subject).astype(str)),
+            f'{domain}SEQ': np.tile(np.arange(rows_per_subject), subjects),
+            f'{domain}TOXGR': rng.integers(0, 6, rows)}
+    for code in CODES[domain]:
+        data[code] = rng.choice(VALUES, rows)
+    data.update(text_values(domain, rows, rng))
+    return pd.DataFrame(data)
+
+
+def text_values(domain, rows, rng):
+    if domain == 'AE':
+        start = np.datetime64('2020-01-01') + rng.integers(0, 900, rows)
+        end = start + rng.integers(-30, 300, rows)
+        return {'AESTDTC': np.datetime_as_string(start, unit='D'), 'AEENDTC': np.datetime_as_string(end, unit='D')}
+    return {'LBORRES': np.char.mod('%.2f', rng.uniform(0, 200, rows)),
+            'LBORNRHI': np.char.mod('%.1f', rng.uniform(50, 150, rows))}
+
+
+def refresh(frame, domain, change_percent, rng):
+    """An EDC refresh: a few subjects' records edited, one new and one dropped subject, rows reordered"""
+    frame = frame.copy()
+    subjects = frame['USUBJID'].unique()
+    changed = rng.choice(subjects, max(1, int(len(subjects) * change_percent / 100)), replace=False)
+    edited = np.flatnonzero(frame['USUBJID'].isin(changed).to_numpy())
+    column = rng.choice(CODES[domain])
+    frame.loc[frame.index[edited], column] = rng.choice(VALUES, len(edited))
+    for column, values in text_values(domain, len(edited), rng).items():
+        frame.loc[frame.index[edited], column] = values
+    dropped = rng.choice(frame['USUBJID'].unique())
+    added = frame[frame['USUBJID'] == rng.choice(frame['USUBJID'].unique())].assign(
+        USUBJID=f'S-NEW-{rng.integers(1_000_000)}')
+    frame = pd.concat([frame[frame['USUBJID'] != dropped], added], ignore_index=True)
+    # Shuffle a block of rows: order changes nothing but the sample position
+    block = rng.choice(len(frame) - 100)
+    frame.iloc[block:block + 100] = frame.iloc[block:block + 100].sample(frac=1, random_state=0).to_numpy()
+    return frame
+
+
+def make_checks(count, seed=0):
+    rng = random.Random(seed)
+    checks = []
+    for index in range(count):
+        domain = 'AE' if index % 2 == 0 else 'LB'
+        first, second = rng.sample(CODES[domain], 2)
+        if index % 4 < 2:
+            text = (f"When {first} = '{rng.choice(VALUES[:-1])}' and ({second} IS MISSING "
+                    f"or {domain}TOXGR >= {rng.randint(1, 5)})")
+        else:
+            text = TEXT_RULES[domain].replace(' and ', f" and {first} != '{rng.choice(VALUES)}' and ")
+        checks.append(ChildScenario(id=f'check-{index}', scenario_text=text, required_cdash_items=[first, second],
+                                    domains=[domain], tag=None, reasoning_template=''))
+    checks.append(ChildScenario(id='code-check', scenario_text='Serious events not recovered',
+                                required_cdash_items=['AESER', 'AEOUT'], domains=['AE'], tag=None,
+                                reasoning_template='', pseudo_code=CODE_CHECK))
+    return checks
+
+
+def run(children, data_dir, history_dir):
+    """(check seconds, reports by child id) of one planned run"""
+    dataset_cache.clear()
+    seconds = 0.0
+    reports = {}
+    for domains, columns, checks in plan_scans(children):
+        started = time.perf_counter()
+        scan, results = run_scan((domains, columns, checks, data_dir, 600, 20, history_dir, None, None, True))
+        seconds += time.perf_counter() - started - scan['load_seconds']
+        reports.update((report['child_id'], report) for _, report in results)
+    return seconds, reports
+
+
+def write(frames, directory):
+    for domain, frame in frames.items():
+        frame.to_parquet(os.path.join(directory, f'{domain.lower()}.parquet'), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=20_000)
+    parser.add_argument('--rows-per-subject', type=int, default=50)
+    parser.add_argument('--checks', type=int, default=16)
+    parser.add_argument('--refreshes', type=int, default=5)
+    parser.add_argument('--change-percent', type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    children = make_checks(args.checks)
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as history_dir:
+        frames = {domain: make_domain(domain, args.subjects, args.rows_per_subject, rng) for domain in CODES}
+        write(frames, data_dir)
+        first_seconds, _ = run(children, data_dir, history_dir)
+        print(f"{args.subjects * args.rows_per_subject} rows per domain, {len(children)} checks, "
+              f"first run {first_seconds:.2f}s")
+        print(f"{'refresh':>8} {'full s':>8} {'incremental s':>14} {'speedup':>8} {'subjects re-run':>16}")
+        for round_number in range(1, args.refreshes + 1):
+            frames = {domain: refresh(frame, domain, args.change_percent, rng) for domain, frame in frames.items()}
+            write(frames, data_dir)
+            full_seconds, full = run(children, data_dir, None)
+            incremental_seconds, incremental = run(children, data_dir, history_dir)
+            for child_id, report in full.items():
+                for field in COMPARED:
+                    assert incremental[child_id][field] == report[field], (round_number, child_id, field)
+            rerun = sum(report['rerun_subjects'] or 0 for report in incremental.values())
+            print(f"{round_number:>8} {full_seconds:8.3f} {incremental_seconds:14.3f} "
+                  f"{full_seconds / incremental_seconds:7.1f}x {rerun:>16}")
+        print("Incremental reports matched full runs after every refresh")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the overhead of the /metrics instrumentation
+
+Times a bare histogram observation, the cheapest and a typical storage call
+with and without the storage timers, and a request to a minimal Flask app
+with and without the request hooks. A /metrics render over as many series
+as a busy worker collects is timed last.
+"""
+import argparse
+import time
+
+from flask import Flask
+
+import metrics
+from data import ScenarioStorage
+
+
+def per_call_us(fn, calls):
+    """Mean wall time of fn in microseconds over calls runs"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def minimal_app(instrumented):
+    app = Flask(__name__)
+    if instrumented:
+        metrics.init_app(app)
+
+    @app.route('/ping')
+    def ping():
+        return 'pong'
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100_000)
+    parser.add_argument('--requests', type=int, default=5_000)
+    args = parser.parse_args()
+
+    histogram = metrics.Histogram('bench_seconds', 'bench', ('route',))
+    print(f"histogram observe: {per_call_us(lambda: histogram.observe(0.003, '/'), args.calls):.2f} us")
+
+    plain = ScenarioStorage()
+    instrumented = metrics.instrument_storage(ScenarioStorage())
+    scenario_id = plain.get_all_scenarios()[0].id
+    print(f"{'storage call':>30} {'plain us':>9} {'timed us':>9} {'overhead':>9}")
+    for label, call in (('get_scenario_by_id', lambda storage: storage.get_scenario_by_id(scenario_id)),
+                        ("search_scenarios('outcome')", lambda storage: storage.search_scenarios('outcome'))):
+        base = per_call_us(lambda: call(plain), args.calls // 10)
+        timed = per_call_us(lambda: call(instrumented), args.calls // 10)
+        print(f"{label:>30} {base:9.2f} {timed:9.2f} {timed - base:8.2f}us")
+
+    timings = {}
+    for hooked in (False, True):
+        client = minimal_app(hooked).test_client()
+
+        def ping():
+            with client.get('/ping') as response:
+                response.get_data()
+        timings[hooked] = per_call_us(ping, args.requests)
+    print(f"Flask request: {timings[False]:.1f} us bare, {timings[True]:.1f} us with request hooks "
+          f"(+{timings[True] - timings[False]:.1f} us)")
+
+    # A worker that has served every route with a few statuses
+    for route in range(60):
+        for status in ('200', '302', '404', '500'):
+            metrics.http_requests.inc('GET', f'/route/{route}', status)
+        metrics.http_request_seconds.observe(0.01, 'GET', f'/route/{route}')
+    text = metrics.render()
+    print(f"/metrics render: {per_call_us(metrics.render, 200) / 1000:.2f} ms for {len(text.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark memory per child scenario for the slotted, interned models
+
+Builds --sizes child scenarios the way a catalogue load does (fresh code
+strings per child, tag looked up by name) with the current models and with
+the previous layout (per-instance __dict__, lists of codes, new Tag objects
+per lookup), and reports traced bytes per child. Texts are shared between
+both variants, so the difference is the per-object overhead.
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from models import ChildScenario, Tag
+
+DOMAIN_SETS = [('AE',), ('AE', 'CM'), ('LB',), ('VS', 'EG'), ('EX', 'DS'), ('MH', 'AE'), ('DM',)]
+CDASH_SETS = [
+    ('AESTDTC', 'AEENDTC', 'AETERM', 'AESEV', 'AEOUT'),
+    ('CMTRT', 'CMSTDTC', 'CMENDTC', 'AETERM'),
+    ('LBTESTCD', 'LBORRES', 'LBORNRLO', 'LBORNRHI'),
+    ('VSTESTCD', 'VSORRES', 'EGORRES'),
+    ('EXSTDTC', 'EXENDTC', 'DSSTDTC', 'DSDECOD'),
+]
+TAG_NAMES = ['Safety', 'Efficacy', 'Data Quality', 'Compliance', 'Protocol Deviation', 'Other']
+TEXT = "If a condition worsens the following day the outcome should be not recovered."
+
+
+@dataclass
+class LegacyTag:
+    name: str
+    color: str
+
+
+def legacy_available_tags():
+    return [LegacyTag(name, "light text-dark") for name in TAG_NAMES]
+
+
+@dataclass
+class LegacyChildScenario:
+    id: str
+    scenario_text: str
+    required_cdash_items: List[str]
+    domains: List[str]
+    tag: Optional[LegacyTag]
+    reasoning_template: str
+    pseudo_code: str = ""
+    version: str = "1.0"
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+
+
+def fresh(codes):
+    """Copies of the codes as new string objects, as a JSON or form parse yields"""
+    return [code.encode().decode() for code in codes]
+
+
+def build_current(count, rng):
+    return [
+        ChildScenario(id=f"{i:036d}", scenario_text=TEXT, required_cdash_items=fresh(rng.choice(CDASH_SETS)),
+                      domains=fresh(rng.choice(DOMAIN_SETS)), tag=Tag.get(rng.choice(TAG_NAMES)),
+                      reasoning_template=TEXT)
+        for i in range(count)
+    ]
+
+
+def build_legacy(count, rng):
+    children = []
+    for i in range(count):
+        tag_name = rng.choice(TAG_NAMES)
+        tag = next((tag for tag in legacy_available_tags() if tag.name == tag_name), None)
+        children.append(LegacyChildScenario(
+            id=f"{i:036d}", scenario_text=TEXT, required_cdash_items=fresh(rng.choice(CDASH_SETS)),
+            domains=fresh(rng.choice(DOMAIN_SETS)), tag=tag, reasoning_template=TEXT))
+    return children
+
+
+def bytes_per_child(build, count):
+    gc.collect()
+    tracemalloc.start()
+    children = build(count, random.Random(0))
+    gc.collect()
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del children
+    return traced / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'children':>10} {'legacy B':>9} {'slotted B':>10} {'saved':>7}")
+    for size in args.sizes:
+        legacy = bytes_per_child(build_legacy, size)
+        current = bytes_per_child(build_current, size)
+        print(f"{size:>10} {legacy:9.0f} {current:10.0f} {1 - current / legacy:6.0%}")
+
+
+if __name__ == "__main__":
+    main()
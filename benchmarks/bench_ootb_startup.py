@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark OOTB catalogue startup from JSON versus the binary snapshot
+
+Times load_ootb_records on the shipped catalogue and on synthetic catalogues
+made by repeating it --copies times, once compiling from JSON and once from
+a prebuilt snapshot. Full ScenarioStorage construction (loading plus
+indexing) is timed both ways on the shipped catalogue, after checking that
+an empty catalogue and a scenario with blank text fields can be indexed.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from models import ParentScenario
+from ootb_snapshot import OOTB_JSON_PATH, build_snapshot, load_ootb_records
+
+
+def time_call(fn, repeat):
+    """Median wall time of fn over repeat runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def synthetic_catalogue(raw_scenarios, copies):
+    """Repeat the catalogue with renamed parents"""
+    return [
+        dict(scenario, name=f"{scenario['name']} ({copy})")
+        for copy in range(copies)
+        for scenario in raw_scenarios
+    ]
+
+
+def check_empty_catalogue(directory):
+    """Fail unless storage boots from an empty catalogue and indexes a scenario without search text"""
+    from data import ScenarioStorage
+    json_path = os.path.join(directory, 'empty.json')
+    with open(json_path, 'w') as f:
+        json.dump([], f)
+    os.environ.update(OOTB_JSON_PATH=json_path, OOTB_SNAPSHOT_PATH='')
+    try:
+        storage = ScenarioStorage()
+    finally:
+        os.environ.pop('OOTB_JSON_PATH')
+        os.environ.pop('OOTB_SNAPSHOT_PATH')
+    assert not storage.get_all_scenarios()
+    blank = ParentScenario(id='blank', name='', description='', is_active=True, is_ootb=False,
+                           child_scenarios=[], tag=None)
+    storage.add_scenario(blank)
+    assert storage.get_scenario_by_id('blank') is blank
+    assert not storage.search_scenarios('abc')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--copies', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with open(OOTB_JSON_PATH) as f:
+        raw_scenarios = json.load(f)
+
+    print(f"{'parents':>8} {'json MB':>8} {'json ms':>9} {'snapshot ms':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        check_empty_catalogue(directory)
+        json_path = os.path.join(directory, 'ootb.json')
+        snapshot = os.path.join(directory, 'ootb.snapshot')
+        for copies in args.copies:
+            with open(json_path, 'w') as f:
+                json.dump(synthetic_catalogue(raw_scenarios, copies), f, indent=2)
+            build_snapshot(json_path, snapshot)
+
+            json_seconds = time_call(lambda: load_ootb_records(json_path, path=''), args.repeat)
+            snapshot_seconds = time_call(lambda: load_ootb_records(json_path, path=snapshot), args.repeat)
+            size_mb = os.path.getsize(json_path) / 1e6
+            print(f"{copies * len(raw_scenarios):>8} {size_mb:8.2f} {json_seconds * 1000:9.2f} "
+                  f"{snapshot_seconds * 1000:12.2f} {json_seconds / snapshot_seconds:7.1f}x")
+
+        # ScenarioStorage reads the snapshot location from the environment
+        from data import ScenarioStorage
+        snapshot = os.path.join(directory, 'storage.snapshot')
+        build_snapshot(OOTB_JSON_PATH, snapshot)
+        timings = {}
+        for label, path in (('json', ''), ('snapshot', snapshot)):
+            os.environ['OOTB_SNAPSHOT_PATH'] = path
+            timings[label] = time_call(ScenarioStorage, args.repeat)
+        print(f"ScenarioStorage() boot: json {timings['json'] * 1000:.2f} ms, "
+              f"snapshot {timings['snapshot'] * 1000:.2f} ms")
+        os.environ.pop('OOTB_SNAPSHOT_PATH')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark recommendation latency against catalogue size
+
+Builds a RecommendationEngine with synthetic scenarios at increasing sizes and
+times a typical recommendation request (limit 50). For comparison, the
+per-scenario Python loop that recommend_scenarios used before is timed on
+the same data up to --loop-max rows.
+
+Engine latency is bounded by the number of distinct domain/tag profiles
+(a few thousand for this synthetic mix) rather than by the catalogue size.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from recommender import RecommendationEngine
+
+DOMAINS = ['AE', 'CM', 'LB', 'VS', 'EX', 'MH', 'DM', 'DS', 'EG', 'PE', 'QS', 'SU']
+TAGS = ['Safety', 'Efficacy', 'Data Quality', 'Compliance', 'Protocol Deviation', 'Other']
+
+REQUEST = {
+    'selected_domains': ['AE', 'LB', 'VS'],
+    'selected_tags': ['Safety', 'Compliance'],
+    'study_type': 'phase2',
+    'therapeutic_area': 'oncology',
+    'critical_endpoints': False,
+    'regulatory_compliance': True,
+    'safety_monitoring': True,
+}
+
+
+def synthetic_rows(count, seed=0):
+    """Yield (domains, tag names, child count, is_active) for synthetic scenarios"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        domains = rng.sample(DOMAINS, rng.randint(1, 3))
+        tags = rng.sample(TAGS, rng.randint(1, 2))
+        yield domains, tags, rng.randint(1, 8), rng.random() < 0.9
+
+
+def loop_recommend(rows, request, limit):
+    """The pre-engine algorithm: score every row in Python, then sort everything"""
+    selected_domains = set(request['selected_domains'])
+    selected_tags = set(request['selected_tags'])
+    results = []
+    for index, (domains, tags, child_count, is_active) in enumerate(rows):
+        if not is_active:
+            continue
+        domains, tags = set(domains), set(tags)
+        score = len(domains & selected_domains) * 25 + len(tags & selected_tags) * 15
+        if 'Safety' in tags:
+            score += 20
+        if 'AE' in domains or 'Safety' in tags:
+            score += 15
+        if 'Compliance' in tags:
+            score += 10
+        if 'Safety' in tags or 'AE' in domains:
+            score += 10
+        if child_count >= 3:
+            score += 5
+        if score > 0:
+            results.append((index, min(100, score)))
+    results.sort(key=lambda result: result[1], reverse=True)
+    return results[:limit]
+
+
+def time_call(func, repeat):
+    """Median wall-clock seconds of func over repeat runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--loop-max', type=int, default=100_000,
+                        help='largest size to also time the Python loop on')
+    args = parser.parse_args()
+
+    print(f"{'scenarios':>10} {'build s':>9} {'engine ms':>10} {'loop ms':>10}")
+    for size in args.sizes:
+        rows = list(synthetic_rows(size))
+
+        start = time.perf_counter()
+        engine = RecommendationEngine()
+        for sequence, (domains, tags, child_count, is_active) in enumerate(rows):
+            engine.add(sequence, domains, tags, child_count, is_active, sequence)
+        build_seconds = time.perf_counter() - start
+
+        engine_seconds = time_call(lambda: engine.recommend(limit=args.limit, **REQUEST), args.repeat)
+        if size <= args.loop_max:
+            loop_seconds = time_call(lambda: loop_recommend(rows, REQUEST, args.limit),
+                                     max(1, args.repeat // 4))
+            loop_ms = f"{loop_seconds * 1000:10.2f}"
+        else:
+            loop_ms = f"{'-':>10}"
+
+        print(f"{size:>10} {build_seconds:9.2f} {engine_seconds * 1000:10.2f} {loop_ms}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark subject-sharded dry runs across worker counts
+
+Writes a synthetic study of --subjects subjects (AE and CM as Parquet),
+with compiled rule checks and per-subject cross-domain pseudo code checks
+(AE against CM dates, AE grade changes on consecutive days). Runs them
+through DryRunEngine with 1, 2, 4, ... workers up to --max-workers, one
+subject shard per worker, and prints the scaling curve. Every run must
+report the same findings as an unsharded single-worker run. Worker pools
+are started before timing; dataset loading is timed.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dry_run import DryRunEngine
+from models import ChildScenario
+
+VALUES = ('Y', 'N', 'DRUG WITHDRAWN', 'RECOVERED', 'NOT RECOVERED', 'DOSE REDUCED', '')
+RULES = {
+    'AE': ["When AEACN = 'DRUG WITHDRAWN' and AEOUT != 'RECOVERED'",
+           "When AESER = 'Y' and AEOUT IS MISSING",
+           "When AEENDTC < AESTDTC",
+           "When AETOXGR >= 3 and AESER != 'Y'"],
+    'CM': ["When CMENDTC < CMSTDTC",
+           "When CMONGO = 'Y' and CMENDTC IS NOT MISSING"],
+}
+AE_AGAINST_CM = '''PARTITION_BY = 'USUBJID'
+
+def validate_scenario(ae_df, cm_df):
+    """Treated AEs without a concomitant medication started by the AE end date"""
+    first_cm = cm_df.groupby('USUBJID')['CMSTDTC'].min()
+    started = ae_df['USUBJID'].map(first_cm)
+    return ae_df[(ae_df['AECONTRT'] == 'Y') & ~(started <= ae_df['AEENDTC'])]
+'''
+GRADE_CHANGE = '''PARTITION_BY = 'USUBJID'
+
+def validate_scenario(ae_df):
+    """AEs whose grade changed from the subject's AE of the previous day"""
+    ordered = ae_df.sort_values(['USUBJID', 'AESTDTC'])
+    previous = ordered.groupby('USUBJID')[['AESTDTC', 'AETOXGR']].shift()
+    next_day = pd.to_datetime(ordered['AESTDTC']) - pd.to_datetime(previous['AESTDTC']) == pd.Timedelta(days=1)
+    changed = next_day & (ordered['AETOXGR'] != previous['AETOXGR'])
+    return ae_df[changed.reindex(ae_df.index)]
+'''
+COMPARED = ('status', 'flagged_count', 'records', 'message')
+
+
+def dates(start, days):
+    return np.datetime_as_string(np.datetime64('2021-01-01') + start + days, unit='D')
+
+
+def write_study(directory, subjects, rng):
+    ae_rows, cm_rows = subjects * 12, subjects * 6
+    ae_subjects = np.repeat(np.arange(subjects), 12)
+    start = rng.integers(0, 700, ae_rows)
+    ae = pd.DataFrame({
+        'USUBJID': np.char.add('STUDY-', ae_subjects.astype(str)),
+        'AESEQ': np.tile(np.arange(12), subjects),
+        'AESTDTC': dates(start, 0),
+        'AEENDTC': dates(start, rng.integers(-5, 60, ae_rows)),
+        'AETOXGR': rng.integers(1, 6, ae_rows),
+        'AEACN': rng.choice(VALUES, ae_rows), 'AEOUT': rng.choice(VALUES, ae_rows),
+        'AESER': rng.choice(VALUES, ae_rows), 'AECONTRT': rng.choice(VALUES, ae_rows),
+    })
+    cm_start = rng.integers(0, 700, cm_rows)
+    cm = pd.DataFrame({
+        'USUBJID': np.char.add('STUDY-', np.repeat(np.arange(subjects), 6).astype(str)),
+        'CMSEQ': np.tile(np.arange(6), subjects),
+        'CMSTDTC': dates(cm_start, 0),
+        'CMENDTC': dates(cm_start, rng.integers(-5, 90, cm_rows)),
+        'CMONGO': rng.choice(VALUES, cm_rows),
+    })
+    ae.to_parquet(os.path.join(directory, 'ae.parquet'), index=False)
+    cm.to_parquet(os.path.join(directory, 'cm.parquet'), index=False)
+    return ae_rows + cm_rows
+
+
+def make_checks():
+    checks = [ChildScenario(id=f'{domain}-rule-{index}', scenario_text=text, required_cdash_items=[],
+                            domains=[domain], tag=None, reasoning_template='')
+              for domain, texts in RULES.items() for index, text in enumerate(texts)]
+    for name, code in (('ae-cm-dates', AE_AGAINST_CM), ('ae-grade-change', GRADE_CHANGE)):
+        checks.append(ChildScenario(id=name, scenario_text=name, required_cdash_items=[], domains=['AE', 'CM'],
+                                    tag=None, reasoning_template='', pseudo_code=code))
+    return checks
+
+
+def timed_run(engine, children):
+    pool = engine._get_pool()
+    # Start every worker and import the engine there before timing
+    pool.map(time.sleep, [0.2] * engine.workers, chunksize=1)
+    started = time.perf_counter()
+    details, scans = engine.run_checks(children)
+    return time.perf_counter() - started, details, scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=50_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    children = make_checks()
+    with tempfile.TemporaryDirectory() as directory:
+        rows = write_study(directory, args.subjects, np.random.default_rng(0))
+        print(f"{args.subjects} subjects, {rows} records, {len(children)} checks")
+
+        baseline_engine = DryRunEngine(directory, workers=1, shards=1, history_dir='', memory_mb=0, exec_code=True)
+        baseline_seconds, baseline, _ = timed_run(baseline_engine, children)
+        baseline_engine._discard_pool(baseline_engine._pool)
+        print(f"{'workers':>8} {'seconds':>8} {'records/s':>11} {'speedup':>8} {'efficiency':>11}")
+        print(f"{'1 whole':>8} {baseline_seconds:8.2f} {rows / baseline_seconds:11.0f} {1:7.2f}x {1:10.0%}")
+
+        workers = 1
+        while workers <= args.max_workers:
+            engine = DryRunEngine(directory, workers=workers, shards=max(workers, 2), history_dir='', memory_mb=0,
+                                  exec_code=True)
+            seconds, details, scans = timed_run(engine, children)
+            engine._discard_pool(engine._pool)
+            for expected, detail in zip(baseline, details):
+                for field in COMPARED:
+                    assert detail[field] == expected[field], (workers, detail['child_id'], field)
+            assert any(scan['shards'] > 1 for scan in scans)
+            speedup = baseline_seconds / seconds
+            print(f"{workers:>8} {seconds:8.2f} {rows / seconds:11.0f} {speedup:7.2f}x {speedup / workers:10.0%}")
+            workers *= 2
+        print("Sharded findings matched the unsharded run at every worker count")
+
+
+if __name__ == "__main__":
+    main()
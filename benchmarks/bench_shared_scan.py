@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark shared domain scans against loading a dataset per check
+
+Writes synthetic wide AE and LB datasets (--rows rows, --columns columns
+each) and --checks compiled rule checks split between them. Runs them in
+process two ways: each check reading its whole dataset, as dry runs did
+before planning, and the plan_scans/run_scan path, which reads each
+dataset once with only the columns its checks use. Worker frame caches are
+cleared before every run so both pay for their reads. First checks that at
+least MIN_OOTB_RULE_SHARE of the shipped catalogue's child scenarios state a
+compilable rule, since only those run without DRY_RUN_EXEC_CODE.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import dry_run
+from dry_run import plan_scans, run_scan
+from models import ChildScenario
+from ootb_snapshot import OOTB_JSON_PATH, load_ootb_records
+from study_data import dataset_cache, find_dataset, read_dataset
+
+# Fewest of the shipped catalogue's child scenarios that must compile to a rule
+MIN_OOTB_RULE_SHARE = 0.15
+
+CODES = {'AE': ('AEACN', 'AEOUT', 'AESER', 'AESEV'), 'LB': ('LBNRIND', 'LBSTAT', 'LBBLFL', 'LBFAST')}
+VALUES = ('Y', 'N', 'DRUG WITHDRAWN', 'RECOVERED', 'NOT RECOVERED', 'HIGH', 'LOW')
+
+
+def write_dataset(directory, domain, rows, columns, rng):
+    data = {'USUBJID': rng.integers(0, rows // 20 + 1, rows).astype(str)}
+    for code in CODES[domain]:
+        data[code] = rng.choice(VALUES, rows)
+    for index in range(columns - len(data)):
+        data[f'{domain}X{index:03d}'] = rng.choice(VALUES, rows)
+    pd.DataFrame(data).to_csv(os.path.join(directory, f'{domain.lower()}.csv'), index=False)
+
+
+def make_checks(count, seed=0):
+    rng = random.Random(seed)
+    checks = []
+    for index in range(count):
+        domain = 'AE' if index % 2 == 0 else 'LB'
+        first, second = rng.sample(CODES[domain], 2)
+        text = f"When {first} = '{rng.choice(VALUES)}' and {second} != '{rng.choice(VALUES)}'"
+        checks.append(ChildScenario(id=f'check-{index}', scenario_text=text, required_cdash_items=[first, second],
+                                    domains=[domain], tag=None, reasoning_template=''))
+    return checks
+
+
+def check_ootb_rules():
+    """Fail unless enough of the shipped catalogue's child scenarios compile to a rule"""
+    records, _ = load_ootb_records(OOTB_JSON_PATH, path='')
+    children = [ChildScenario(id=child[0], scenario_text=child[1], required_cdash_items=list(child[2]),
+                              domains=list(child[3]), tag=None, reasoning_template=child[5], pseudo_code=child[6])
+                for parent in records for child in parent[4]]
+    compiled = sum(dry_run.rule_for_child(child) is not None for child in children)
+    print(f"{compiled} of {len(children)} catalogue child scenarios compile to a rule")
+    assert compiled >= MIN_OOTB_RULE_SHARE * len(children), f"only {compiled} of {len(children)} compile"
+
+
+def per_check(children, data_dir):
+    """The unplanned path: every check reads its whole dataset"""
+    flagged = 0
+    for child in children:
+        rule = dry_run.rule_for_child(child)
+        frame = read_dataset(find_dataset(data_dir, rule.domain))
+        flagged += int(rule.evaluate(frame).sum())
+    return flagged
+
+
+def planned(children, data_dir):
+    flagged = 0
+    for domains, columns, checks in plan_scans(children):
+        _, reports = run_scan((domains, columns, checks, data_dir, 600, 0, None, None, None, True))
+        flagged += sum(report['flagged_count'] for _, report in reports)
+    return flagged
+
+
+def timed(fn, *args):
+    dataset_cache.clear()
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--columns', type=int, default=80)
+    parser.add_argument('--checks', type=int, nargs='+', default=[2, 8, 32])
+    args = parser.parse_args()
+
+    check_ootb_rules()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for domain in CODES:
+            write_dataset(directory, domain, args.rows, args.columns, rng)
+
+        print(f"{'checks':>7} {'per check s':>12} {'shared scan s':>14} {'speedup':>8}")
+        for count in args.checks:
+            children = make_checks(count)
+            unplanned_seconds, unplanned_flagged = timed(per_check, children, directory)
+            planned_seconds, planned_flagged = timed(planned, children, directory)
+            assert unplanned_flagged == planned_flagged
+            print(f"{count:>7} {unplanned_seconds:12.2f} {planned_seconds:14.2f} "
+                  f"{unplanned_seconds / planned_seconds:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Generate deterministic synthetic scenario catalogues shaped like the OOTB catalogue
+
+Scales processed_ootb_scenarios.json to any number of parent scenarios. Each
+synthetic parent derives from a shipped parent and takes:
+- name and description words from the catalogue's vocabulary
+- a tag, usually its template's
+- a child count drawn from the shipped distribution
+- children copied from shipped children
+
+Some children move to another SDTM domain, with their CDASH items
+re-prefixed, so that domain facets spread as in a grown catalogue. Parent i
+depends only on the seed and i, so a smaller catalogue is a prefix of a
+larger one.
+
+Usage: python -m benchmarks.catalogue --parents 100000 --output catalogue.json
+"""
+import argparse
+import json
+import random
+import re
+
+from ootb_snapshot import OOTB_JSON_PATH
+
+# Domains synthetic children are spread over
+DOMAINS = ('AE', 'CM', 'LB', 'VS', 'EX', 'MH', 'DM', 'DS', 'EG', 'PE', 'QS', 'SU')
+
+# Share of children moved to another domain and of parents given another tag
+MOVED_CHILD_SHARE = 0.3
+RETAGGED_PARENT_SHARE = 0.2
+
+
+class CatalogueGenerator:
+    """Synthetic parents in the raw OOTB JSON shape, derived from a source catalogue"""
+
+    def __init__(self, seed=0, source=OOTB_JSON_PATH):
+        with open(source) as f:
+            self.templates = json.load(f)
+        self.seed = seed
+        self.children = [child for parent in self.templates for child in parent['children']]
+        self.child_counts = [len(parent['children']) for parent in self.templates]
+        self.tags = sorted({parent['tag'] for parent in self.templates})
+        text = ' '.join(f"{parent['name']} {parent['description']}" for parent in self.templates)
+        text += ' ' + ' '.join(child['scenario_text'] for child in self.children)
+        self.vocabulary = sorted(set(re.findall(r'[a-z]{4,}', text.lower())))
+
+    def parent(self, number):
+        """The raw scenario dict of synthetic parent number"""
+        rng = random.Random(f'{self.seed}:{number}')
+        template = rng.choice(self.templates)
+        words = rng.sample(self.vocabulary, 3)
+        tag = rng.choice(self.tags) if rng.random() < RETAGGED_PARENT_SHARE else template['tag']
+        return {
+            'name': f"{template['name']} {words[0]} {number}",
+            'description': f"{template['description']} ({words[1]} {words[2]})",
+            'tag': tag,
+            'children': [self._child(rng) for _ in range(rng.choice(self.child_counts))],
+        }
+
+    def _child(self, rng):
+        template = rng.choice(self.children)
+        child = dict(template)
+        if template['domains'] and rng.random() < MOVED_CHILD_SHARE:
+            old, new = template['domains'][0], rng.choice(DOMAINS)
+            child['domains'] = [new] + [domain for domain in template['domains'][1:] if domain != new]
+            child['required_cdash_items'] = [new + item[len(old):] if item.startswith(old) else item
+                                             for item in template['required_cdash_items']]
+        return child
+
+    def __iter__(self):
+        number = 0
+        while True:
+            yield self.parent(number)
+            number += 1
+
+
+def iter_catalogue(parents, seed=0):
+    """Yield the raw scenario dicts of a synthetic catalogue of parents parents"""
+    generator = CatalogueGenerator(seed)
+    for number in range(parents):
+        yield generator.parent(number)
+
+
+def write_catalogue(path, parents, seed=0):
+    """Write a synthetic catalogue as OOTB JSON one parent at a time; returns (parents, children)"""
+    children = 0
+    with open(path, 'w') as f:
+        f.write('[')
+        for number, parent in enumerate(iter_catalogue(parents, seed)):
+            f.write(',\n' if number else '\n')
+            json.dump(parent, f)
+            children += len(parent['children'])
+        f.write('\n]\n')
+    return parents, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--parents', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='synthetic_catalogue.json')
+    args = parser.parse_args()
+
+    parents, children = write_catalogue(args.output, args.parents, args.seed)
+    print(f"Wrote {args.output}: {parents} parent scenarios, {children} child scenarios")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite over synthetic catalogues, with a compare mode for regressions
+
+The run command generates a synthetic catalogue (benchmarks.catalogue) for
+each --parents size and times, against it:
+- ScenarioStorage construction from JSON and from the binary snapshot
+- search_scenarios for every combination of query, tag, domain and
+  active-only filters
+- the index page render, unfiltered and filtered
+- recommend_scenarios, suggest-ootb-scenarios and get-ootb-scenarios
+- every export format
+
+Every tenth parent is inactive while the routes are timed, so the active
+filters have work to do. Each timing repeats until --min-time has passed and
+at least MIN_RUNS runs were made, up to --max-runs. Results are written as
+JSON with the environment they were taken in.
+
+The compare command reads two result files and flags every timing that got
+slower than --threshold in both its median and its fastest run. It exits
+with status 1 when it finds a regression, so it can gate a CI job.
+
+Usage:
+    python -m benchmarks.suite run --parents 1000 10000 --output baseline.json
+    python -m benchmarks.suite compare baseline.json current.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.catalogue import write_catalogue
+
+RESULTS_FORMAT = 1
+
+# Fewest runs behind a timing, however long a run takes
+MIN_RUNS = 3
+
+# Queries of the search timings: none, one served from exact n-gram
+# postings, and one longer than the n-grams that is re-checked per candidate
+QUERIES = {'none': '', 'short': 'lab', 'long': 'outcome'}
+TAG = 'Safety'
+DOMAIN = 'AE'
+
+RECOMMEND_FORM = {
+    'recommend_domains': ['AE', 'LB'],
+    'recommend_tags': ['Safety'],
+    'study_type': 'phase3',
+    'therapeutic_area': 'oncology',
+    'safety_monitoring': 'on',
+}
+
+
+def measure(fn, min_time, max_runs):
+    """Timings of fn in ms, repeated until min_time seconds have passed and MIN_RUNS were made"""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_runs and (len(timings) < MIN_RUNS or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def request(client, method, url, **kwargs):
+    """Make a request and consume its body, so streamed responses are timed whole"""
+    response = client.open(url, method=method, **kwargs)
+    response.get_data()
+    if response.status_code != 200:
+        raise RuntimeError(f"{method} {url} returned {response.status_code}")
+
+
+def scenarios(storage, snapshot):
+    """(name, function) of every timed scenario on a catalogue"""
+    from data import ScenarioStorage
+    from exporter import EXPORT_FORMATS, parquet_available
+    from routes import app
+
+    def storage_from(path):
+        def create():
+            os.environ['OOTB_SNAPSHOT_PATH'] = path
+            ScenarioStorage()
+        return create
+
+    yield 'storage_init json', storage_from('')
+    yield 'storage_init snapshot', storage_from(snapshot)
+
+    for (label, query), tag, domain, active_only in itertools.product(
+            QUERIES.items(), (None, TAG), (None, DOMAIN), (False, True)):
+        name = f"search query={label} tag={tag or '-'} domain={domain or '-'} active_only={active_only}"
+        yield name, lambda query=query, tag=tag, domain=domain, active_only=active_only: storage.search_scenarios(
+            query, tag_filter=tag, domain_filter=domain, active_only=active_only)
+
+    client = app.test_client()
+    ids = [scenario.id for scenario in itertools.islice(storage.get_all_scenarios(), 20)]
+    yield 'index', lambda: request(client, 'GET', '/')
+    yield 'index filtered', lambda: request(
+        client, 'GET', '/', query_string={'search': QUERIES['long'], 'tag': TAG, 'domain': DOMAIN, 'active_only': 'true'})
+    yield 'recommend_scenarios', lambda: request(client, 'POST', '/recommend_scenarios', data=RECOMMEND_FORM)
+    yield 'suggest_ootb_scenarios', lambda: request(
+        client, 'POST', '/api/suggest-ootb-scenarios', json={'domains': ['AE', 'LB']})
+    yield 'get_ootb_scenarios', lambda: request(client, 'POST', '/api/get-ootb-scenarios', json={'scenario_ids': ids})
+    for export_format in EXPORT_FORMATS:
+        if export_format == 'parquet' and not parquet_available():
+            continue
+        yield f'export {export_format}', lambda export_format=export_format: request(
+            client, 'GET', '/export_scenarios', query_string={'format': export_format})
+
+
+def run_catalogue(parents, args, directory):
+    """Timing results of every scenario on a synthetic catalogue of parents parents"""
+    from data import ScenarioStorage
+    from ootb_snapshot import build_snapshot
+    import routes
+
+    json_path = os.path.join(directory, f'catalogue-{parents}.json')
+    snapshot = os.path.join(directory, f'catalogue-{parents}.snapshot')
+    _, children = write_catalogue(json_path, parents, args.seed)
+    build_snapshot(json_path, snapshot)
+    os.environ['OOTB_JSON_PATH'] = json_path
+    os.environ['OOTB_SNAPSHOT_PATH'] = snapshot
+
+    storage = ScenarioStorage()
+    for scenario in list(storage.get_all_scenarios())[::10]:
+        storage.toggle_scenario_status(scenario.id)
+    # The routes read the module-level storage
+    routes.storage = storage
+
+    results = []
+    for name, fn in scenarios(storage, snapshot):
+        if args.only and not any(part in name for part in args.only):
+            continue
+        timings = measure(fn, args.min_time, args.max_runs)
+        result = {'name': name, 'parents': parents, 'children': children, 'runs': len(timings),
+                  'median_ms': statistics.median(timings), 'min_ms': min(timings), 'max_ms': max(timings)}
+        print(f"{parents:>8} {name:<58} {result['median_ms']:10.2f} {result['min_ms']:10.2f} {len(timings):>5}")
+        results.append(result)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'git_commit': commit}
+
+
+def run(args):
+    saved = {name: os.environ.get(name) for name in ('OOTB_JSON_PATH', 'OOTB_SNAPSHOT_PATH')}
+    results = []
+    print(f"{'parents':>8} {'scenario':<58} {'median ms':>10} {'min ms':>10} {'runs':>5}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for parents in args.parents:
+                results.extend(run_catalogue(parents, args, directory))
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    report = {
+        'format': RESULTS_FORMAT,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': {'parents': args.parents, 'seed': args.seed, 'min_time': args.min_time,
+                     'max_runs': args.max_runs, 'only': args.only},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}: {len(results)} timings")
+
+
+def load_results(path):
+    with open(path) as f:
+        report = json.load(f)
+    if report.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"{path} is not a results file of format {RESULTS_FORMAT}")
+    return {(result['name'], result['parents']): result for result in report['results']}
+
+
+def compare(args):
+    """Print the change of every timing between two result files; returns the number of regressions"""
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    regressions = 0
+    print(f"{'parents':>8} {'scenario':<58} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for key in sorted(baseline.keys() & current.keys(), key=lambda key: (key[1], key[0])):
+        before, after = baseline[key], current[key]
+        change = after['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        regressed = (after['median_ms'] > before['median_ms'] * (1 + args.threshold)
+                     and after['min_ms'] > before['min_ms'] * (1 + args.threshold)
+                     and after['median_ms'] - before['median_ms'] > args.min_delta_ms)
+        regressions += regressed
+        print(f"{key[1]:>8} {key[0]:<58} {before['median_ms']:12.2f} {after['median_ms']:11.2f} "
+              f"{change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    for label, keys in (('only in baseline', baseline.keys() - current.keys()),
+                        ('only in current', current.keys() - baseline.keys())):
+        for name, parents in sorted(keys, key=lambda key: (key[1], key[0])):
+            print(f"{parents:>8} {name:<58} {label}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='time every scenario and write a results file')
+    run_parser.add_argument('--parents', type=int, nargs='+', default=[1000, 10000])
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--min-time', type=float, default=1.0, help='seconds each timing repeats for')
+    run_parser.add_argument('--max-runs', type=int, default=50)
+    run_parser.add_argument('--only', nargs='+', help='time only scenarios whose name contains one of these')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+
+    compare_parser = commands.add_parser('compare', help='flag regressions between two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown flagged')
+    compare_parser.add_argument('--min-delta-ms', type=float, default=0.05,
+                                help='slowdowns smaller than this are never flagged')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    elif compare(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
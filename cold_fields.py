@@ -0,0 +1,78 @@
+import mmap
+import os
+
+# Large text fields of ChildScenario that list, facet and recommendation views
+# never read; they can stay in a memory-mapped file until accessed
+COLD_FIELDS = ('reasoning_template', 'pseudo_code')
+
+
+def map_cold_fields_enabled():
+    """Whether OOTB_COLD_FIELDS=mmap asks for cold fields to stay memory-mapped"""
+    return os.environ.get('OOTB_COLD_FIELDS', 'memory').lower() == 'mmap'
+
+
+class StringHeap:
+    """Read-only memory map of a file holding UTF-8 strings addressed by (offset, length)
+
+    Every worker mapping the same file shares one copy in the OS page cache
+    instead of holding a private copy of the strings.
+    """
+
+    def __init__(self, f):
+        # mmap duplicates the descriptor, so f may be closed afterwards
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, offset, length):
+        """Decode the string stored at offset"""
+        return str(self._map[offset:offset + length], 'utf-8')
+
+
+class ColdRef:
+    """Location of a cold field value inside a StringHeap"""
+
+    __slots__ = ('heap', 'offset', 'length')
+
+    def __init__(self, heap, offset, length):
+        self.heap = heap
+        self.offset = offset
+        self.length = length
+
+    def resolve(self):
+        return self.heap.read(self.offset, self.length)
+
+
+class ColdField:
+    """Data descriptor that decodes a ColdRef value each time it is read
+
+    Wraps the slot of a slotted dataclass field. Plain strings assigned to
+    the field (custom or edited scenarios) are kept as they are.
+    """
+
+    def __init__(self, slot):
+        self._slot = slot
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self._slot.__get__(instance, owner)
+        if type(value) is ColdRef:
+            return value.resolve()
+        return value
+
+    def __set__(self, instance, value):
+        self._slot.__set__(instance, value)
+
+    def get_raw(self, instance):
+        """Stored value without decoding (a ColdRef or a str)"""
+        return self._slot.__get__(instance, type(instance))
+
+
+def install_cold_fields(cls, names=COLD_FIELDS):
+    """Wrap the slots of cls's cold fields in ColdField descriptors
+
+    Must run after the dataclass(slots=True) decorator, which replaces the
+    class and turns each field into a slot member descriptor.
+    """
+    for name in names:
+        setattr(cls, name, ColdField(cls.__dict__[name]))
+    return cls
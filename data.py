@@ -1,137 +1,246 @@
-from models import ParentScenario, ChildScenario, Tag
+from indexes import TextIndex, FacetIndex
+from recommender import RecommendationEngine
+from ootb_snapshot import load_ootb_scenarios
+from metrics import instrument_storage
 from datetime import datetime
-import uuid
-import json
+import heapq
+import os
+import time
+
+# Scenarios per page of the scenario table and of /api/scenarios
+SCENARIO_PAGE_SIZE = 50
+MAX_SCENARIO_PAGE_SIZE = 500
+
+# Sort keys of scenario pages; ties keep listing order, and listing order is the storage's own
+SCENARIO_SORT_KEYS = {
+    'listing': None,
+    'name': lambda scenario: scenario.name.casefold(),
+    'children': lambda scenario: len(scenario.child_scenarios),
+    'updated': lambda scenario: scenario.updated_at,
+}
+
+def parse_scenario_sort(sort):
+    """(sort key name, descending) of a sort option such as 'name' or '-updated'; ValueError when unknown"""
+    sort = sort or 'listing'
+    descending = sort.startswith('-')
+    key = sort.lstrip('-')
+    if key not in SCENARIO_SORT_KEYS:
+        raise ValueError(f"Unknown sort: {sort}")
+    return key, descending
+
+def sort_page(scenarios, sort='listing', descending=False, offset=0, limit=SCENARIO_PAGE_SIZE):
+    """One page of scenarios (in listing order) sorted by a SCENARIO_SORT_KEYS key"""
+    end = offset + limit
+    key = SCENARIO_SORT_KEYS[sort]
+    if key is None:
+        return (scenarios[::-1] if descending else scenarios)[offset:end]
+    if end < len(scenarios) // 8:
+        # Early pages of a long listing only need the first rows in order
+        select = heapq.nlargest if descending else heapq.nsmallest
+        return select(end, scenarios, key=key)[offset:]
+    return sorted(scenarios, key=key, reverse=descending)[offset:end]
 
 class ScenarioStorage:
     """In-memory storage for scenarios"""
     
     def __init__(self):
-        self.scenarios = []
+        self._scenarios = {}  # id -> parent, in insertion order
+        self._sequence = {}  # id -> insertion number, for ordering index hits
+        self._next_sequence = 0
+        self._child_locations = {}  # child id -> (parent, position)
+        self._child_ids_by_parent = {}
+        self._text_index = TextIndex()
+        self._facet_index = FacetIndex()
+        self._recommender = RecommendationEngine()
+        # Starts at the creation time so versions stay unique across restarts
+        self._revision = time.time_ns()
         self._initialize_ootb_scenarios()
     
     def _initialize_ootb_scenarios(self):
-        """Initialize Out of the Box scenarios from Excel data"""
-        available_tags = Tag.get_available_tags()
-        tag_map = {tag.name: tag for tag in available_tags}
-        
-        # Load authentic scenarios from processed Excel data
-        try:
-            with open('processed_ootb_scenarios.json', 'r') as f:
-                raw_scenarios = json.load(f)
-        except FileNotFoundError:
-            print("Error: Excel scenario data not found")
-            raw_scenarios = []
-        
-        # Convert raw data to proper format
-        ootb_scenarios = []
-        for scenario_data in raw_scenarios:
-            # Parse tag from string representation
-            tag_str = scenario_data.get("tag", "")
-            if "Safety" in tag_str:
-                tag = tag_map["Safety"]
-            elif "Compliance" in tag_str:
-                tag = tag_map["Compliance"]
-            elif "Data Quality" in tag_str:
-                tag = tag_map["Data Quality"]
-            elif "Efficacy" in tag_str:
-                tag = tag_map["Efficacy"]
-            elif "Protocol Deviation" in tag_str:
-                tag = tag_map["Protocol Deviation"]
-            else:
-                tag = tag_map["Other"]
-            
-            # Process children
-            children = []
-            for child_data in scenario_data.get("children", []):
-                # Parse child tag
-                child_tag_str = child_data.get("tag", "")
-                if "Safety" in child_tag_str:
-                    child_tag = tag_map["Safety"]
-                elif "Compliance" in child_tag_str:
-                    child_tag = tag_map["Compliance"]
-                elif "Data Quality" in child_tag_str:
-                    child_tag = tag_map["Data Quality"]
-                elif "Efficacy" in child_tag_str:
-                    child_tag = tag_map["Efficacy"]
-                elif "Protocol Deviation" in child_tag_str:
-                    child_tag = tag_map["Protocol Deviation"]
-                else:
-                    child_tag = tag_map["Other"]
-                
-                children.append({
-                    "scenario_text": child_data.get("scenario_text", ""),
-                    "required_cdash_items": child_data.get("required_cdash_items", []),
-                    "domains": child_data.get("domains", []),
-                    "tag": child_tag,
-                    "reasoning_template": child_data.get("reasoning_template", ""),
-                    "pseudo_code": child_data.get("pseudo_code", "")
-                })
-            
-            ootb_scenarios.append({
-                "name": scenario_data.get("name", ""),
-                "description": scenario_data.get("description", ""),
-                "tag": tag,
-                "children": children
-            })
-        
-        # Convert to ParentScenario objects
-        for scenario_data in ootb_scenarios:
-            child_scenarios = []
-            for child_data in scenario_data["children"]:
-                child = ChildScenario(
-                    id=str(uuid.uuid4()),
-                    scenario_text=child_data["scenario_text"],
-                    required_cdash_items=child_data["required_cdash_items"],
-                    domains=child_data["domains"],
-                    tag=child_data["tag"],
-                    reasoning_template=child_data["reasoning_template"],
-                    pseudo_code=child_data.get("pseudo_code", "")
-                )
-                child_scenarios.append(child)
-            
-            parent = ParentScenario(
-                id=str(uuid.uuid4()),
-                name=scenario_data["name"],
-                description=scenario_data["description"],
-                is_active=True,
-                is_ootb=True,
-                child_scenarios=child_scenarios,
-                tag=scenario_data["tag"]
-            )
-            self.scenarios.append(parent)
+        """Initialize Out of the Box scenarios from the compiled OOTB snapshot (or its JSON source)"""
+        with self._text_index.batch():
+            for parent in load_ootb_scenarios():
+                self.add_scenario(parent)
+    
+    def _index_scenario(self, scenario):
+        """Bring every index in step with a new or changed scenario"""
+        self._text_index.add(scenario)
+        self._facet_index.add(scenario)
+        self._recommender.add(
+            scenario.id,
+            self._facet_index.domains_of(scenario.id),
+            self._facet_index.tags_of(scenario.id),
+            len(scenario.child_scenarios),
+            scenario.is_active,
+            self._sequence[scenario.id]
+        )
+        self._index_children(scenario)
+    
+    def _unindex_scenario(self, scenario_id):
+        """Remove a scenario from every index"""
+        self._text_index.remove(scenario_id)
+        self._facet_index.remove(scenario_id)
+        self._recommender.remove(scenario_id)
+        self._unindex_children(scenario_id)
+    
+    def _index_children(self, parent):
+        """Record the (parent, position) of each child of a parent"""
+        self._unindex_children(parent.id)
+        child_ids = []
+        for position, child in enumerate(parent.child_scenarios):
+            self._child_locations[child.id] = (parent, position)
+            child_ids.append(child.id)
+        self._child_ids_by_parent[parent.id] = child_ids
+    
+    def _unindex_children(self, parent_id):
+        """Forget the child locations recorded for a parent"""
+        for child_id in self._child_ids_by_parent.pop(parent_id, ()):
+            self._child_locations.pop(child_id, None)
     
     def get_all_scenarios(self):
         """Get all scenarios"""
-        return self.scenarios
+        return list(self._scenarios.values())
     
     def get_scenario_by_id(self, scenario_id):
         """Get scenario by ID"""
-        for scenario in self.scenarios:
-            if scenario.id == scenario_id:
-                return scenario
-        return None
+        return self._scenarios.get(scenario_id)
+    
+    def get_version(self):
+        """Monotonic version of the stored scenarios, bumped by every mutation"""
+        return self._revision
+    
+    def get_created_scenarios(self):
+        """Get the scenarios that are not out of the box, in listing order"""
+        return [scenario for scenario in self._scenarios.values() if not scenario.is_ootb]
+    
+    def get_many(self, scenario_ids):
+        """Get the scenarios for a list of IDs, in request order, skipping unknown IDs"""
+        scenarios = []
+        for scenario_id in scenario_ids:
+            scenario = self._scenarios.get(scenario_id)
+            if scenario:
+                scenarios.append(scenario)
+        return scenarios
+    
+    def locate_child(self, child_id):
+        """Get (parent, position) for a child scenario ID, or None"""
+        return self._child_locations.get(child_id)
+    
+    def get_all_domains(self):
+        """Get the sorted domains used by any child scenario"""
+        return sorted(self._facet_index.domain_counts())
+    
+    def get_all_tags(self):
+        """Get the sorted tag names used by any parent or child scenario"""
+        return sorted(self._facet_index.tag_counts())
+    
+    def get_facet_counts(self):
+        """Get the number of scenarios per domain, tag and CDASH item"""
+        return {
+            'domains': self._facet_index.domain_counts(),
+            'tags': self._facet_index.tag_counts(),
+            'cdash_items': self._facet_index.cdash_item_counts()
+        }
+    
+    def get_scenario_domains(self, scenario_id):
+        """Get the distinct child domains of a scenario, in first-seen order"""
+        return self._facet_index.domains_of(scenario_id)
+    
+    def get_scenario_tag_names(self, scenario_id):
+        """Get the distinct parent and child tag names of a scenario"""
+        return self._facet_index.tags_of(scenario_id)
+    
+    def get_scenarios_by_domains(self, domains):
+        """Get scenarios with a child in any of the domains, in listing order"""
+        scenario_ids = set()
+        for domain in domains:
+            scenario_ids |= self._facet_index.parents_with_domain(domain)
+        return self._in_listing_order(scenario_ids)
+    
+    def get_child_ids_for_cdash_item(self, item):
+        """Get the IDs of child scenarios that require a CDASH item"""
+        return set(self._facet_index.children_with_cdash_item(item))
+    
+    def _in_listing_order(self, scenario_ids):
+        """Resolve scenario IDs to scenarios, ordered as in get_all_scenarios"""
+        return [self._scenarios[scenario_id]
+                for scenario_id in sorted(scenario_ids, key=self._sequence.__getitem__)]
     
     def add_scenario(self, scenario):
         """Add new scenario"""
-        self.scenarios.append(scenario)
+        if scenario.id in self._scenarios:
+            self._unindex_scenario(scenario.id)
+        else:
+            self._sequence[scenario.id] = self._next_sequence
+            self._next_sequence += 1
+        self._scenarios[scenario.id] = scenario
+        self._index_scenario(scenario)
+        self._revision += 1
     
     def update_scenario(self, scenario_id, updated_scenario):
         """Update existing scenario"""
-        for i, scenario in enumerate(self.scenarios):
-            if scenario.id == scenario_id:
-                updated_scenario.updated_at = datetime.now()
-                self.scenarios[i] = updated_scenario
-                return True
-        return False
+        if scenario_id not in self._scenarios:
+            return False
+        
+        updated_scenario.updated_at = datetime.now()
+        self._replace_scenario(scenario_id, updated_scenario)
+        self._revision += 1
+        return True
+    
+    def _replace_scenario(self, scenario_id, scenario):
+        """Put scenario in the place of an existing one, which may have another ID"""
+        self._unindex_scenario(scenario_id)
+        if scenario.id == scenario_id:
+            self._scenarios[scenario_id] = scenario
+        else:
+            # The replacement carries a new ID: keep its place in the listing
+            self._scenarios = {
+                (scenario.id if key == scenario_id else key):
+                    (scenario if key == scenario_id else existing)
+                for key, existing in self._scenarios.items()
+            }
+            self._sequence[scenario.id] = self._sequence.pop(scenario_id)
+        self._index_scenario(scenario)
     
     def delete_scenario(self, scenario_id):
         """Delete scenario (only if not OOTB)"""
-        for i, scenario in enumerate(self.scenarios):
-            if scenario.id == scenario_id and not scenario.is_ootb:
-                del self.scenarios[i]
-                return True
-        return False
+        scenario = self._scenarios.get(scenario_id)
+        if not scenario or scenario.is_ootb:
+            return False
+        
+        self._remove_scenario(scenario_id)
+        self._revision += 1
+        return True
+    
+    def _remove_scenario(self, scenario_id):
+        """Drop a scenario and its index entries"""
+        del self._scenarios[scenario_id]
+        del self._sequence[scenario_id]
+        self._unindex_scenario(scenario_id)
+    
+    def add_child_scenarios(self, parent_id, child_scenarios):
+        """Append child scenarios to a parent scenario"""
+        parent = self._scenarios.get(parent_id)
+        if not parent:
+            return False
+        parent.child_scenarios.extend(child_scenarios)
+        parent.updated_at = datetime.now()
+        self._index_scenario(parent)
+        self._revision += 1
+        return True
+    
+    def delete_child_scenario(self, parent_id, child_id):
+        """Remove a child scenario from its parent"""
+        location = self._child_locations.get(child_id)
+        if not location or location[0].id != parent_id:
+            return False
+        
+        parent, position = location
+        del parent.child_scenarios[position]
+        parent.updated_at = datetime.now()
+        self._index_scenario(parent)
+        self._revision += 1
+        return True
     
     def toggle_scenario_status(self, scenario_id):
         """Toggle scenario active/inactive status"""
@@ -139,47 +248,82 @@ class ScenarioStorage:
         if scenario:
             scenario.is_active = not scenario.is_active
             scenario.updated_at = datetime.now()
+            self._recommender.set_active(scenario_id, scenario.is_active)
+            self._revision += 1
             return True
         return False
     
+    def recommend_scenarios(self, selected_domains, selected_tags, limit=None, **focus):
+        """Score active scenarios for the recommendation tab
+        
+        Returns the total number of matches and the top `limit` recommendations
+        as dicts with the scenario, its score and the reasons behind it.
+        """
+        total, results = self._recommender.recommend(selected_domains, selected_tags,
+                                                     limit=limit, **focus)
+        recommendations = [
+            {'scenario': self._scenarios[scenario_id], 'score': score, 'reasons': reasons}
+            for scenario_id, score, reasons in results
+        ]
+        return total, recommendations
+    
     def search_scenarios(self, query, tag_filter=None, domain_filter=None, active_only=False):
         """Search scenarios with filters"""
-        results = []
+        # Narrow candidates through the posting lists, rarest first
+        postings = []
+        if tag_filter:
+            postings.append(self._facet_index.parents_with_tag(tag_filter))
+        if domain_filter:
+            postings.append(self._facet_index.parents_with_domain(domain_filter))
         
-        for scenario in self.scenarios:
+        exact = True
+        if query:
+            text_matches, exact = self._text_index.lookup(query)
+            postings.append(text_matches)
+        
+        if postings:
+            postings.sort(key=len)
+            candidate_ids = set(postings[0])
+            for posting in postings[1:]:
+                candidate_ids &= posting
+            candidates = self._in_listing_order(candidate_ids)
+        else:
+            candidates = self._scenarios.values()
+        
+        results = []
+        for scenario in candidates:
             # Apply active filter
             if active_only and not scenario.is_active:
                 continue
             
-            # Apply search query
-            if query and not scenario.matches_search(query):
+            # Only inexact text candidates (queries longer than the indexed
+            # n-grams) need to be re-checked against the scenario itself
+            if not exact and not scenario.matches_search(query):
                 continue
             
-            # Apply tag filter
-            if tag_filter:
-                scenario_has_tag = False
-                # Check parent tag
-                if scenario.tag and scenario.tag.name == tag_filter:
-                    scenario_has_tag = True
-                # Check child tags
-                for child in scenario.child_scenarios:
-                    if child.tag and child.tag.name == tag_filter:
-                        scenario_has_tag = True
-                        break
-                if not scenario_has_tag:
-                    continue
-            
-            # Apply domain filter
-            if domain_filter:
-                scenario_domains = []
-                for child in scenario.child_scenarios:
-                    scenario_domains.extend(child.domains)
-                if domain_filter not in scenario_domains:
-                    continue
-            
             results.append(scenario)
         
         return results
+    
+    def search_scenarios_page(self, query, tag_filter=None, domain_filter=None, active_only=False,
+                              sort='listing', descending=False, offset=0, limit=SCENARIO_PAGE_SIZE):
+        """Get (total, page) of search results, the page sorted by a SCENARIO_SORT_KEYS key"""
+        results = self.search_scenarios(query, tag_filter, domain_filter, active_only)
+        return len(results), sort_page(results, sort, descending, offset, limit)
+
+def create_storage():
+    """Create the storage backend selected by QAD_STORAGE (memory, shared or sql)
+
+    DATABASE_URL alone selects sql; the default is memory.
+    """
+    backend = os.environ.get('QAD_STORAGE') or ('sql' if os.environ.get('DATABASE_URL') else 'memory')
+    if backend == 'sql':
+        from sql_storage import SQLScenarioStorage
+        return SQLScenarioStorage(os.environ.get('DATABASE_URL') or 'sqlite:///qad_scenarios.sqlite3')
+    if backend == 'shared':
+        from shared_storage import SharedScenarioStorage, DEFAULT_SHARED_STORE_PATH
+        return SharedScenarioStorage(os.environ.get('QAD_SHARED_STORE_PATH') or DEFAULT_SHARED_STORE_PATH)
+    return ScenarioStorage()
 
-# Global storage instance
-storage = ScenarioStorage()
+# Global storage instance, its calls timed for /metrics
+storage = instrument_storage(create_storage())
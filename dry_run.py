@@ -0,0 +1,753 @@
+import builtins
+import inspect
+import json
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from findings_store import FindingsStore, findings_frame, findings_store_dir, link_chunk, write_chunk
+from incremental import CheckHistory, state_dir
+from rule_compiler import RuleError, rule_for_child
+from study_data import SUBJECT_COLUMN, STUDY_DOMAINS, dataset_cache, find_dataset, study_data_dir
+
+DEFAULT_TIMEOUT_SECONDS = 60
+DEFAULT_MEMORY_MB = 2048
+# Extra time a worker gets to report a timed out check before it is killed
+HARD_TIMEOUT_GRACE_SECONDS = 5
+# Flagged records returned per child check
+SAMPLE_RECORDS = 20
+
+# Identifier columns returned with the records a compiled rule flags
+RECORD_KEY_COLUMNS = ('USUBJID', 'SUBJID', 'VISIT', 'VISITNUM')
+
+# Argument names that receive the child's domains stacked into one frame
+STACKED_ARGUMENTS = ('data', 'df', 'dataset')
+
+# Column names quoted in pseudo code, as in ae_df['AEOUT'] or a required_cols list
+_QUOTED_COLUMN = re.compile(r"""['"]([A-Z][A-Z0-9_]+)['"]""")
+
+# Pseudo code declaring that it only relates records of the same subject
+_PARTITION_MARKER = re.compile(r"""^PARTITION_BY\s*=\s*['"]USUBJID['"]""", re.MULTILINE)
+
+# Builtins available to pseudo code when DRY_RUN_EXEC_CODE allows running it: no
+# open, __import__, eval/exec or attribute reflection. This narrows what a check
+# can reach by accident; it is not a sandbox for untrusted code.
+CHECK_BUILTINS = {name: getattr(builtins, name) for name in (
+    'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'filter', 'float', 'frozenset', 'int', 'isinstance', 'len',
+    'list', 'map', 'max', 'min', 'range', 'reversed', 'round', 'set', 'slice', 'sorted', 'str', 'sum', 'tuple',
+    'zip', 'ArithmeticError', 'Exception', 'IndexError', 'KeyError', 'TypeError', 'ValueError', 'ZeroDivisionError',
+)}
+
+# Check outcomes counted as failures of the check itself rather than findings
+FAILED_STATUSES = ('error', 'timeout', 'memory_limit')
+
+# Run report fields kept in the summary index of stored findings
+FINDINGS_SUMMARY_FIELDS = ('scenario_id', 'scenario_name', 'scenario_count', 'data_dir', 'status', 'total_checks',
+                           'flagged_checks', 'failed_checks', 'flagged_records', 'elapsed_seconds')
+
+
+class CheckError(Exception):
+    """A child check that cannot be run against the study data"""
+
+
+class CheckTimeout(Exception):
+    """Raised inside a worker when a check exceeds its time budget"""
+
+
+def _init_worker(memory_mb):
+    """Cap the address space of a pool worker so a runaway check fails alone"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_mb:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _raise_timeout(signum, frame):
+    raise CheckTimeout()
+
+
+class _time_limit:
+    """Raise CheckTimeout in the worker once seconds have passed"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __enter__(self):
+        self._previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, self.seconds)
+
+    def __exit__(self, *exc_info):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous)
+
+
+def _load_domain(data_dir, domain, columns=None, shard=None):
+    """Domain frame from data_dir, served from the worker's dataset cache until the file changes
+
+    With columns, only those columns are read; with shard (index, count),
+    only the rows of that subject shard.
+    """
+    path = find_dataset(data_dir, domain)
+    if not path:
+        raise CheckError(f"No {domain} dataset in {data_dir}")
+    return dataset_cache.get(path, columns, shard)
+
+
+def _decoded(frame):
+    """Frame with categorical code-list columns turned back into their values, for pseudo code checks"""
+    # object rather than the categories' string dtype: far cheaper to build
+    categorical = {name: object for name, series in frame.items() if isinstance(series.dtype, pd.CategoricalDtype)}
+    return frame.astype(categorical) if categorical else frame
+
+
+def _check_function(namespace):
+    """The check defined by pseudo code: validate_scenario, else the last function defined"""
+    if callable(namespace.get('validate_scenario')):
+        return namespace['validate_scenario']
+    functions = [value for value in namespace.values()
+                 if inspect.isfunction(value) and value.__module__ == namespace['__name__']]
+    if not functions:
+        raise CheckError("Pseudo code does not define a check function")
+    return functions[-1]
+
+
+def _bind_arguments(function, domains, load):
+    """Frames for the check's parameters: <domain>_df gets that domain, data the child's domains stacked"""
+    arguments = []
+    for name, parameter in inspect.signature(function).parameters.items():
+        key = name.lower()
+        domain = (key[:-3] if key.endswith('_df') else key).upper()
+        if domain in STUDY_DOMAINS:
+            frame = _decoded(load(domain))
+        elif key in STACKED_ARGUMENTS:
+            study_domains = [domain for domain in domains if domain in STUDY_DOMAINS]
+            if not study_domains:
+                raise CheckError("Child scenario has no study domains to load")
+            frames = [_decoded(load(domain)) for domain in study_domains]
+            frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True, sort=False)
+        elif parameter.default is not inspect.Parameter.empty:
+            break
+        else:
+            raise CheckError(f"No dataset for check argument '{name}'")
+        arguments.append(frame)
+    return arguments
+
+
+def _records(frame, limit):
+    """(JSON-safe first records of a frame, their index labels)"""
+    head = frame.head(limit)
+    return json.loads(head.to_json(orient='records', date_format='iso')), _json_keys(head.index)
+
+
+def _json_keys(index):
+    """Index labels as plain Python values; they order the records of subject shards when merged"""
+    return [key.item() if isinstance(key, np.generic) else key for key in index.tolist()]
+
+
+def _summarize(result, sample_limit):
+    """(flagged count, JSON-safe sample, sample keys) of whatever a check returned"""
+    if result is None:
+        return 0, [], []
+    if isinstance(result, pd.Series) and result.dtype == bool:
+        return int(result.sum()), [], []
+    if isinstance(result, pd.Series):
+        result = result.to_frame()
+    if isinstance(result, pd.DataFrame):
+        return (len(result),) + _records(result, sample_limit)
+    if isinstance(result, (list, tuple, set)):
+        records = [item if isinstance(item, (dict, str, int, float)) else str(item)
+                   for item in list(result)[:sample_limit]]
+        return len(result), records, list(range(len(records)))
+    raise CheckError(f"Unsupported check result of type {type(result).__name__}")
+
+
+def _child_report(child_id, **fields):
+    """Outcome of one child check"""
+    report = {'child_id': child_id, 'status': 'passed', 'engine': None, 'rule': None,
+              'flagged_count': 0, 'records': [], 'rows_scanned': {}, 'message': '',
+              'rerun_subjects': None, 'reused': False, 'load_seconds': 0.0, 'check_seconds': 0.0,
+              'findings': []}
+    report.update(fields)
+    return report
+
+
+def _run_rule(rule, domain, load):
+    """Flagged records of a compiled rule: one pass of mask arithmetic over its domain"""
+    if not domain:
+        raise CheckError("Rule has no study domain to run against")
+    frame = load(domain)
+    return frame.loc[_evaluate(rule, frame), _record_columns(rule, frame)]
+
+
+def _evaluate(rule, frame):
+    try:
+        return rule.evaluate(frame)
+    except RuleError as e:
+        raise CheckError(str(e))
+
+
+def _record_columns(rule, frame):
+    columns = [column for column in RECORD_KEY_COLUMNS if column in frame.columns]
+    return columns + [column for column in rule.columns if column not in columns]
+
+
+def _run_rule_incremental(child_id, rule, domain, load, history, sample_limit, keep_flagged=False):
+    """(flagged count, records, keys, subjects re-run, flagged frame) of a rule, re-evaluated only for subjects whose columns changed
+
+    Rules are evaluated row by row, so a subject's findings depend only on
+    its own rows: subjects whose fingerprint over the rule's columns matches
+    the last run keep their flagged count. The sample is taken from the
+    smallest prefix of the frame known to hold it, so the result equals a
+    full run. With keep_flagged, subjects flagged last time are evaluated
+    again too, to return every flagged record; otherwise the flagged frame
+    is None. Returns None when the frame cannot be tracked by subject.
+    """
+    if not domain:
+        raise CheckError("Rule has no study domain to run against")
+    frame = load(domain)
+    if SUBJECT_COLUMN not in frame.columns or not set(rule.columns) <= set(frame.columns):
+        return None
+    subjects = history.subjects(domain)
+    fingerprints = subjects.fingerprints(rule.columns)
+    signature = ('rule', rule.source)
+    changed, counts = subjects.compare(history.previous(child_id, signature), fingerprints)
+
+    evaluated = changed | (counts > 0) if keep_flagged else changed
+    rows = evaluated[subjects.codes]
+    flagged = frame.iloc[:0][_record_columns(rule, frame)] if keep_flagged else None
+    if rows.any():
+        mask = _evaluate(rule, frame if rows.all() else frame.loc[rows, list(rule.columns)])
+        rerun = np.bincount(subjects.codes[rows][mask], minlength=len(subjects.subjects))
+        counts = np.where(evaluated, rerun, counts)
+        if keep_flagged:
+            flagged = frame[_record_columns(rule, frame)].iloc[np.flatnonzero(rows)[mask]]
+    history.record(child_id, signature, subjects=subjects.subjects, fingerprints=fingerprints, counts=counts)
+
+    records, keys = [], []
+    if flagged is not None:
+        records, keys = _records(flagged, sample_limit)
+    elif sample_limit and counts.any():
+        head = frame.iloc[:subjects.row_limit(counts, sample_limit)]
+        records, keys = _records(head.loc[_evaluate(rule, head), _record_columns(rule, head)], sample_limit)
+    return int(counts.sum()), records, keys, int(changed.sum()), flagged
+
+
+def exec_code_enabled():
+    """Whether dry runs may run the pseudo code of checks without a compilable rule, from DRY_RUN_EXEC_CODE"""
+    return os.environ.get('DRY_RUN_EXEC_CODE', 'false').lower() == 'true'
+
+
+def _run_code(child_id, pseudo_code, domains, load):
+    """Result of the check function defined by a child's pseudo code, run with CHECK_BUILTINS only"""
+    namespace = {'__name__': 'dry_run_check', '__builtins__': dict(CHECK_BUILTINS), 'pd': pd, 'np': np}
+    exec(compile(pseudo_code, f'<check {child_id}>', 'exec'), namespace)
+    function = _check_function(namespace)
+    return function(*_bind_arguments(function, domains, load))
+
+
+def _reuse_code_result(child_id, pseudo_code, history, sample_limit, findings=None):
+    """(flagged count, records, keys, stored chunks) of a code check's last run when every frame it read is unchanged, else None
+
+    When findings are stored, the records that run stored are linked into
+    this run as the check's chunk; a run that did not store them is not reused.
+    """
+    signature = ('code', pseudo_code, sample_limit)
+    previous = history.previous(child_id, signature)
+    if previous is None:
+        return None
+    try:
+        if any(history.digest(domain) != digest for domain, digest in previous['digests'].items()):
+            return None
+    except CheckError:
+        return None
+    chunks = []
+    if findings is not None:
+        if previous.get('findings') is None:
+            return None
+        for stored_path, chunk in previous['findings']:
+            chunk = link_chunk(findings, stored_path, chunk)
+            if chunk is None:
+                return None
+            chunks.append(chunk)
+        # Point the state at this run's chunk, which outlives the earlier run's
+        state = {key: value for key, value in previous.items() if key != 'signature'}
+        history.record(child_id, signature, **dict(state, findings=_stored(findings, chunks)))
+    return previous['flagged_count'], previous['records'], previous.get('record_keys', []), chunks
+
+
+def _store_findings(path, frame):
+    """Chunks of a check's flagged records written to path, none when it has no records; None when writing fails"""
+    if frame is None or not len(frame):
+        return []
+    try:
+        return [write_chunk(path, frame)]
+    except (CheckTimeout, MemoryError):
+        raise
+    except Exception as e:
+        print(f"Error storing dry run findings {path}: {e}")
+        return None
+
+
+def _stored(path, chunks):
+    """(path, chunk) pairs recorded in a check's state, to link its findings into later runs"""
+    return [(os.path.abspath(path), chunk) for chunk in chunks]
+
+
+def _run_check(check, load, timeout, sample_limit, history=None, findings=None, exec_code=False):
+    """Run one child check with frames from load(domain)
+
+    A rule compiled from the child's text runs in preference to its pseudo
+    code, which is only executed when the text states no compilable rule and
+    exec_code allows it; otherwise such a check is skipped as not compilable.
+    With a CheckHistory, only what changed since the check's last run is
+    evaluated again. With a findings path, every flagged record is written
+    there as a Parquet chunk, listed in the report's findings.
+    """
+    _, child_id, domain, rule, pseudo_code, domains = check
+    report = _child_report(child_id)
+    if rule is None and not pseudo_code.strip():
+        report.update(status='skipped', message="No compilable rule or pseudo code")
+        return report
+    if rule is None and not exec_code:
+        report.update(status='skipped', engine='code',
+                      message="No compilable rule; running pseudo code is disabled (DRY_RUN_EXEC_CODE)")
+        return report
+
+    def timed_load(domain):
+        loading = time.perf_counter()
+        frame = load(domain)
+        report['load_seconds'] += time.perf_counter() - loading
+        report['rows_scanned'][domain] = len(frame)
+        return frame
+
+    started = time.perf_counter()
+    try:
+        with _time_limit(timeout):
+            outcome = None
+            if rule is not None:
+                report.update(engine='rule', rule=rule.source)
+                if history is not None:
+                    outcome = _run_rule_incremental(child_id, rule, domain, timed_load, history, sample_limit,
+                                                    keep_flagged=findings is not None)
+                if outcome is not None:
+                    flagged_count, records, keys, report['rerun_subjects'], flagged = outcome
+                else:
+                    flagged = _run_rule(rule, domain, timed_load)
+                    flagged_count, records, keys = _summarize(flagged, sample_limit)
+                if findings is not None:
+                    report['findings'] = _store_findings(findings, flagged) or []
+            else:
+                report['engine'] = 'code'
+                if history is not None:
+                    outcome = _reuse_code_result(child_id, pseudo_code, history, sample_limit, findings)
+                if outcome is not None:
+                    flagged_count, records, keys, report['findings'] = outcome
+                    report['reused'] = True
+                else:
+                    result = _run_code(child_id, pseudo_code, domains, timed_load)
+                    flagged_count, records, keys = _summarize(result, sample_limit)
+                    stored = _store_findings(findings, findings_frame(result)) if findings is not None else None
+                    report['findings'] = stored or []
+                    if history is not None:
+                        history.record(child_id, ('code', pseudo_code, sample_limit),
+                                       digests={domain: history.digest(domain) for domain in report['rows_scanned']},
+                                       flagged_count=flagged_count, records=records, record_keys=keys,
+                                       findings=None if stored is None else _stored(findings, stored))
+        report.update(flagged_count=flagged_count, records=records, record_keys=keys,
+                      status='flagged' if flagged_count else 'passed')
+    except CheckTimeout:
+        report.update(status='timeout', message=f"Check exceeded {timeout:g} seconds")
+    except MemoryError:
+        report.update(status='memory_limit', message="Check exceeded the worker memory limit")
+    except CheckError as e:
+        report.update(status='skipped', message=str(e))
+    except Exception as e:
+        report.update(status='error', message=f"{type(e).__name__}: {e}")
+    report['check_seconds'] = time.perf_counter() - started - report['load_seconds']
+    return report
+
+
+def _scan_report(domains, columns, checks, message='', shards=1):
+    """Outcome of one shared scan"""
+    return {'domains': list(domains), 'columns': list(columns), 'checks': len(checks),
+            'shards': shards, 'rows': {}, 'load_seconds': 0.0, 'message': message}
+
+
+def run_scan(task):
+    """Run every check planned against a set of domains, reading each dataset once; executed in a pool worker
+
+    With a shard (index, count), every dataset is read for that subject
+    shard only and reports keep the index labels of their records, for
+    _merge_shards. With a findings directory, each check stores its flagged
+    records there. Returns the scan summary and (check index, report) pairs.
+    """
+    domains, columns, checks, data_dir, timeout, sample_limit, history_dir, shard, findings_dir, exec_code = task
+    scan = _scan_report(domains, columns, checks)
+    shared = {}
+
+    def load(domain):
+        if domain not in shared:
+            started = time.perf_counter()
+            try:
+                # Domains outside the plan (a check naming another <domain>_df) are read whole
+                frame = _load_domain(data_dir, domain, columns if domain in domains else None, shard)
+            except CheckError as e:
+                # Remember missing datasets so later checks fail fast
+                frame = e
+            scan['load_seconds'] += time.perf_counter() - started
+            shared[domain] = frame
+            if not isinstance(frame, CheckError):
+                scan['rows'][domain] = len(frame)
+        if isinstance(shared[domain], CheckError):
+            raise shared[domain]
+        return shared[domain]
+
+    history = CheckHistory(history_dir, data_dir, domains, load, shard) if history_dir else None
+    reports = []
+    for check in checks:
+        findings = os.path.join(findings_dir, _chunk_name(check[0], shard)) if findings_dir else None
+        reports.append((check[0], _run_check(check, load, timeout, sample_limit, history, findings, exec_code)))
+    if history is not None:
+        try:
+            history.save()
+        except OSError as e:
+            print(f"Error saving dry run state: {e}")
+    if shard is None:
+        for _, report in reports:
+            report.pop('record_keys', None)
+    return scan, reports
+
+
+def _chunk_name(index, shard):
+    """File of a check's stored findings in a run directory, one per subject shard when sharded"""
+    return f'{index:05d}.parquet' if shard is None else f'{index:05d}-{shard[0]}.parquet'
+
+
+def _check_columns(child, rule):
+    """Columns a check reads: its declared CDASH items, its rule's columns and any quoted in its code"""
+    columns = list(child.required_cdash_items)
+    if rule is not None:
+        columns.extend(rule.columns)
+    elif child.pseudo_code:
+        columns.extend(_QUOTED_COLUMN.findall(child.pseudo_code))
+    return columns
+
+
+def plan_scans(children):
+    """Group child checks into shared scans, one per study domain or set of domains
+
+    Rule checks and single-domain code checks share their domain's scan;
+    code checks over several domains share a scan with checks over the same
+    domains. A scan reads each of its datasets once, with only the union of
+    the columns its checks need. Each scan is (domains, columns, checks), a
+    check being (index, child id, domain, rule, pseudo code, domains).
+    """
+    grouped = {}
+    columns = {}
+    for index, child in enumerate(children):
+        rule = rule_for_child(child)
+        study_domains = tuple(dict.fromkeys(domain for domain in child.domains if domain in STUDY_DOMAINS))
+        if rule is not None:
+            domain = rule.domain or (study_domains[0] if study_domains else None)
+            key = (domain,) if domain else ()
+        else:
+            domain = None
+            key = study_domains
+        grouped.setdefault(key, []).append(
+            (index, child.id, domain, rule, child.pseudo_code or '', tuple(child.domains)))
+        scan_columns = columns.setdefault(key, dict.fromkeys(RECORD_KEY_COLUMNS))
+        scan_columns.update(dict.fromkeys(_check_columns(child, rule)))
+    return [(key, tuple(columns[key]), checks) for key, checks in grouped.items()]
+
+
+def _partitioned(check):
+    """Whether a check gives the same findings run subject shard by shard
+
+    Compiled rules look at one record at a time. Pseudo code may compare
+    any records, so it is only split when it declares PARTITION_BY = 'USUBJID'.
+    """
+    rule, pseudo_code = check[3], check[4]
+    return rule is not None or bool(_PARTITION_MARKER.search(pseudo_code))
+
+
+def _merge_shards(reports, sample_limit):
+    """One check's report from its reports on every subject shard, in shard order
+
+    Counts and timings add up. The sample keeps the first records by index
+    label, which for rules and filtered frames is their position in the
+    dataset, so it matches an unsharded run whichever worker ran which shard.
+    A shard that failed fails the check.
+    """
+    merged = dict(reports[0], rows_scanned={}, flagged_count=0, load_seconds=0.0, check_seconds=0.0,
+                  findings=[chunk for report in reports for chunk in report['findings']])
+    for report in reports:
+        for domain, rows in report['rows_scanned'].items():
+            merged['rows_scanned'][domain] = merged['rows_scanned'].get(domain, 0) + rows
+        for field in ('flagged_count', 'load_seconds', 'check_seconds'):
+            merged[field] += report[field]
+    reruns = [report['rerun_subjects'] for report in reports if report['rerun_subjects'] is not None]
+    merged['rerun_subjects'] = sum(reruns) if reruns else None
+    merged['reused'] = all(report['reused'] for report in reports)
+
+    sample = [(key, shard, record) for shard, report in enumerate(reports)
+              for key, record in zip(report.pop('record_keys', []), report['records'])]
+    try:
+        sample.sort(key=lambda item: item[:2])
+    except TypeError:
+        # Labels that do not order (mixed types) leave the records in shard order
+        pass
+    merged['records'] = [record for _, _, record in sample[:sample_limit]]
+    merged.pop('record_keys', None)
+
+    failed = next((report for report in reports if report['status'] not in ('passed', 'flagged')), None)
+    if failed is not None:
+        merged.update(status=failed['status'], message=failed['message'], flagged_count=0, records=[], findings=[])
+    else:
+        merged['status'] = 'flagged' if merged['flagged_count'] else 'passed'
+    return merged
+
+
+def _merge_scans(scans):
+    """One scan summary from the summaries of its shards"""
+    merged = dict(scans[0], rows={}, load_seconds=0.0, shards=len(scans))
+    for scan in scans:
+        for domain, rows in scan['rows'].items():
+            merged['rows'][domain] = merged['rows'].get(domain, 0) + rows
+        merged['load_seconds'] += scan['load_seconds']
+        merged['message'] = merged['message'] or scan['message']
+    return merged
+
+
+def _summarize_details(report, details):
+    """Add check counts and an overall status to a report"""
+    statuses = [detail['status'] for detail in details]
+    report.update(
+        total_checks=len(details),
+        passed_checks=statuses.count('passed'),
+        flagged_checks=statuses.count('flagged'),
+        failed_checks=sum(statuses.count(status) for status in FAILED_STATUSES),
+        skipped_checks=statuses.count('skipped'),
+        flagged_records=sum(detail['flagged_count'] for detail in details)
+    )
+    if report['failed_checks']:
+        report['status'] = 'error'
+    elif report['flagged_checks']:
+        report['status'] = 'flagged'
+    elif report['skipped_checks'] == report['total_checks']:
+        # Nothing was checked, which is not a pass
+        report['status'] = 'skipped'
+    else:
+        report['status'] = 'passed'
+    return report
+
+
+def _findings_entry(child, detail):
+    """Summary index entry of a child check, taking the list of its stored chunks off its detail"""
+    chunks = detail.pop('findings', [])
+    rule = rule_for_child(child)
+    study_domains = list(dict.fromkeys(domain for domain in child.domains if domain in STUDY_DOMAINS))
+    if rule is not None:
+        study_domains = [rule.domain] if rule.domain else study_domains[:1]
+    return {'child_id': child.id, 'scenario_id': detail.get('scenario_id'), 'child_scenario': child.scenario_text,
+            'status': detail['status'], 'flagged_count': detail['flagged_count'],
+            'stored_count': sum(chunk['rows'] for chunk in chunks), 'domains': study_domains, 'chunks': chunks}
+
+
+def _no_data_report(report, check_count):
+    """Report of a run that found no study datasets"""
+    report.update(status='no_data', total_checks=check_count, passed_checks=0, flagged_checks=0,
+                  failed_checks=0, skipped_checks=check_count, flagged_records=0,
+                  elapsed_seconds=0.0, scans=[], details=[])
+    return report
+
+
+class DryRunEngine:
+    """Runs child scenario checks against the study datasets in a process pool"""
+
+    def __init__(self, data_dir=None, workers=None, timeout=None, memory_mb=None, history_dir=None, shards=None,
+                 findings_dir=None, exec_code=None):
+        self.data_dir = data_dir or study_data_dir()
+        # An empty history_dir turns incremental runs off, an empty findings_dir the findings store
+        self.history_dir = state_dir() if history_dir is None else history_dir or None
+        findings_dir = findings_store_dir() if findings_dir is None else findings_dir or None
+        self.findings = FindingsStore(findings_dir) if findings_dir else None
+        self.workers = workers or int(os.environ.get('DRY_RUN_WORKERS', 0)) or os.cpu_count() or 1
+        self.timeout = timeout or float(os.environ.get('DRY_RUN_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
+        self.memory_mb = memory_mb if memory_mb is not None else int(
+            os.environ.get('DRY_RUN_MEMORY_MB', DEFAULT_MEMORY_MB))
+        # Subject shards per scan of partitioned checks; 1 runs every scan whole
+        self.shards = shards or int(os.environ.get('DRY_RUN_SHARDS', 0)) or self.workers
+        # Pseudo code only runs when a deployment opts in
+        self.exec_code = exec_code_enabled() if exec_code is None else exec_code
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        """Worker pool of this process, started on first use"""
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # forkserver: forking the threaded web server itself could copy held locks
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                context = multiprocessing.get_context(method)
+                self._pool = context.Pool(self.workers, initializer=_init_worker, initargs=(self.memory_mb,))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Kill a pool whose workers stopped responding; the next run starts a new one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.terminate()
+
+    def has_data(self):
+        """Whether the data directory holds a dataset for any study domain"""
+        return any(find_dataset(self.data_dir, domain) for domain in STUDY_DOMAINS)
+
+    def _tasks(self, scans):
+        """Pool tasks of a scan plan: (scan number, domains, columns, checks, shard)
+
+        The partitioned checks of a scan run once per subject shard, each
+        task loading only its shard's rows; the scan's other checks run in a
+        single task over whole datasets.
+        """
+        tasks = []
+        for number, (domains, columns, checks) in enumerate(scans):
+            partitioned = [check for check in checks if _partitioned(check)] if self.shards > 1 else []
+            whole = [check for check in checks if check not in partitioned]
+            if whole:
+                tasks.append((number, domains, columns, whole, None))
+            tasks.extend((number, domains, columns, partitioned, (index, self.shards))
+                         for index in range(self.shards) if partitioned)
+        return tasks
+
+    def run_checks(self, children, findings_run=None):
+        """Run child checks through the scan plan; returns (details in child order, scans)
+
+        With a findings store run, every flagged record is stored in it and
+        each detail lists its chunks under findings.
+        """
+        scans = plan_scans(children)
+        tasks = self._tasks(scans)
+        findings_dir = self.findings.run_dir(findings_run) if findings_run else None
+        pool = self._get_pool()
+        pending = [
+            pool.apply_async(run_scan, ((domains, columns, checks, self.data_dir, self.timeout,
+                                          SAMPLE_RECORDS, self.history_dir, shard, findings_dir, self.exec_code),))
+            for _, domains, columns, checks, shard in tasks
+        ]
+
+        # Checks (loads included) time out inside the workers; this bound only
+        # catches workers that died or hung in C code
+        budgets = [len(task[3]) * self.timeout + HARD_TIMEOUT_GRACE_SECONDS for task in tasks]
+        deadline = time.monotonic() + (sum(budgets) / self.workers + max(budgets, default=0))
+        shard_reports = {}  # check index -> reports in shard order
+        scan_parts = {}  # (scan number, sharded) -> scan summaries
+        hung = False
+        for (number, domains, columns, checks, shard), result in zip(tasks, pending):
+            try:
+                scan, reports = result.get(max(deadline - time.monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                hung = True
+                scan = _scan_report(domains, columns, checks, "Worker stopped responding")
+                reports = [(check[0], _child_report(check[1], status='timeout', message=scan['message']))
+                           for check in checks]
+            except Exception as e:
+                scan = _scan_report(domains, columns, checks, f"{type(e).__name__}: {e}")
+                reports = [(check[0], _child_report(check[1], status='error', message=scan['message']))
+                           for check in checks]
+            scan_parts.setdefault((number, shard is not None), []).append(scan)
+            for index, report in reports:
+                shard_reports.setdefault(index, []).append(report)
+        if hung:
+            self._discard_pool(pool)
+
+        details = [None] * len(children)
+        for index, reports in shard_reports.items():
+            detail = _merge_shards(reports, SAMPLE_RECORDS) if len(reports) > 1 else reports[0]
+            detail.pop('record_keys', None)
+            detail['child_scenario'] = children[index].scenario_text
+            details[index] = detail
+        scan_reports = [_merge_scans(parts) if sharded else parts[0]
+                        for (_, sharded), parts in sorted(scan_parts.items())]
+        return details, scan_reports
+
+    def run(self, scenario):
+        """Run every child check of a parent scenario and summarize the outcome"""
+        started = time.perf_counter()
+        report = {
+            'scenario_id': scenario.id,
+            'scenario_name': scenario.name,
+            'data_dir': self.data_dir
+        }
+        if not self.has_data():
+            return _no_data_report(report, len(scenario.child_scenarios))
+
+        findings_run = self._new_findings_run()
+        details, scans = self.run_checks(scenario.child_scenarios, findings_run)
+        _summarize_details(report, details)
+        report.update(elapsed_seconds=time.perf_counter() - started, scans=scans, details=details)
+        report['findings_run'] = self._save_findings(findings_run, report, scenario.child_scenarios, details)
+        return report
+
+    def run_active(self, scenarios):
+        """Run the checks of every active scenario in one plan, one scan per domain"""
+        started = time.perf_counter()
+        active = [scenario for scenario in scenarios if scenario.is_active]
+        children = [child for scenario in active for child in scenario.child_scenarios]
+        report = {'data_dir': self.data_dir, 'scenario_count': len(active)}
+        if not self.has_data():
+            report['scenarios'] = []
+            return _no_data_report(report, len(children))
+
+        findings_run = self._new_findings_run()
+        details, scans = self.run_checks(children, findings_run)
+        summaries = []
+        position = 0
+        for scenario in active:
+            scenario_details = details[position:position + len(scenario.child_scenarios)]
+            position += len(scenario.child_scenarios)
+            for detail in scenario_details:
+                detail['scenario_id'] = scenario.id
+            summaries.append(_summarize_details({'scenario_id': scenario.id, 'scenario_name': scenario.name},
+                                                scenario_details))
+        _summarize_details(report, details)
+        report.update(elapsed_seconds=time.perf_counter() - started, scans=scans,
+                      scenarios=summaries, details=details)
+        report['findings_run'] = self._save_findings(findings_run, report, children, details)
+        return report
+
+    def _new_findings_run(self):
+        """Id of a new run of the findings store, or None when findings are not stored"""
+        if self.findings is None:
+            return None
+        try:
+            return self.findings.new_run()
+        except OSError as e:
+            print(f"Error creating dry run findings directory: {e}")
+            return None
+
+    def _save_findings(self, findings_run, report, children, details):
+        """Write the summary index of a run's stored findings; returns the run id, or None when nothing was stored"""
+        entries = [_findings_entry(child, detail) for child, detail in zip(children, details)]
+        if findings_run is None:
+            return None
+        summary = {field: report[field] for field in FINDINGS_SUMMARY_FIELDS if field in report}
+        try:
+            self.findings.save_index(findings_run, summary, entries)
+        except OSError as e:
+            print(f"Error saving dry run findings index: {e}")
+            return None
+        return findings_run
+
+
+# Global dry run engine; its worker pool starts on the first dry run
+dry_run_engine = DryRunEngine()
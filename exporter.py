@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+
+# (CSV header, record key) for every exported column, one row per child scenario
+EXPORT_COLUMNS = (
+    ('Parent ID', 'parent_id'),
+    ('Parent Name', 'parent_name'),
+    ('Parent Description', 'parent_description'),
+    ('Parent Tags', 'parent_tags'),
+    ('Is Active', 'is_active'),
+    ('Is OOTB', 'is_ootb'),
+    ('Child ID', 'child_id'),
+    ('Child Scenario Text', 'child_scenario_text'),
+    ('Required CDASH Items', 'required_cdash_items'),
+    ('Domains', 'domains'),
+    ('Child Tags', 'child_tags'),
+    ('Reasoning Template', 'reasoning_template'),
+)
+
+LIST_COLUMNS = ('parent_tags', 'required_cdash_items', 'domains', 'child_tags')
+BOOLEAN_COLUMNS = ('is_active', 'is_ootb')
+
+# Rows per Parquet row group (and per CSV / JSON Lines chunk sent to the client)
+EXPORT_BATCH_SIZE = 1000
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def parquet_available():
+    """Whether pyarrow, needed for Parquet, is installed"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def iter_export_records(scenarios):
+    """Yield one export record per child scenario (or per childless parent)"""
+    for parent in scenarios:
+        parent_fields = {
+            'parent_id': parent.id,
+            'parent_name': parent.name,
+            'parent_description': parent.description,
+            'parent_tags': [parent.tag.name] if parent.tag else [],
+            'is_active': parent.is_active,
+            'is_ootb': parent.is_ootb,
+        }
+
+        if not parent.child_scenarios:
+            yield dict(parent_fields, child_id='', child_scenario_text='', required_cdash_items=[],
+                       domains=[], child_tags=[], reasoning_template='')
+            continue
+
+        for child in parent.child_scenarios:
+            yield dict(
+                parent_fields,
+                child_id=child.id,
+                child_scenario_text=child.scenario_text,
+                required_cdash_items=list(child.required_cdash_items),
+                domains=list(child.domains),
+                child_tags=[child.tag.name] if child.tag else [],
+                reasoning_template=child.reasoning_template,
+            )
+
+
+def _batches(records, size):
+    """Group records into lists of at most size items"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(records, batch_size=EXPORT_BATCH_SIZE):
+    """Yield CSV text in chunks of batch_size rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+
+    for batch in _batches(records, batch_size):
+        for record in batch:
+            writer.writerow([
+                ', '.join(record[key]) if key in LIST_COLUMNS else record[key]
+                for _, key in EXPORT_COLUMNS
+            ])
+        yield _drain(buffer)
+
+    # Header only when there is nothing to export
+    if buffer.tell():
+        yield _drain(buffer)
+
+
+def stream_records_csv(records, columns, batch_size=EXPORT_BATCH_SIZE):
+    """Yield CSV text of arbitrary records with the given columns, in chunks of batch_size rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for batch in _batches(records, batch_size):
+        writer.writerows([record.get(column) for column in columns] for record in batch)
+        yield _drain(buffer)
+
+    if buffer.tell():
+        yield _drain(buffer)
+
+
+def stream_jsonl(records, batch_size=EXPORT_BATCH_SIZE):
+    """Yield JSON Lines text in chunks of batch_size records"""
+    for batch in _batches(records, batch_size):
+        yield ''.join(json.dumps(record) + '\n' for record in batch)
+
+
+def stream_parquet(records, batch_size=EXPORT_BATCH_SIZE):
+    """Yield a Parquet file as bytes, writing one row group per batch"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = []
+    for _, key in EXPORT_COLUMNS:
+        if key in LIST_COLUMNS:
+            fields.append(pa.field(key, pa.list_(pa.string())))
+        elif key in BOOLEAN_COLUMNS:
+            fields.append(pa.field(key, pa.bool_()))
+        else:
+            fields.append(pa.field(key, pa.string()))
+    schema = pa.schema(fields)
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in _batches(records, batch_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema), row_group_size=batch_size)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        # Writes the footer; also keeps an empty export a valid Parquet file
+        writer.close()
+    yield sink.drain()
+
+
+def _drain(buffer):
+    """Return and clear the contents of a StringIO"""
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return text
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back in chunks"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        chunk = b''.join(self._chunks)
+        self._chunks = []
+        return chunk
@@ -0,0 +1,314 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from exporter import parquet_available
+from study_data import SUBJECT_COLUMN
+
+DEFAULT_FINDINGS_DIR = '.cache/dry_run_findings'
+
+# Runs kept on disk; the oldest are deleted when a new run starts
+KEPT_RUNS = 20
+
+# Rows per Parquet row group of a findings chunk; pages read one group at a time
+FINDINGS_ROW_GROUP = 16_384
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows a page request scans for filter matches before it returns what it found
+MAX_SCAN_ROWS = 2_000_000
+
+# Column holding a record's domain in SDTM datasets
+DOMAIN_COLUMN = 'DOMAIN'
+
+INDEX_FILE = 'index.json'
+
+_RUN_ID = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+
+
+def findings_store_dir():
+    """Directory of stored dry run findings, from DRY_RUN_FINDINGS_DIR; None when it is set empty or pyarrow is missing"""
+    directory = os.environ.get('DRY_RUN_FINDINGS_DIR', DEFAULT_FINDINGS_DIR) or None
+    if directory and not parquet_available():
+        print("Dry run findings are not stored: the pyarrow package is not installed")
+        return None
+    return directory
+
+
+def findings_frame(result):
+    """Flagged records of whatever a check returned as a frame, or None when it only counts them"""
+    if isinstance(result, pd.Series) and result.dtype == bool:
+        return None
+    if isinstance(result, pd.Series):
+        return result.to_frame()
+    if isinstance(result, pd.DataFrame):
+        return result
+    if isinstance(result, (list, tuple, set)):
+        items = list(result)
+        if items and all(isinstance(item, dict) for item in items):
+            return pd.DataFrame(items)
+        return pd.DataFrame({'value': [item if isinstance(item, (str, int, float)) else str(item) for item in items]})
+    return None
+
+
+def _arrow_table(frame):
+    import pyarrow as pa
+
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+    frame = frame.set_axis([str(name) for name in frame.columns], axis=1)
+    try:
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Columns mixing value types are stored as text
+        text = {name: series.where(series.isna(), series.astype(str))
+                for name, series in frame.items() if series.dtype == object}
+        return pa.Table.from_pandas(frame.assign(**text), preserve_index=False)
+
+
+def write_chunk(path, frame):
+    """Write flagged records as a Parquet chunk of a run; returns the chunk's index entry"""
+    import pyarrow.parquet as pq
+
+    table = _arrow_table(frame)
+    temporary = path + '.tmp'
+    pq.write_table(table, temporary, row_group_size=FINDINGS_ROW_GROUP)
+    os.replace(temporary, path)
+    return {'file': os.path.basename(path), 'rows': table.num_rows, 'columns': table.column_names}
+
+
+def link_chunk(path, previous_path, chunk):
+    """An earlier run's chunk linked in as this run's, for a result that did not change; None when it is gone"""
+    try:
+        os.link(previous_path, path)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        # Hard links are not supported everywhere
+        try:
+            shutil.copyfile(previous_path, path)
+        except OSError:
+            return None
+    return dict(chunk, file=os.path.basename(path))
+
+
+def parse_cursor(cursor):
+    """(child, chunk, row) position of a page cursor; ValueError when it is malformed"""
+    if not cursor:
+        return 0, 0, 0
+    try:
+        position = tuple(int(part) for part in cursor.split('.'))
+    except ValueError:
+        position = ()
+    if len(position) != 3 or min(position) < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return position
+
+
+def _cursor(position):
+    return '.'.join(str(part) for part in position)
+
+
+def _row_filters(entry, chunk, subject, domain):
+    """Column values a chunk's rows must match, or None when none of its rows can"""
+    filters = {}
+    if subject is not None:
+        if SUBJECT_COLUMN not in chunk['columns']:
+            return None
+        filters[SUBJECT_COLUMN] = subject
+    if domain is not None:
+        if DOMAIN_COLUMN in chunk['columns']:
+            filters[DOMAIN_COLUMN] = domain
+        elif domain not in entry['domains']:
+            return None
+    return filters
+
+
+def _json_records(table, child_id):
+    """JSON-safe records of an Arrow table, each tagged with its child check"""
+    frame = table.to_pandas()
+    return [{'child_id': child_id, **record}
+            for record in json.loads(frame.to_json(orient='records', date_format='iso'))]
+
+
+class FindingsStore:
+    """Flagged records of dry runs on disk, one directory per run
+
+    Pool workers write the flagged records of each check, or of each check
+    and subject shard, as a Parquet chunk in the run's directory; the engine
+    then writes the run's summary index with the chunks of every child
+    check. Pages and downloads read the chunks row group by row group, so a
+    result of any size is served without loading it whole.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def new_run(self):
+        """Create the directory of a new run, deleting the oldest runs; returns the run id"""
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.run_dir(run_id))
+        for old in self._run_ids()[:-KEPT_RUNS]:
+            shutil.rmtree(self.run_dir(old), ignore_errors=True)
+        return run_id
+
+    def run_dir(self, run_id):
+        return os.path.join(self.directory, run_id)
+
+    def _run_ids(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if _RUN_ID.match(name))
+        except FileNotFoundError:
+            return []
+
+    def save_index(self, run_id, summary, children):
+        """Write a run's summary index, which makes its findings visible"""
+        index = dict(summary, run_id=run_id, created=datetime.now().isoformat(timespec='seconds'),
+                     stored_records=sum(entry['stored_count'] for entry in children), children=children)
+        descriptor, temporary = tempfile.mkstemp(dir=self.run_dir(run_id))
+        try:
+            with os.fdopen(descriptor, 'w') as f:
+                json.dump(index, f)
+            os.replace(temporary, os.path.join(self.run_dir(run_id), INDEX_FILE))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def index(self, run_id):
+        """Summary index of a run, or None when there is no such run"""
+        if not _RUN_ID.match(run_id or ''):
+            return None
+        try:
+            with open(os.path.join(self.run_dir(run_id), INDEX_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def runs(self):
+        """Summaries of the stored runs, newest first"""
+        summaries = []
+        for run_id in reversed(self._run_ids()):
+            index = self.index(run_id)
+            if index is not None:
+                index.pop('children')
+                summaries.append(index)
+        return summaries
+
+    def _groups(self, index, child, subject, domain, start):
+        """Matching rows of a run's chunks from a position on, one row group at a time
+
+        Yields (position after the group, chunk row numbers of the matching
+        rows, rows in the group, child entry, table of the matching rows or
+        None). Filter columns are read first, so row groups without a match
+        are never read whole.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        for child_number, entry in enumerate(index['children']):
+            if child_number < start[0] or (child is not None and entry['child_id'] != child):
+                continue
+            for chunk_number, chunk in enumerate(entry['chunks']):
+                if (child_number, chunk_number) < start[:2]:
+                    continue
+                filters = _row_filters(entry, chunk, subject, domain)
+                if filters is None:
+                    continue
+                first = start[2] if (child_number, chunk_number) == start[:2] else 0
+                parquet = pq.ParquetFile(os.path.join(self.run_dir(index['run_id']), chunk['file']),
+                                         memory_map=True)
+                end = 0
+                for group in range(parquet.num_row_groups):
+                    begin = end
+                    end += parquet.metadata.row_group(group).num_rows
+                    if end <= first:
+                        continue
+                    skip = max(first - begin, 0)
+                    if filters:
+                        values = parquet.read_row_group(group, columns=list(filters))
+                        mask = None
+                        for name, value in filters.items():
+                            matched = pc.equal(values[name].cast(pa.string()), value)
+                            mask = matched if mask is None else pc.and_(mask, matched)
+                        positions = np.flatnonzero(mask.fill_null(False).to_numpy(zero_copy_only=False))
+                        positions = positions[positions >= skip]
+                        table = parquet.read_row_group(group).take(positions) if len(positions) else None
+                    else:
+                        positions = np.arange(skip, end - begin)
+                        table = parquet.read_row_group(group).slice(skip)
+                    yield (child_number, chunk_number, end), begin + positions, end - begin, entry, table
+
+    def page(self, run_id, child=None, subject=None, domain=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Records of a run's findings from cursor on, filtered by child check id, subject and domain
+
+        Returns the records, the cursor of the next page (None at the end)
+        and the total number of matching records when it is known without
+        a scan. A page may hold fewer records than limit when the filters
+        match rarely; its cursor then continues the scan.
+        """
+        index = self.index(run_id)
+        if index is None:
+            raise KeyError(run_id)
+        start = parse_cursor(cursor)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        records = []
+        scanned = 0
+        next_position = None
+        for position, rows, group_rows, entry, table in self._groups(index, child, subject, domain, start):
+            wanted = limit - len(records)
+            next_position = position
+            if table is not None:
+                if table.num_rows > wanted:
+                    table = table.slice(0, wanted)
+                    next_position = position[:2] + (int(rows[wanted - 1]) + 1,)
+                records.extend(_json_records(table, entry['child_id']))
+            scanned += group_rows
+            if len(records) == limit or scanned >= MAX_SCAN_ROWS:
+                break
+        else:
+            next_position = None
+        return {'records': records, 'next_cursor': _cursor(next_position) if next_position else None,
+                'total': self._total(index, child, subject, domain)}
+
+    def _total(self, index, child, subject, domain):
+        """Matching records counted from the index, or None when rows have to be filtered"""
+        total = 0
+        for entry in index['children']:
+            if child is not None and entry['child_id'] != child:
+                continue
+            for chunk in entry['chunks']:
+                filters = _row_filters(entry, chunk, subject, domain)
+                if filters:
+                    return None
+                if filters is not None:
+                    total += chunk['rows']
+        return total
+
+    def columns(self, run_id, child=None, subject=None, domain=None):
+        """Columns of the records a download holds, child check id first"""
+        columns = {'child_id': None}
+        for entry in self.index(run_id)['children']:
+            if child is None or entry['child_id'] == child:
+                for chunk in entry['chunks']:
+                    if _row_filters(entry, chunk, subject, domain) is not None:
+                        columns.update(dict.fromkeys(chunk['columns']))
+        return list(columns)
+
+    def iter_records(self, run_id, child=None, subject=None, domain=None):
+        """Yield every matching record of a run, converting one batch of rows at a time"""
+        index = self.index(run_id)
+        if index is None:
+            raise KeyError(run_id)
+        for _, _, _, entry, table in self._groups(index, child, subject, domain, (0, 0, 0)):
+            if table is None:
+                continue
+            yield from _json_records(table, entry['child_id'])
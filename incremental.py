@@ -0,0 +1,206 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from study_data import SUBJECT_COLUMN
+
+DEFAULT_STATE_DIR = '.cache/dry_run_state'
+
+
+def state_dir():
+    """Directory of incremental dry run state, from DRY_RUN_STATE_DIR; None when it is set empty"""
+    return os.environ.get('DRY_RUN_STATE_DIR', DEFAULT_STATE_DIR) or None
+
+
+def _mix(values):
+    """Scramble 64-bit hashes (the MurmurHash3 finalizer) so per-subject sums do not cancel"""
+    with np.errstate(over='ignore'):
+        values = values ^ (values >> np.uint64(33))
+        values = values * np.uint64(0xFF51AFD7ED558CCD)
+        values = values ^ (values >> np.uint64(33))
+        values = values * np.uint64(0xC4CEB9FE1A85EC53)
+        return values ^ (values >> np.uint64(33))
+
+
+def _column_weight(series):
+    """Odd 64-bit multiplier tying a column hash to the column's name and value type
+
+    A change of type changes how rules compare the values, so it must change
+    the fingerprint; categoricals count as the type of their values.
+    """
+    dtype = series.cat.categories.dtype if isinstance(series.dtype, pd.CategoricalDtype) else series.dtype
+    digest = hashlib.blake2b(f'{series.name}\0{dtype}'.encode(), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, 'little') | 1)
+
+
+class SubjectIndex:
+    """Rows of a domain frame grouped by subject, with per-subject fingerprints of its columns
+
+    A subject's fingerprint of a column sums the mixed hashes of each of its
+    values paired with the row's rank among the subject's rows, so it changes
+    when a value, the subject's set of rows or their order changes. Column
+    fingerprints are computed once per frame and summed for a check's columns.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        codes, uniques = pd.factorize(frame[SUBJECT_COLUMN], use_na_sentinel=False)
+        self.codes = codes
+        self.subjects = pd.Index(uniques, dtype=object)
+        self._order = np.argsort(codes, kind='stable')
+        sizes = np.bincount(codes, minlength=len(self.subjects))
+        self._starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp)
+        # Position of every subject's last row, which bounds where its findings can appear
+        self.last_rows = self._order[self._starts + sizes - 1] if len(codes) else codes
+        ranks = np.arange(len(codes), dtype=np.uint64) - np.repeat(self._starts, sizes).astype(np.uint64)
+        with np.errstate(over='ignore'):
+            # Ranks in subject order, to pair with values gathered in the same order
+            self._rank_keys = _mix(ranks + np.uint64(0x9E3779B97F4A7C15))
+        self._columns = {}
+
+    def _column_fingerprints(self, name):
+        if name not in self._columns:
+            series = self.frame[name]
+            # Categorical columns hash like their values, so re-encoding a file changes nothing
+            hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()[self._order]
+            with np.errstate(over='ignore'):
+                rows = _mix(hashes ^ self._rank_keys)
+                self._columns[name] = np.add.reduceat(rows, self._starts) * _column_weight(series)
+        return self._columns[name]
+
+    def fingerprints(self, columns):
+        """Fingerprint of every subject over the columns, aligned with self.subjects"""
+        fingerprints = np.zeros(len(self.subjects), dtype=np.uint64)
+        if not len(self.codes):
+            return fingerprints
+        with np.errstate(over='ignore'):
+            for name in set(columns):
+                fingerprints += self._column_fingerprints(name)
+        return fingerprints
+
+    def digest(self):
+        """Order-sensitive digest of the whole frame, from the column fingerprints and the row order of subjects"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(pd.util.hash_pandas_object(self.subjects, index=False).to_numpy().tobytes())
+        digest.update(self.codes.tobytes())
+        for name in self.frame.columns:
+            digest.update(f'{name}\0'.encode())
+            digest.update(self._column_fingerprints(name).tobytes())
+        return digest.hexdigest()
+
+    def compare(self, previous, fingerprints):
+        """(changed, previous counts) per subject against an earlier state of the same check
+
+        previous holds the subjects, fingerprints and flagged counts of that
+        run; subjects it does not know are changed.
+        """
+        if previous is None or not len(previous['subjects']):
+            return np.ones(len(self.subjects), dtype=bool), np.zeros(len(self.subjects), dtype=np.int64)
+        positions = pd.Index(previous['subjects'], dtype=object).get_indexer(self.subjects)
+        known = positions >= 0
+        prior = np.where(known, previous['fingerprints'][positions], 0)
+        changed = ~known | (prior != fingerprints)
+        return changed, np.where(known, previous['counts'][positions], 0)
+
+    def row_limit(self, counts, limit):
+        """Rows that hold the first limit flagged records, given flagged counts per subject
+
+        Every flagged row of a subject lies at or before its last row, so
+        taking subjects by last row until their counts reach limit gives a
+        prefix of the frame that holds at least limit of them, or all of them.
+        """
+        flagged = np.flatnonzero(counts)
+        if not len(flagged):
+            return 0
+        last_rows = self.last_rows[flagged]
+        order = np.argsort(last_rows, kind='stable')
+        reached = np.searchsorted(np.cumsum(counts[flagged][order]), limit)
+        return int(last_rows[order[min(reached, len(order) - 1)]]) + 1
+
+
+def frame_digest(frame):
+    """Order-sensitive digest of a whole frame, names and dtypes included"""
+    digest = hashlib.blake2b(digest_size=16)
+    for name, series in frame.items():
+        digest.update(f'{name}\0{series.dtype}\0'.encode())
+        digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class CheckHistory:
+    """Outcome of earlier dry runs of the checks in one scan, kept per child check
+
+    States live in one pickle per data directory, scan domains and subject
+    shard. Entries
+    are replaced when a check is re-run, and an entry only applies to a run
+    of the same check signature (its rule or pseudo code).
+    """
+
+    def __init__(self, directory, data_dir, domains, load, shard=None):
+        data_key = hashlib.sha1(os.path.abspath(data_dir).encode()).hexdigest()[:16]
+        name = '-'.join(domains) or 'none'
+        if shard is not None:
+            name += '.{}of{}'.format(*shard)
+        self.path = os.path.join(directory, data_key, name + '.pickle')
+        self._load = load
+        self._previous = self._read()
+        self._states = {}
+        self._indexes = {}
+        self._digests = {}
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Discarding dry run state {self.path}: {e}")
+            return {}
+
+    def previous(self, child_id, signature):
+        """State recorded by the last run of a check, or None"""
+        state = self._previous.get(child_id)
+        return state if state is not None and state['signature'] == signature else None
+
+    def record(self, child_id, signature, **state):
+        self._states[child_id] = dict(state, signature=signature)
+
+    def subjects(self, domain):
+        """SubjectIndex of a loaded domain frame, shared by the scan's checks"""
+        if domain not in self._indexes:
+            self._indexes[domain] = SubjectIndex(self._load(domain))
+        return self._indexes[domain]
+
+    def digest(self, domain):
+        """Digest of a loaded domain frame, reusing its subject fingerprints where it has subjects"""
+        if domain not in self._digests:
+            frame = self._load(domain)
+            if SUBJECT_COLUMN in frame.columns:
+                self._digests[domain] = self.subjects(domain).digest()
+            else:
+                self._digests[domain] = frame_digest(frame)
+        return self._digests[domain]
+
+    def save(self):
+        """Merge this run's states into the state file under an exclusive lock"""
+        if not self._states:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            states = self._read()
+            states.update(self._states)
+            descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            try:
+                with os.fdopen(descriptor, 'wb') as f:
+                    pickle.dump(states, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary, self.path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
@@ -0,0 +1,281 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+# Size of the n-grams kept in the text index. Queries of this length are answered
+# exactly from a single posting list; longer queries intersect their n-grams and
+# shorter ones join the postings of the indexed grams that contain them.
+GRAM_SIZE = 3
+
+# Grams are packed into one integer, CHAR_BITS per code point, first character
+# highest; grams of fields shorter than GRAM_SIZE are padded with zeros. Every
+# code point fits in 21 bits, and GRAM_SIZE of them in an unsigned 64-bit code.
+CHAR_BITS = 21
+
+
+def _gram_code(gram):
+    """Integer code of a gram of at most GRAM_SIZE characters"""
+    code = 0
+    for char in gram:
+        code = code << CHAR_BITS | ord(char)
+    return code << CHAR_BITS * (GRAM_SIZE - len(gram))
+
+
+def _gram_text(code):
+    """Gram of an integer code"""
+    mask = (1 << CHAR_BITS) - 1
+    chars = [chr(code >> CHAR_BITS * shift & mask) for shift in range(GRAM_SIZE - 1, -1, -1)]
+    return ''.join(chars).rstrip('\x00')
+
+
+def _parts(gram):
+    """Every substring of gram shorter than GRAM_SIZE"""
+    return {gram[start:start + size]
+            for size in range(1, min(len(gram) + 1, GRAM_SIZE))
+            for start in range(len(gram) - size + 1)}
+
+
+def _gram_codes(scenarios):
+    """Gram codes of the search fields of scenarios, in text order, and the scenario number of each
+
+    Every field contributes its GRAM_SIZE character n-grams, or itself when it
+    is shorter. Fields are joined with NUL separators so that one pass over the
+    code points of the whole batch finds every gram, and no gram spans two fields.
+    """
+    texts = []
+    owners = []
+    for number, scenario in enumerate(scenarios):
+        fields = [text.lower() for text in scenario.iter_search_fields() if text]
+        texts.extend(fields)
+        owners.extend([number] * len(fields))
+    if not texts:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+    joined = '\x00'.join(texts) + '\x00' * GRAM_SIZE
+    points = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    owner = np.repeat(np.asarray(owners, dtype=np.int64), [len(text) + 1 for text in texts])
+
+    # Each code point past a separator counts as zero
+    codes = points[:len(owner)].copy()
+    present = codes != 0
+    for offset in range(1, GRAM_SIZE):
+        present &= points[offset:offset + len(owner)] != 0
+        codes = codes << np.uint64(CHAR_BITS) | np.where(present, points[offset:offset + len(owner)], 0)
+    first = np.r_[True, points[:len(owner) - 1] == 0]
+    keep = (points[:len(owner)] != 0) & (present | first)
+    return codes[keep], owner[keep]
+
+
+class TextIndex:
+    """Inverted n-gram index over the searchable fields of parent scenarios
+
+    Grams are kept as integer codes (see _gram_code). Adding many scenarios
+    inside batch() collects their grams with a single vectorized pass.
+    """
+
+    def __init__(self):
+        self._postings = {}  # gram code -> parent ids
+        self._grams_by_parent = {}  # parent id -> gram codes indexed for it
+        # Substring shorter than GRAM_SIZE -> gram codes holding it; built on the first short query
+        self._grams_by_part = None
+        self._pending = None  # parent id -> scenario, while a batch is open
+
+    @contextmanager
+    def batch(self):
+        """Index the scenarios added inside the block together when it ends"""
+        self._pending = {}
+        try:
+            yield self
+        finally:
+            pending, self._pending = self._pending, None
+            self._add_many(list(pending.values()))
+
+    def add(self, scenario):
+        """Index (or re-index) a parent scenario"""
+        self.remove(scenario.id)
+        if self._pending is not None:
+            self._pending[scenario.id] = scenario
+        else:
+            self._add_many([scenario])
+
+    def _add_many(self, scenarios):
+        codes, owners = _gram_codes(scenarios)
+        if codes.size == 0:
+            return
+        ids = [scenario.id for scenario in scenarios]
+
+        # Owners ascend, so each scenario's grams are one run
+        numbers, firsts = np.unique(owners, return_index=True)
+        for number, gram_codes in zip(numbers.tolist(), np.split(codes, firsts[1:])):
+            gram_codes = np.sort(gram_codes)
+            distinct = np.empty(len(gram_codes), dtype=bool)
+            distinct[0] = True
+            np.not_equal(gram_codes[1:], gram_codes[:-1], out=distinct[1:])
+            self._grams_by_parent[ids[number]] = gram_codes[distinct]
+
+        # Runs of one gram; a scenario may appear in a run more than once
+        order = np.argsort(codes)
+        codes, owners = codes[order], owners[order]
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            code = int(codes[start])
+            posting = self._postings.get(code)
+            if posting is None:
+                posting = self._postings[code] = set()
+                self._add_parts(code)
+            posting.update(map(ids.__getitem__, owners[start:end].tolist()))
+
+    def remove(self, scenario_id):
+        """Drop a parent scenario from the index"""
+        if self._pending is not None:
+            self._pending.pop(scenario_id, None)
+        grams = self._grams_by_parent.pop(scenario_id, None)
+        if grams is None:
+            return
+
+        for code in grams.tolist():
+            _discard(self._postings, code, scenario_id)
+            if code not in self._postings and self._grams_by_part is not None:
+                for part in _parts(_gram_text(code)):
+                    _discard(self._grams_by_part, part, code)
+
+    def _add_parts(self, code):
+        if self._grams_by_part is not None:
+            for part in _parts(_gram_text(code)):
+                self._grams_by_part[part].add(code)
+
+    def lookup(self, query):
+        """Return (candidate parent ids, exact) for a search query
+
+        When exact is False the candidates are a superset of the matches and
+        must be verified with ParentScenario.matches_search.
+        """
+        query = query.lower()
+
+        if len(query) == GRAM_SIZE:
+            return set(self._postings.get(_gram_code(query), ())), True
+        if len(query) < GRAM_SIZE:
+            if self._grams_by_part is None:
+                self._grams_by_part = defaultdict(set)
+                for code in self._postings:
+                    self._add_parts(code)
+            matches = set(self._postings.get(_gram_code(query), ()))
+            for code in self._grams_by_part.get(query, ()):
+                matches |= self._postings[code]
+            return matches, True
+
+        query_grams = {_gram_code(query[i:i + GRAM_SIZE]) for i in range(len(query) - GRAM_SIZE + 1)}
+        postings = []
+        for code in query_grams:
+            posting = self._postings.get(code)
+            if not posting:
+                return set(), True
+            postings.append(posting)
+
+        # Intersect from the rarest gram upwards to keep the working set small
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+
+        return candidates, False
+
+
+class FacetIndex:
+    """Posting lists and facet counts for domains, tags and CDASH items"""
+
+    def __init__(self):
+        self._parents_by_domain = defaultdict(set)
+        self._parents_by_tag = defaultdict(set)
+        self._children_by_cdash_item = defaultdict(set)
+        # parent id -> (domains, tag names, (cdash item, child id) pairs)
+        self._entries = {}
+
+    def add(self, scenario):
+        """Index (or re-index) the facets of a parent scenario"""
+        self.remove(scenario.id)
+
+        # dicts keep first-seen order while dropping duplicates
+        domains = {}
+        tags = {}
+        cdash_items = []
+
+        if scenario.tag:
+            tags[scenario.tag.name] = None
+        for child in scenario.child_scenarios:
+            for domain in child.domains:
+                domains[domain] = None
+            if child.tag:
+                tags[child.tag.name] = None
+            for item in child.required_cdash_items:
+                cdash_items.append((item, child.id))
+
+        for domain in domains:
+            self._parents_by_domain[domain].add(scenario.id)
+        for tag_name in tags:
+            self._parents_by_tag[tag_name].add(scenario.id)
+        for item, child_id in cdash_items:
+            self._children_by_cdash_item[item].add(child_id)
+
+        self._entries[scenario.id] = (tuple(domains), tuple(tags), tuple(cdash_items))
+
+    def remove(self, scenario_id):
+        """Drop a parent scenario and its children from every posting list"""
+        entry = self._entries.pop(scenario_id, None)
+        if entry is None:
+            return
+
+        domains, tags, cdash_items = entry
+        for domain in domains:
+            _discard(self._parents_by_domain, domain, scenario_id)
+        for tag_name in tags:
+            _discard(self._parents_by_tag, tag_name, scenario_id)
+        for item, child_id in cdash_items:
+            _discard(self._children_by_cdash_item, item, child_id)
+
+    def parents_with_domain(self, domain):
+        """Parent ids with at least one child in the domain"""
+        return self._parents_by_domain.get(domain, set())
+
+    def parents_with_tag(self, tag_name):
+        """Parent ids whose own tag or any child tag has this name"""
+        return self._parents_by_tag.get(tag_name, set())
+
+    def children_with_cdash_item(self, item):
+        """Child ids that require the CDASH item"""
+        return self._children_by_cdash_item.get(item, set())
+
+    def domains_of(self, scenario_id):
+        """Distinct child domains of a parent, in first-seen order"""
+        entry = self._entries.get(scenario_id)
+        return entry[0] if entry else ()
+
+    def tags_of(self, scenario_id):
+        """Distinct parent and child tag names of a parent"""
+        entry = self._entries.get(scenario_id)
+        return entry[1] if entry else ()
+
+    def domain_counts(self):
+        """Number of parent scenarios per domain"""
+        return {domain: len(ids) for domain, ids in self._parents_by_domain.items()}
+
+    def tag_counts(self):
+        """Number of parent scenarios per tag name"""
+        return {tag_name: len(ids) for tag_name, ids in self._parents_by_tag.items()}
+
+    def cdash_item_counts(self):
+        """Number of child scenarios per CDASH item"""
+        return {item: len(ids) for item, ids in self._children_by_cdash_item.items()}
+
+
+def _discard(postings, key, value):
+    """Remove value from postings[key], dropping the key once it is empty"""
+    posting = postings.get(key)
+    if posting is None:
+        return
+    posting.discard(value)
+    if not posting:
+        del postings[key]
@@ -0,0 +1,334 @@
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import g, request
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram bucket bounds in seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STORAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 1)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Interval at which each worker writes its metrics to METRICS_DIR
+FLUSH_SECONDS = 1.0
+
+# Storage methods timed per kind of operation
+STORAGE_OPERATIONS = {
+    'search': ('search_scenarios', 'search_scenarios_page', 'recommend_scenarios', 'get_scenarios_by_domains',
+               'get_child_ids_for_cdash_item'),
+    'lookup': ('get_all_scenarios', 'get_scenario_by_id', 'get_created_scenarios', 'get_many', 'locate_child',
+               'get_all_domains', 'get_all_tags', 'get_facet_counts', 'get_scenario_domains',
+               'get_scenario_tag_names', 'get_version'),
+    'mutation': ('add_scenario', 'update_scenario', 'delete_scenario', 'add_child_scenarios',
+                 'delete_child_scenario', 'toggle_scenario_status'),
+}
+
+
+class _Metric:
+    """A named metric whose values are kept per tuple of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(labels), value] for labels, value in self._values.items()]
+        return {'kind': self.kind, 'help': self.documentation, 'labels': self.labels, 'values': values}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, value, *labels):
+        """Set the total of a counter kept elsewhere, such as the LLM cache's hit counts"""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Observations counted per bucket; each value is [count per bucket..., count above them, sum]"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(labels), list(state)] for labels, state in self._values.items()]
+        return {'kind': self.kind, 'help': self.documentation, 'labels': self.labels,
+                'buckets': self.buckets, 'values': values}
+
+
+class Registry:
+    """The metrics of a process, plus collectors that refresh values kept elsewhere before a snapshot"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'qad_http_requests_total', 'HTTP requests by method, route and status', ('method', 'route', 'status')))
+http_request_seconds = registry.register(Histogram(
+    'qad_http_request_duration_seconds', 'HTTP request latency, streamed bodies included', ('method', 'route')))
+http_requests_in_flight = registry.register(Gauge(
+    'qad_http_requests_in_flight', 'HTTP requests being served', ('method', 'route')))
+storage_operation_seconds = registry.register(Histogram(
+    'qad_storage_operation_duration_seconds', 'Scenario storage call latency', ('kind', 'operation'),
+    buckets=STORAGE_BUCKETS))
+llm_requests = registry.register(Counter(
+    'qad_llm_requests_total', 'Model requests by generator method and outcome (success, error or cached)',
+    ('method', 'outcome')))
+llm_request_seconds = registry.register(Histogram(
+    'qad_llm_request_duration_seconds', 'Model request latency, cache hits excluded', ('method',),
+    buckets=LLM_BUCKETS))
+llm_tokens = registry.register(Counter(
+    'qad_llm_tokens_total', 'Tokens used by model requests', ('method', 'kind')))
+llm_fallbacks = registry.register(Counter(
+    'qad_llm_fallbacks_total', 'Generator calls answered with fallback content after a failure', ('method',)))
+llm_cache_lookups = registry.register(Counter(
+    'qad_llm_cache_lookups_total', 'LLM response cache lookups by result', ('result',)))
+llm_cache_evictions = registry.register(Counter(
+    'qad_llm_cache_evictions_total', 'LLM responses evicted from the disk cache'))
+llm_cache_entries = registry.register(Gauge(
+    'qad_llm_cache_memory_entries', 'LLM responses held in the in-memory cache'))
+
+
+def instrument_storage(storage):
+    """Time the search, lookup and mutation methods of a storage backend; returns the storage"""
+    for kind, operations in STORAGE_OPERATIONS.items():
+        for operation in operations:
+            method = getattr(storage, operation, None)
+            if method is not None:
+                setattr(storage, operation, _timed(method, kind, operation))
+    return storage
+
+
+def _timed(method, kind, operation):
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            storage_operation_seconds.observe(time.perf_counter() - started, kind, operation)
+    timed.__name__ = method.__name__
+    timed.__doc__ = method.__doc__
+    return timed
+
+
+def init_app(app):
+    """Count and time every request of a Flask app"""
+
+    @app.before_request
+    def start_request_metrics():
+        method, rule = request.method, request.url_rule
+        route = rule.rule if rule is not None else 'unmatched'
+        g.metrics_request = (method, route, time.perf_counter())
+        http_requests_in_flight.inc(method, route)
+        if _flusher_pid != os.getpid():
+            _start_flusher()
+
+    @app.after_request
+    def finish_request_metrics_on_close(response):
+        # Recorded when the server closes the response, so streamed bodies are timed whole
+        measured = g.pop('metrics_request', None)
+        if measured is not None:
+            response.call_on_close(lambda: _finish_request(*measured, response.status_code))
+        return response
+
+    @app.teardown_request
+    def finish_failed_request_metrics(error):
+        # Requests that failed before a response was made
+        measured = g.pop('metrics_request', None)
+        if measured is not None:
+            _finish_request(*measured, 500)
+
+
+def _finish_request(method, route, started, status):
+    http_request_seconds.observe(time.perf_counter() - started, method, route)
+    http_requests.inc(method, route, str(status))
+    http_requests_in_flight.dec(method, route)
+
+
+def metrics_dir():
+    """Directory through which worker processes share their metrics, from METRICS_DIR; None keeps them per process"""
+    return os.environ.get('METRICS_DIR') or None
+
+
+_flusher_pid = None
+_flush_lock = threading.Lock()
+
+
+def _start_flusher():
+    """Start writing this process's metrics to METRICS_DIR every FLUSH_SECONDS, once per process"""
+    global _flusher_pid
+    with _flush_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    if metrics_dir() is not None:
+        threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True).start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        flush()
+
+
+def flush():
+    """Write this process's metrics to METRICS_DIR"""
+    directory = metrics_dir()
+    if directory is None:
+        return
+    with _flush_lock:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as f:
+                json.dump(registry.snapshot(), f)
+            os.replace(temporary, os.path.join(directory, f'metrics-{os.getpid()}.json'))
+        except OSError as e:
+            print(f"Writing metrics failed: {e}")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _process_snapshots():
+    """Snapshots of every worker sharing METRICS_DIR, or of this process alone; yields (snapshot, alive)"""
+    directory = metrics_dir()
+    if directory is None:
+        yield registry.snapshot(), True
+        return
+    flush()
+    for name in os.listdir(directory):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        yield snapshot, _alive(int(name[len('metrics-'):-len('.json')]))
+
+
+def _merged():
+    """Metrics summed over processes; gauges of exited processes are dropped, their counts are kept"""
+    merged = {}
+    for snapshot, alive in _process_snapshots():
+        for name, metric in snapshot.items():
+            if metric['kind'] == 'gauge' and not alive:
+                continue
+            values = merged.setdefault(name, dict(metric, values={}))['values']
+            for labels, value in metric['values']:
+                labels = tuple(labels)
+                if metric['kind'] == 'histogram':
+                    previous = values.get(labels)
+                    values[labels] = value if previous is None else [a + b for a, b in zip(previous, value)]
+                else:
+                    values[labels] = values.get(labels, 0) + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, metric in sorted(_merged().items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for labels, value in sorted(metric['values'].items()):
+            if metric['kind'] != 'histogram':
+                lines.append(f"{name}{_label_text(metric['labels'], labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric['buckets']) + [float('inf')], value[:-1]):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{name}_bucket{_label_text(metric['labels'], labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(metric['labels'], labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_label_text(metric['labels'], labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
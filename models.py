@@ -1,41 +1,74 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
+import sys
 import uuid
+from cold_fields import install_cold_fields
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Tag:
-    """Represents a scenario tag"""
+    """Represents a scenario tag; one shared instance per name"""
     name: str
     color: str
     
     @classmethod
     def get_available_tags(cls):
         """Return available tag types with their colors"""
-        return [
-            cls("Safety", "light text-dark"),
-            cls("Efficacy", "light text-dark"),
-            cls("Data Quality", "light text-dark"),
-            cls("Compliance", "light text-dark"),
-            cls("Protocol Deviation", "light text-dark"),
-            cls("Other", "light text-dark")
-        ]
+        return _AVAILABLE_TAGS
+    
+    @classmethod
+    def get(cls, name, default=None):
+        """Return the tag with this name, or default"""
+        return _TAGS_BY_NAME.get(name, default)
+
+_AVAILABLE_TAGS = (
+    Tag("Safety", "light text-dark"),
+    Tag("Efficacy", "light text-dark"),
+    Tag("Data Quality", "light text-dark"),
+    Tag("Compliance", "light text-dark"),
+    Tag("Protocol Deviation", "light text-dark"),
+    Tag("Other", "light text-dark")
+)
+_TAGS_BY_NAME = {tag.name: tag for tag in _AVAILABLE_TAGS}
+
+# Canonical tuples of interned codes, shared by every child with the same items
+_CODE_TUPLES = {}
+
+def intern_codes(codes) -> Tuple[str, ...]:
+    """Return the shared tuple of interned domain / CDASH item codes"""
+    codes = tuple(sys.intern(code) for code in codes)
+    return _CODE_TUPLES.setdefault(codes, codes)
 
-@dataclass
+@dataclass(slots=True)
 class ChildScenario:
     """Represents a child scenario"""
     id: str
     scenario_text: str
-    required_cdash_items: List[str]
-    domains: List[str]
+    required_cdash_items: Tuple[str, ...]
+    domains: Tuple[str, ...]
     tag: Optional[Tag]  # Single tag only
     reasoning_template: str
     pseudo_code: str = ""
     version: str = "1.0"
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
+    
+    def __post_init__(self):
+        self.required_cdash_items = intern_codes(self.required_cdash_items)
+        self.domains = intern_codes(self.domains)
+    
+    def matches_search(self, query: str) -> bool:
+        """Check if this child's text, CDASH items, domains or tag match a search query"""
+        query = query.lower()
+        texts = [self.scenario_text, self.reasoning_template, *self.required_cdash_items, *self.domains]
+        if self.tag:
+            texts.append(self.tag.name)
+        return any(query in text.lower() for text in texts)
 
-@dataclass
+# reasoning_template / pseudo_code may be stored as offsets into a shared string heap
+install_cold_fields(ChildScenario)
+
+@dataclass(slots=True)
 class ParentScenario:
     """Represents a parent scenario"""
     id: str
@@ -53,30 +86,25 @@ class ParentScenario:
         """Get the primary tag for this scenario"""
         return self.tag
     
+    def iter_search_fields(self):
+        """Yield every text field that free-text search looks at"""
+        yield self.name
+        yield self.description
+
+        for child in self.child_scenarios:
+            yield child.scenario_text
+            yield child.reasoning_template
+            yield from child.required_cdash_items
+            yield from child.domains
+
+        if self.tag:
+            yield self.tag.name
+
+        for child in self.child_scenarios:
+            if child.tag:
+                yield child.tag.name
+
     def matches_search(self, query: str) -> bool:
         """Check if scenario matches search query"""
         query = query.lower()
-        
-        # Search in parent fields
-        if (query in self.name.lower() or 
-            query in self.description.lower()):
-            return True
-        
-        # Search in child scenarios
-        for child in self.child_scenarios:
-            if (query in child.scenario_text.lower() or
-                query in child.reasoning_template.lower() or
-                any(query in item.lower() for item in child.required_cdash_items) or
-                any(query in domain.lower() for domain in child.domains)):
-                return True
-        
-        # Search in parent tag
-        if self.tag and query in self.tag.name.lower():
-            return True
-            
-        # Search in child tags
-        for child in self.child_scenarios:
-            if child.tag and query in child.tag.name.lower():
-                return True
-        
-        return False
+        return any(query in text.lower() for text in self.iter_search_fields())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Compile the OOTB scenario catalogue into a binary snapshot
+
+processed_ootb_scenarios.json is turned into compact records with tags
+resolved to indexes into Tag.get_available_tags() and deterministic uuid5
+ids, then marshalled behind a small versioned header. The cold text fields
+(reasoning_template, pseudo_code) follow the records as a UTF-8 string
+section that the records address by (offset, length), so workers started
+with OOTB_COLD_FIELDS=mmap can leave them memory-mapped instead of loading
+them. Workers load the snapshot in one pass; if it is missing, from another
+format version, or was built from a different JSON file or tag list, they
+fall back to the JSON.
+
+Usage: python ootb_snapshot.py [json path] [snapshot path]
+"""
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+import tempfile
+import uuid
+from collections import Counter
+
+from models import ChildScenario, ParentScenario, Tag
+from cold_fields import ColdRef, StringHeap, map_cold_fields_enabled
+
+OOTB_JSON_PATH = 'processed_ootb_scenarios.json'
+DEFAULT_SNAPSHOT_PATH = 'processed_ootb_scenarios.snapshot'
+
+SNAPSHOT_MAGIC = b'QADS'
+SNAPSHOT_VERSION = 2
+# magic, format version, marshal version, sha256 of the source JSON,
+# records length, string section length
+_HEADER = struct.Struct('<4sHH32sQQ')
+
+# Namespace for OOTB scenario ids, so ids survive restarts and match across workers
+OOTB_NAMESPACE = uuid.UUID('6f1c3a52-9d0e-5b8a-a4f7-2c6e8d1b0f93')
+
+# Substrings checked in order against the stored "Tag(name=..., ...)" strings
+_TAG_PRIORITY = ('Safety', 'Compliance', 'Data Quality', 'Efficacy', 'Protocol Deviation')
+
+
+def snapshot_path():
+    """Snapshot location from OOTB_SNAPSHOT_PATH; an empty value disables snapshots"""
+    return os.environ.get('OOTB_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH) or None
+
+
+def ootb_json_path():
+    """Catalogue JSON location from OOTB_JSON_PATH, by default the shipped catalogue"""
+    return os.environ.get('OOTB_JSON_PATH') or OOTB_JSON_PATH
+
+
+def _tag_names():
+    return tuple(tag.name for tag in Tag.get_available_tags())
+
+
+def _resolve_tag_id(tag_str, tag_ids):
+    """Map a stored tag string to its index in Tag.get_available_tags()"""
+    for name in _TAG_PRIORITY:
+        if name in tag_str:
+            return tag_ids[name]
+    return tag_ids['Other']
+
+
+def compile_ootb_records(raw_scenarios):
+    """Turn the raw OOTB JSON into records with resolved tags and stable ids
+
+    Parent records are (id, name, description, tag id, children) and child
+    records are (id, scenario text, CDASH items, domains, tag id, reasoning
+    template, pseudo code); tag ids index Tag.get_available_tags(). Ids are
+    derived from names and texts (numbered when repeated) rather than from
+    positions, so unrelated edits to the catalogue do not shift them.
+    """
+    tag_ids = {name: index for index, name in enumerate(_tag_names())}
+    parent_occurrences = Counter()
+
+    records = []
+    for scenario_data in raw_scenarios:
+        name = scenario_data.get("name", "")
+        parent_occurrences[name] += 1
+        parent_id = uuid.uuid5(OOTB_NAMESPACE, f"parent:{name}#{parent_occurrences[name]}")
+
+        child_occurrences = Counter()
+        children = []
+        for child_data in scenario_data.get("children", []):
+            scenario_text = child_data.get("scenario_text", "")
+            child_occurrences[scenario_text] += 1
+            child_id = uuid.uuid5(parent_id, f"child:{scenario_text}#{child_occurrences[scenario_text]}")
+            children.append((
+                str(child_id),
+                scenario_text,
+                tuple(child_data.get("required_cdash_items", [])),
+                tuple(child_data.get("domains", [])),
+                _resolve_tag_id(child_data.get("tag", ""), tag_ids),
+                child_data.get("reasoning_template", ""),
+                child_data.get("pseudo_code", ""),
+            ))
+
+        records.append((
+            str(parent_id),
+            name,
+            scenario_data.get("description", ""),
+            _resolve_tag_id(scenario_data.get("tag", ""), tag_ids),
+            tuple(children),
+        ))
+    return records
+
+
+def build_snapshot(json_path=OOTB_JSON_PATH, path=DEFAULT_SNAPSHOT_PATH):
+    """Compile json_path into a snapshot at path, replacing it atomically"""
+    with open(json_path, 'rb') as f:
+        source = f.read()
+    records = compile_ootb_records(json.loads(source))
+    _write_snapshot(path, hashlib.sha256(source).digest(), records)
+    return records
+
+
+def _write_snapshot(path, source_digest, records):
+    # Child records end with the cold fields; swap them for string section spans
+    strings = bytearray()
+    hot_records = []
+    for parent_id, name, description, tag_id, children in records:
+        hot_children = []
+        for child in children:
+            spans = []
+            for text in child[5:]:
+                data = text.encode('utf-8')
+                spans.append((len(strings), len(data)))
+                strings += data
+            hot_children.append(child[:5] + tuple(spans))
+        hot_records.append((parent_id, name, description, tag_id, tuple(hot_children)))
+
+    payload = marshal.dumps((_tag_names(), tuple(hot_records)))
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, marshal.version, source_digest,
+                          len(payload), len(strings))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.ootb-snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+            f.write(strings)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _read_snapshot(path, source_digest, map_cold_fields):
+    """Records from a snapshot, or None when it is missing or stale
+
+    With map_cold_fields the cold fields are ColdRefs into a memory map of
+    the snapshot rather than strings.
+    """
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+
+    with f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        magic, version, marshal_version, digest, payload_length, strings_length = _HEADER.unpack(header)
+        if (magic, version, marshal_version, digest) != (SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                                         marshal.version, source_digest):
+            return None
+        strings_start = _HEADER.size + payload_length
+        if os.fstat(f.fileno()).st_size != strings_start + strings_length:
+            return None
+
+        try:
+            tag_names, hot_records = marshal.loads(f.read(payload_length))
+        except (EOFError, ValueError, TypeError):
+            return None
+        if tag_names != _tag_names():
+            return None
+
+        if map_cold_fields:
+            heap = StringHeap(f)
+
+            def cold_value(span):
+                return ColdRef(heap, strings_start + span[0], span[1])
+        else:
+            strings = f.read(strings_length)
+
+            def cold_value(span):
+                return str(strings[span[0]:span[0] + span[1]], 'utf-8')
+
+    return [
+        (parent_id, name, description, tag_id, tuple(
+            child[:5] + tuple(cold_value(span) for span in child[5:])
+            for child in children
+        ))
+        for parent_id, name, description, tag_id, children in hot_records
+    ]
+
+
+def load_ootb_records(json_path=None, path=None, map_cold_fields=None):
+    """Return (records, source) for the OOTB catalogue, source being 'snapshot' or 'json'
+
+    A stale or missing snapshot is rebuilt from the JSON so the next start
+    can use it. map_cold_fields defaults to the OOTB_COLD_FIELDS setting and
+    only applies to records read from a snapshot.
+    """
+    if json_path is None:
+        json_path = ootb_json_path()
+    if path is None:
+        path = snapshot_path()
+    if map_cold_fields is None:
+        map_cold_fields = map_cold_fields_enabled()
+
+    try:
+        with open(json_path, 'rb') as f:
+            source = f.read()
+    except FileNotFoundError:
+        print("Error: Excel scenario data not found")
+        return [], 'json'
+
+    source_digest = hashlib.sha256(source).digest()
+    if path:
+        records = _read_snapshot(path, source_digest, map_cold_fields)
+        if records is not None:
+            return records, 'snapshot'
+
+    records = compile_ootb_records(json.loads(source))
+    if path:
+        try:
+            _write_snapshot(path, source_digest, records)
+        except OSError as e:
+            print(f"Could not write OOTB snapshot {path}: {e}")
+        else:
+            if map_cold_fields:
+                records = _read_snapshot(path, source_digest, True) or records
+    return records, 'json'
+
+
+def load_ootb_scenarios(map_cold_fields=None):
+    """Build the OOTB ParentScenario objects from the snapshot (or its JSON source)"""
+    available_tags = Tag.get_available_tags()
+    records, _ = load_ootb_records(map_cold_fields=map_cold_fields)
+
+    scenarios = []
+    for parent_id, name, description, tag_id, children in records:
+        child_scenarios = [
+            ChildScenario(
+                id=child_id,
+                scenario_text=scenario_text,
+                required_cdash_items=required_cdash_items,
+                domains=domains,
+                tag=available_tags[child_tag_id],
+                reasoning_template=reasoning_template,
+                pseudo_code=pseudo_code
+            )
+            for child_id, scenario_text, required_cdash_items, domains, child_tag_id,
+                reasoning_template, pseudo_code in children
+        ]
+        
+        scenarios.append(ParentScenario(
+            id=parent_id,
+            name=name,
+            description=description,
+            is_active=True,
+            is_ootb=True,
+            child_scenarios=child_scenarios,
+            tag=available_tags[tag_id]
+        ))
+    return scenarios
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else ootb_json_path()
+    path = sys.argv[2] if len(sys.argv) > 2 else (snapshot_path() or DEFAULT_SNAPSHOT_PATH)
+    records = build_snapshot(json_path, path)
+    print(f"Wrote {path}: {len(records)} parent scenarios, "
+          f"{sum(len(record[4]) for record in records)} child scenarios")
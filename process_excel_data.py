@@ -6,6 +6,7 @@ import json
 import ast
 from collections import defaultdict
 from models import Tag
+from ootb_snapshot import build_snapshot, snapshot_path, DEFAULT_SNAPSHOT_PATH
 
 def process_excel_scenarios():
     """Convert Excel data to OOTB scenarios format"""
@@ -136,4 +137,7 @@ if __name__ == "__main__":
     
     print(f"Processed {len(scenarios)} parent scenarios")
     total_children = sum(len(s['children']) for s in scenarios)
-    print(f"Total child scenarios: {total_children}")
\ No newline at end of file
+    print(f"Total child scenarios: {total_children}")
+    
+    # Recompile the startup snapshot so workers do not fall back to the JSON
+    build_snapshot('processed_ootb_scenarios.json', snapshot_path() or DEFAULT_SNAPSHOT_PATH)
\ No newline at end of file
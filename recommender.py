@@ -0,0 +1,249 @@
+import bisect
+import heapq
+import itertools
+
+import numpy as np
+
+# Points per matched domain / tag, as used by the recommendation tab
+DOMAIN_WEIGHT = 25
+TAG_WEIGHT = 15
+MAX_SCORE = 100
+
+# study type -> (features, points, reason)
+STUDY_TYPE_BONUSES = {
+    'phase1': ((('tag', 'Safety'),), 20, "Critical for early-phase safety monitoring"),
+    'phase2': ((('tag', 'Safety'),), 20, "Critical for early-phase safety monitoring"),
+    'phase3': ((('tag', 'Efficacy'),), 20, "Essential for confirmatory efficacy studies"),
+    'observational': ((('tag', 'Data Quality'),), 15, "Important for observational data integrity"),
+}
+
+# therapeutic area -> (features, points, reason); any listed feature qualifies
+THERAPEUTIC_AREA_BONUSES = {
+    'oncology': ((('domain', 'AE'), ('tag', 'Safety')), 15, "Critical for oncology safety monitoring"),
+    'cardiology': ((('domain', 'VS'), ('domain', 'EG')), 15, "Essential for cardiovascular assessments"),
+    'neurology': ((('domain', 'AE'), ('domain', 'MH')), 15, "Important for neurological safety tracking"),
+}
+
+# data quality focus flag -> (features, points, reason)
+FOCUS_BONUSES = {
+    'critical_endpoints': ((('tag', 'Efficacy'),), 10, "Supports critical endpoint validation"),
+    'regulatory_compliance': ((('tag', 'Compliance'),), 10, "Enhances regulatory compliance"),
+    'safety_monitoring': ((('tag', 'Safety'), ('domain', 'AE')), 10, "Strengthens safety monitoring"),
+}
+
+COMPREHENSIVE_MIN_CHILDREN = 3
+COMPREHENSIVE_BONUS = 5
+
+
+class RecommendationEngine:
+    """Scores scenarios for the recommendation tab as NumPy bitmap matrices
+
+    A score only depends on a scenario's distinct domains and tag names and on
+    whether it has enough children for the coverage bonus, so scenarios that
+    share those features share one profile row of a profile x feature bitmap
+    matrix. A request turns the selected domains/tags and every applicable
+    bonus rule into the columns of a small weight matrix, so scoring is one
+    matrix product over the profiles. Each profile keeps the listing
+    positions of its active scenarios sorted, and the top-k rows are taken by
+    lazily merging those lists in score order; reasons are only built for the
+    rows that are returned. Request cost therefore tracks the number of
+    distinct profiles and k rather than the catalogue size.
+    """
+
+    def __init__(self, initial_profiles=16, initial_features=16):
+        self._features = np.zeros((initial_profiles, initial_features), dtype=np.float32)
+        self._comprehensive = np.zeros(initial_profiles, dtype=bool)
+        self._member_counts = np.zeros(initial_profiles, dtype=np.int64)
+        self._members = []  # profile -> sorted sequences of its active scenarios
+        self._profiles = {}  # (feature columns, comprehensive) -> profile
+        self._columns = {}  # ('domain' | 'tag', name) -> column
+        self._column_names = []
+        self._entries = {}  # scenario id -> (profile, sequence, is_active)
+        self._ids_by_sequence = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, scenario_id, domains, tag_names, child_count, is_active, sequence):
+        """Add (or replace) a scenario"""
+        self.remove(scenario_id)
+
+        columns = {self._column(('domain', domain)) for domain in domains}
+        columns |= {self._column(('tag', tag_name)) for tag_name in tag_names}
+        profile = self._profile(tuple(sorted(columns)), child_count >= COMPREHENSIVE_MIN_CHILDREN)
+
+        self._entries[scenario_id] = (profile, sequence, is_active)
+        self._ids_by_sequence[sequence] = scenario_id
+        if is_active:
+            self._add_member(profile, sequence)
+
+    def remove(self, scenario_id):
+        """Drop a scenario"""
+        entry = self._entries.pop(scenario_id, None)
+        if entry is None:
+            return
+        profile, sequence, is_active = entry
+        del self._ids_by_sequence[sequence]
+        if is_active:
+            self._remove_member(profile, sequence)
+
+    def set_active(self, scenario_id, is_active):
+        """Update the active flag of a scenario"""
+        entry = self._entries.get(scenario_id)
+        if entry is None or entry[2] == is_active:
+            return
+        profile, sequence, _ = entry
+        self._entries[scenario_id] = (profile, sequence, is_active)
+        if is_active:
+            self._add_member(profile, sequence)
+        else:
+            self._remove_member(profile, sequence)
+
+    def recommend(self, selected_domains, selected_tags, study_type='', therapeutic_area='',
+                  critical_endpoints=False, regulatory_compliance=False, safety_monitoring=False,
+                  limit=None):
+        """Score active scenarios and return (total matches, top results)
+
+        Results are (scenario id, score, reasons) tuples ordered by score,
+        then listing order, matching the previous sort of all matches.
+        """
+        selected_domains = list(dict.fromkeys(selected_domains))
+        selected_tags = list(dict.fromkeys(selected_tags))
+
+        rules = []
+        if study_type in STUDY_TYPE_BONUSES:
+            rules.append(STUDY_TYPE_BONUSES[study_type])
+        if therapeutic_area in THERAPEUTIC_AREA_BONUSES:
+            rules.append(THERAPEUTIC_AREA_BONUSES[therapeutic_area])
+        focus = {
+            'critical_endpoints': critical_endpoints,
+            'regulatory_compliance': regulatory_compliance,
+            'safety_monitoring': safety_monitoring,
+        }
+        rules += [FOCUS_BONUSES[name] for name, enabled in focus.items() if enabled]
+
+        # Column 0 holds the match weights, column i + 1 indicates rule i
+        weights = np.zeros((self._features.shape[1], len(rules) + 1), dtype=np.float32)
+        for domain in selected_domains:
+            self._set_weight(weights, ('domain', domain), 0, DOMAIN_WEIGHT)
+        for tag_name in selected_tags:
+            self._set_weight(weights, ('tag', tag_name), 0, TAG_WEIGHT)
+        for i, (features, _, _) in enumerate(rules, start=1):
+            for feature in features:
+                self._set_weight(weights, feature, i, 1)
+
+        n = len(self._members)
+        products = self._features[:n] @ weights
+        scores = products[:, 0]
+        rule_masks = [products[:, i] > 0 for i in range(1, len(rules) + 1)]
+        for mask, (_, points, _) in zip(rule_masks, rules):
+            scores += mask * np.float32(points)
+        comprehensive = self._comprehensive[:n]
+        scores += comprehensive * np.float32(COMPREHENSIVE_BONUS)
+        scores = np.minimum(scores, MAX_SCORE).astype(np.int64)
+
+        eligible = np.flatnonzero((scores > 0) & (self._member_counts[:n] > 0))
+        total = int(self._member_counts[eligible].sum())
+        if limit is None:
+            limit = total
+
+        # Walk profiles from the highest score down; profiles that tie are
+        # merged on listing position so ties keep catalogue order
+        eligible = eligible[np.argsort(-scores[eligible], kind='stable')]
+        group_starts = np.flatnonzero(np.diff(scores[eligible])) + 1
+        selected = []
+        for group in np.split(eligible, group_starts):
+            if len(selected) >= limit:
+                break
+            tied = heapq.merge(*[_tagged(self._members[profile], profile) for profile in group.tolist()])
+            selected.extend(itertools.islice(tied, limit - len(selected)))
+
+        reasons_by_profile = {}
+        results = []
+        for sequence, profile in selected:
+            if profile not in reasons_by_profile:
+                reasons_by_profile[profile] = self._reasons(profile, selected_domains, selected_tags,
+                                                            rules, rule_masks, comprehensive)
+            results.append((self._ids_by_sequence[sequence], int(scores[profile]),
+                            list(reasons_by_profile[profile])))
+        return total, results
+
+    def _reasons(self, profile, selected_domains, selected_tags, rules, rule_masks, comprehensive):
+        """Explain the score of one profile"""
+        reasons = []
+        domain_matches = [d for d in selected_domains if self._has_feature(profile, ('domain', d))]
+        if domain_matches:
+            reasons.append(f"Primary domain alignment: {', '.join(domain_matches)}")
+        tag_matches = [t for t in selected_tags if self._has_feature(profile, ('tag', t))]
+        if tag_matches:
+            reasons.append(f"Risk category match: {', '.join(tag_matches)}")
+        for mask, (_, _, reason) in zip(rule_masks, rules):
+            if mask[profile]:
+                reasons.append(reason)
+        if comprehensive[profile]:
+            reasons.append("Comprehensive validation coverage")
+        return reasons
+
+    def _has_feature(self, profile, feature):
+        column = self._columns.get(feature)
+        return column is not None and self._features[profile, column] > 0
+
+    def _set_weight(self, weights, feature, rule, value):
+        column = self._columns.get(feature)
+        if column is not None:
+            weights[column, rule] = value
+
+    def _add_member(self, profile, sequence):
+        members = self._members[profile]
+        if not members or members[-1] < sequence:
+            members.append(sequence)
+        else:
+            bisect.insort(members, sequence)
+        self._member_counts[profile] += 1
+
+    def _remove_member(self, profile, sequence):
+        members = self._members[profile]
+        del members[bisect.bisect_left(members, sequence)]
+        self._member_counts[profile] -= 1
+
+    def _column(self, feature):
+        """Column for a feature, growing the matrix for unseen features"""
+        column = self._columns.get(feature)
+        if column is None:
+            column = len(self._column_names)
+            if column == self._features.shape[1]:
+                grown = np.zeros((self._features.shape[0], column * 2), dtype=np.float32)
+                grown[:, :column] = self._features
+                self._features = grown
+            self._columns[feature] = column
+            self._column_names.append(feature)
+        return column
+
+    def _profile(self, columns, comprehensive):
+        """Row for a feature profile, creating it (and growing the matrix) if new"""
+        key = (columns, comprehensive)
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = len(self._members)
+            capacity = self._features.shape[0]
+            if profile == capacity:
+                self._features = _grow_rows(self._features, capacity * 2)
+                self._comprehensive = _grow_rows(self._comprehensive, capacity * 2)
+                self._member_counts = _grow_rows(self._member_counts, capacity * 2)
+            self._features[profile, list(columns)] = 1.0
+            self._comprehensive[profile] = comprehensive
+            self._members.append([])
+            self._profiles[key] = profile
+        return profile
+
+
+def _tagged(sequences, profile):
+    """Pair each sequence with its profile for heapq.merge"""
+    return ((sequence, profile) for sequence in sequences)
+
+
+def _grow_rows(array, rows):
+    """Copy array into a zeroed array with more rows"""
+    grown = np.zeros((rows,) + array.shape[1:], dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
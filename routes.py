@@ -1,57 +1,167 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, make_response
+from flask import (render_template, request, redirect, url_for, flash, jsonify, make_response, Response, session,
+                   stream_with_context, get_flashed_messages)
 from app import app
-from data import storage
+from data import storage, parse_scenario_sort, SCENARIO_PAGE_SIZE, MAX_SCENARIO_PAGE_SIZE
 from models import ParentScenario, ChildScenario, Tag
-from ai_generator import scenario_generator, ScenarioGenerator
+from ai_generator import scenario_generator, MAX_CONCURRENCY
+from dry_run import dry_run_engine
+from exporter import (EXPORT_FORMATS, iter_export_records, parquet_available, stream_csv, stream_jsonl, stream_parquet,
+                      stream_records_csv)
+from findings_store import DEFAULT_PAGE_SIZE
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render as render_metrics
 import uuid
 import json
-import csv
-import io
+import functools
+import hashlib
+import os
 from datetime import datetime
 
+# Maximum number of recommendations rendered on the recommendation tab
+RECOMMENDATION_LIMIT = 50
+
+def release_fingerprint():
+    """Digest of the modification times of the modules, templates and static files, so a deploy changes every ETag"""
+    paths = [os.path.join(app.root_path, name) for name in os.listdir(app.root_path) if name.endswith('.py')]
+    for folder in (app.template_folder, app.static_folder):
+        for directory, _, files in os.walk(os.path.join(app.root_path, folder)):
+            paths.extend(os.path.join(directory, name) for name in files)
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        status = os.stat(path)
+        digest.update(f'{path}:{status.st_mtime_ns}:{status.st_size}'.encode())
+    return digest.hexdigest()
+
+RELEASE = release_fingerprint()
+
+def storage_etag():
+    """Strong ETag of a read response: the release, the storage version and the whole request"""
+    key = json.dumps([RELEASE, storage.get_version(), request.method, request.full_path,
+                      request.get_data(as_text=True)])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def conditional(view):
+    """Answer If-None-Match with 304 while the storage has not changed, without running the view
+
+    Responses carry a strong ETag and must be revalidated before reuse. A
+    request with flash messages pending, or whose view flashes one, is served
+    in full and without an ETag, since the page shows them only once.
+    """
+    @functools.wraps(view)
+    def conditional_view(*args, **kwargs):
+        if '_flashes' in session:
+            return view(*args, **kwargs)
+        etag = storage_etag()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            # Messages the view flashed are still in the session, or already rendered by it
+            if response.status_code != 200 or '_flashes' in session or get_flashed_messages():
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return conditional_view
+
+def scenario_listing(args):
+    """Search filters, sort and page of a scenario listing request; ValueError when one is invalid"""
+    sort, descending = parse_scenario_sort(args.get('sort'))
+    try:
+        offset = int(args.get('offset', 0))
+        limit = int(args.get('limit', SCENARIO_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('offset and limit must be integers')
+    if offset < 0 or limit < 1:
+        raise ValueError('offset must not be negative and limit must be positive')
+    return {
+        'query': args.get('search', ''),
+        'tag_filter': args.get('tag') or None,
+        'domain_filter': args.get('domain') or None,
+        'active_only': args.get('active_only', 'false').lower() == 'true',
+        'sort': sort,
+        'descending': descending,
+        'offset': offset,
+        'limit': min(limit, MAX_SCENARIO_PAGE_SIZE)
+    }
+
+def scenario_table_context(listing):
+    """Template variables of the scenario tables: one page of the search results and the created scenarios"""
+    total, scenarios = storage.search_scenarios_page(**listing)
+    return {
+        'scenarios': scenarios,
+        'scenario_total': total,
+        'scenario_offset': listing['offset'],
+        'scenario_limit': listing['limit'],
+        'scenario_sort': ('-' if listing['descending'] else '') + listing['sort'],
+        # Parents whose match is in a child, expanded by the page after a search
+        'child_match_ids': {scenario.id for scenario in scenarios
+                            if listing['query'] and any(child.matches_search(listing['query'])
+                                                        for child in scenario.child_scenarios)},
+        'created_scenarios': storage.get_created_scenarios(),
+        'available_tags': Tag.get_available_tags(),
+        'all_domains': storage.get_all_domains(),
+        'all_tags': storage.get_all_tags(),
+        'search_query': listing['query'],
+        'tag_filter': listing['tag_filter'] or '',
+        'domain_filter': listing['domain_filter'] or '',
+        'active_only': listing['active_only']
+    }
+
 @app.route('/')
+@conditional
 def index():
     """Main page with tabbed interface"""
-    # Get filter parameters
-    search_query = request.args.get('search', '')
-    tag_filter = request.args.get('tag', '')
-    domain_filter = request.args.get('domain', '')
-    active_only = request.args.get('active_only', 'false').lower() == 'true'
-    tab = request.args.get('tab', 'drp')
-    
-    # Get scenarios based on filters
-    scenarios = storage.search_scenarios(
-        query=search_query,
-        tag_filter=tag_filter if tag_filter else None,
-        domain_filter=domain_filter if domain_filter else None,
-        active_only=active_only
-    )
-    
-    # Get all unique domains and tags for filters
-    all_domains = set()
-    all_tags = set()
-    
-    for scenario in storage.get_all_scenarios():
-        for child in scenario.child_scenarios:
-            all_domains.update(child.domains)
-        # Add parent tag
-        if scenario.tag:
-            all_tags.add(scenario.tag.name)
-        # Add child tags
-        for child in scenario.child_scenarios:
-            if child.tag:
-                all_tags.add(child.tag.name)
+    # One page of the filtered scenarios; child rows are fetched when a parent is expanded
+    try:
+        listing = scenario_listing(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        listing = scenario_listing({})
     
     return render_template('index.html',
-                         scenarios=scenarios,
-                         available_tags=Tag.get_available_tags(),
-                         all_domains=sorted(list(all_domains)),
-                         all_tags=sorted(list(all_tags)),
-                         current_tab=tab,
-                         search_query=search_query,
-                         tag_filter=tag_filter,
-                         domain_filter=domain_filter,
-                         active_only=active_only)
+                         current_tab=request.args.get('tab', 'drp'),
+                         **scenario_table_context(listing))
+
+@app.route('/scenario_children/<scenario_id>')
+@conditional
+def scenario_children(scenario_id):
+    """Child rows of a scenario table parent, rendered when the parent is first expanded"""
+    scenario = storage.get_scenario_by_id(scenario_id)
+    if not scenario:
+        return jsonify({'error': 'Scenario not found'}), 404
+    return render_template('components/scenario_children.html', scenario=scenario)
+
+@app.route('/api/scenarios')
+@conditional
+def api_scenarios():
+    """API endpoint returning one page of the filtered, sorted scenarios without their child scenarios"""
+    try:
+        listing = scenario_listing(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    total, scenarios = storage.search_scenarios_page(**listing)
+    end = listing['offset'] + len(scenarios)
+    return jsonify({
+        'scenarios': [
+            {
+                'id': scenario.id,
+                'name': scenario.name,
+                'description': scenario.description,
+                'tag': scenario.tag.name if scenario.tag else None,
+                'is_active': scenario.is_active,
+                'is_ootb': scenario.is_ootb,
+                'child_count': len(scenario.child_scenarios),
+                'domains': list(storage.get_scenario_domains(scenario.id)),
+                'updated_at': scenario.updated_at.isoformat()
+            }
+            for scenario in scenarios
+        ],
+        'total': total,
+        'offset': listing['offset'],
+        'limit': listing['limit'],
+        'next_offset': end if end < total else None,
+        'sort': ('-' if listing['descending'] else '') + listing['sort']
+    })
 
 @app.route('/toggle_scenario/<scenario_id>', methods=['POST'])
 def toggle_scenario(scenario_id):
@@ -82,8 +192,7 @@ def create_scenario():
             return redirect(url_for('index', tab='create'))
         
         # Create tag
-        available_tags = Tag.get_available_tags()
-        selected_tag = next((tag for tag in available_tags if tag.name == tag_name), None)
+        selected_tag = Tag.get(tag_name)
         
         # Handle selected child scenarios from AI suggestions
         selected_children_json = request.form.get('selected_children', '[]')
@@ -96,13 +205,10 @@ def create_scenario():
             
             if selected_indices and suggestions_data:
                 # Create child scenario objects from selected suggestions
-                available_tags = Tag.get_available_tags()
                 for index in selected_indices:
                     if index < len(suggestions_data):
                         scenario_data = suggestions_data[index]
-                        child_tag = None
-                        if scenario_data.get('tag'):
-                            child_tag = next((tag for tag in available_tags if tag.name == scenario_data['tag']), None)
+                        child_tag = Tag.get(scenario_data.get('tag'))
                         
                         child_scenario = ChildScenario(
                             id=str(uuid.uuid4()),
@@ -164,13 +270,12 @@ def edit_scenario(scenario_id):
             return redirect(url_for('index', tab='create'))
         
         # Update scenario
-        available_tags = Tag.get_available_tags()
-        selected_tag = next((tag for tag in available_tags if tag.name == tag_name), None)
+        selected_tag = Tag.get(tag_name)
         
         scenario.name = name
         scenario.description = description
         scenario.tag = selected_tag
-        scenario.updated_at = datetime.now()
+        storage.update_scenario(scenario_id, scenario)
         
         flash(f'Scenario "{name}" updated successfully.', 'success')
         
@@ -220,8 +325,7 @@ def add_child_scenario(parent_id):
             return redirect(url_for('index', tab='create'))
         
         # Create tag
-        available_tags = Tag.get_available_tags()
-        selected_tag = next((tag for tag in available_tags if tag.name == tag_name), None)
+        selected_tag = Tag.get(tag_name)
         
         # Create child scenario
         child_scenario = ChildScenario(
@@ -234,8 +338,7 @@ def add_child_scenario(parent_id):
             pseudo_code=""
         )
         
-        parent.child_scenarios.append(child_scenario)
-        parent.updated_at = datetime.now()
+        storage.add_child_scenarios(parent_id, [child_scenario])
         
         flash('Child scenario added successfully.', 'success')
         
@@ -254,12 +357,8 @@ def delete_child_scenario(parent_id, child_id):
             return redirect(url_for('index', tab='create'))
         
         # Find and remove child scenario
-        for i, child in enumerate(parent.child_scenarios):
-            if child.id == child_id:
-                del parent.child_scenarios[i]
-                parent.updated_at = datetime.now()
-                flash('Child scenario deleted successfully.', 'success')
-                break
+        if storage.delete_child_scenario(parent_id, child_id):
+            flash('Child scenario deleted successfully.', 'success')
         else:
             flash('Child scenario not found.', 'error')
             
@@ -269,48 +368,43 @@ def delete_child_scenario(parent_id, child_id):
     return redirect(url_for('index', tab='create'))
 
 @app.route('/export_scenarios')
+@conditional
 def export_scenarios():
-    """Export scenarios to CSV"""
+    """Stream scenarios as CSV, JSON Lines or Parquet, optionally filtered"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        flash(f'Unsupported export format: {export_format}', 'error')
+        return redirect(url_for('index'))
+    if export_format == 'parquet' and not parquet_available():
+        flash('Parquet export requires the pyarrow package.', 'error')
+        return redirect(url_for('index'))
+    
     try:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Parent ID', 'Parent Name', 'Parent Description', 'Parent Tags',
-            'Is Active', 'Is OOTB', 'Child ID', 'Child Scenario Text',
-            'Required CDASH Items', 'Domains', 'Child Tags', 'Reasoning Template'
-        ])
-        
-        # Write data
-        for parent in storage.get_all_scenarios():
-            parent_tags = ', '.join([tag.name for tag in parent.tags])
-            
-            if parent.child_scenarios:
-                for child in parent.child_scenarios:
-                    child_tags = ', '.join([tag.name for tag in child.tags])
-                    writer.writerow([
-                        parent.id, parent.name, parent.description, parent_tags,
-                        parent.is_active, parent.is_ootb, child.id, child.scenario_text,
-                        ', '.join(child.required_cdash_items), ', '.join(child.domains),
-                        child_tags, child.reasoning_template
-                    ])
-            else:
-                writer.writerow([
-                    parent.id, parent.name, parent.description, parent_tags,
-                    parent.is_active, parent.is_ootb, '', '', '', '', '', ''
-                ])
-        
-        # Create response
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename=qad_scenarios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        
-        return response
-        
+        # Same filters as the scenario list; the result only holds references,
+        # rows are serialized while the response is being sent
+        scenarios = storage.search_scenarios(
+            query=request.args.get('search', ''),
+            tag_filter=request.args.get('tag') or None,
+            domain_filter=request.args.get('domain') or None,
+            active_only=request.args.get('active_only', 'false').lower() == 'true'
+        )
     except Exception as e:
         flash(f'Error exporting scenarios: {str(e)}', 'error')
         return redirect(url_for('index'))
+    
+    records = iter_export_records(scenarios)
+    if export_format == 'csv':
+        chunks = stream_csv(records)
+    elif export_format == 'jsonl':
+        chunks = stream_jsonl(records)
+    else:
+        chunks = stream_parquet(records)
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f'qad_scenarios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
 
 @app.route('/dry_run/<scenario_id>')
 def dry_run_scenario(scenario_id):
@@ -320,30 +414,165 @@ def dry_run_scenario(scenario_id):
         flash('Scenario not found.', 'error')
         return redirect(url_for('index'))
     
-    # Simulate dry run results
-    results = {
-        'scenario_id': scenario_id,
-        'scenario_name': scenario.name,
-        'status': 'success',
-        'total_checks': len(scenario.child_scenarios),
-        'passed_checks': len(scenario.child_scenarios),
-        'failed_checks': 0,
-        'warnings': [],
-        'details': []
-    }
+    try:
+        results = dry_run_engine.run(scenario)
+    except Exception as e:
+        print(f"Error running dry run: {e}")
+        flash(f'Dry run failed for "{scenario.name}": {str(e)}', 'error')
+        return redirect(url_for('index'))
     
-    for i, child in enumerate(scenario.child_scenarios):
-        results['details'].append({
-            'child_scenario': child.scenario_text,
-            'status': 'passed',
-            'required_items_found': len(child.required_cdash_items),
-            'domains_validated': len(child.domains),
-            'reasoning_template_valid': bool(child.reasoning_template)
-        })
+    if results['status'] == 'no_data':
+        flash(f'No study datasets found in "{results["data_dir"]}". Set STUDY_DATA_DIR to run a dry run.', 'warning')
+        return redirect(url_for('index'))
+    
+    summary = (f'{results["passed_checks"]} of {results["total_checks"]} checks passed, '
+               f'{results["flagged_checks"]} flagged {results["flagged_records"]} records, '
+               f'{results["failed_checks"]} failed, {results["skipped_checks"]} skipped '
+               f'in {results["elapsed_seconds"]:.1f}s.')
+    flash(f'Dry run completed for "{scenario.name}": {summary}{skipped_hint(results)}',
+          'success' if results['status'] == 'passed' and not results['skipped_checks'] else 'warning')
+    return redirect_after_dry_run(results)
+
+@app.route('/dry_run_active')
+def dry_run_active():
+    """Dry run every active scenario in one plan, scanning each study domain once"""
+    try:
+        results = dry_run_engine.run_active(storage.get_all_scenarios())
+    except Exception as e:
+        print(f"Error running dry run: {e}")
+        flash(f'Dry run failed: {str(e)}', 'error')
+        return redirect(url_for('index'))
+    
+    if results['status'] == 'no_data':
+        flash(f'No study datasets found in "{results["data_dir"]}". Set STUDY_DATA_DIR to run a dry run.', 'warning')
+        return redirect(url_for('index'))
     
-    flash(f'Dry run completed for "{scenario.name}". All {results["total_checks"]} checks passed.', 'success')
+    summary = (f'{results["passed_checks"]} of {results["total_checks"]} checks passed, '
+               f'{results["flagged_checks"]} flagged {results["flagged_records"]} records, '
+               f'{results["failed_checks"]} failed, {results["skipped_checks"]} skipped '
+               f'in {results["elapsed_seconds"]:.1f}s ({len(results["scans"])} dataset scans).')
+    flash(f'Dry run completed for {results["scenario_count"]} active scenarios: {summary}{skipped_hint(results)}',
+          'success' if results['status'] == 'passed' and not results['skipped_checks'] else 'warning')
+    return redirect_after_dry_run(results)
+
+def skipped_hint(results):
+    """How to run the checks a dry run skipped, empty when it skipped none"""
+    if not results['skipped_checks']:
+        return ''
+    return (' Skipped checks have no compilable rule: state the rule in the condition form '
+            '(e.g. "When AEOUT = \'RECOVERED\'") or set DRY_RUN_EXEC_CODE=true to run their pseudo code.')
+
+def redirect_after_dry_run(results):
+    """Show the stored findings of a dry run that flagged records, else go back to the scenario list"""
+    if results.get('findings_run') and results['flagged_records']:
+        return redirect(url_for('findings_view', run_id=results['findings_run']))
     return redirect(url_for('index'))
 
+@app.route('/api/dry-run', methods=['POST'])
+def api_dry_run_active():
+    """API endpoint running the checks of every active scenario with shared dataset scans"""
+    try:
+        return jsonify(dry_run_engine.run_active(storage.get_all_scenarios()))
+    except Exception as e:
+        print(f"Error running dry run: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dry-run/<scenario_id>', methods=['POST'])
+def api_dry_run_scenario(scenario_id):
+    """API endpoint returning flagged records, row counts and timings of every child check"""
+    scenario = storage.get_scenario_by_id(scenario_id)
+    if not scenario:
+        return jsonify({'error': 'Scenario not found'}), 404
+    
+    try:
+        return jsonify(dry_run_engine.run(scenario))
+    except Exception as e:
+        print(f"Error running dry run: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/findings')
+def findings_latest():
+    """Findings of the most recent dry run"""
+    runs = dry_run_engine.findings.runs() if dry_run_engine.findings else []
+    if not runs:
+        flash('No stored dry run findings. Run a dry run first.', 'info')
+        return redirect(url_for('index'))
+    return redirect(url_for('findings_view', run_id=runs[0]['run_id']))
+
+@app.route('/findings/<run_id>')
+def findings_view(run_id):
+    """Browse the flagged records of a dry run page by page"""
+    run = dry_run_engine.findings.index(run_id) if dry_run_engine.findings else None
+    if run is None:
+        flash('Dry run findings not found.', 'error')
+        return redirect(url_for('index'))
+    flagged = [entry for entry in run['children'] if entry['stored_count']]
+    # Table columns of each child check's records, from the columns of its chunks
+    columns = {entry['child_id']: list(dict.fromkeys(column for chunk in entry['chunks'] for column in chunk['columns']))
+               for entry in flagged}
+    domains = sorted({domain for entry in flagged for domain in entry['domains']})
+    return render_template('findings.html', run=run, runs=dry_run_engine.findings.runs(), flagged=flagged,
+                           columns=columns, domains=domains, page_size=DEFAULT_PAGE_SIZE)
+
+def findings_filters():
+    """Child check, subject and domain filters of a findings request"""
+    return {name: request.args.get(name) or None for name in ('child', 'subject', 'domain')}
+
+@app.route('/findings/<run_id>/download')
+def download_findings(run_id):
+    """Stream the flagged records of a dry run as CSV or JSON Lines, with the page filters"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'jsonl'):
+        flash(f'Unsupported download format: {export_format}', 'error')
+        return redirect(url_for('findings_view', run_id=run_id))
+    store = dry_run_engine.findings
+    if store is None or store.index(run_id) is None:
+        flash('Dry run findings not found.', 'error')
+        return redirect(url_for('index'))
+    
+    filters = findings_filters()
+    records = store.iter_records(run_id, **filters)
+    if export_format == 'csv':
+        chunks = stream_records_csv(records, store.columns(run_id, **filters))
+    else:
+        chunks = stream_jsonl(records)
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=dry_run_findings_{run_id}.{extension}'
+    })
+
+@app.route('/api/findings')
+def api_findings_runs():
+    """API endpoint listing the stored dry run findings, newest first"""
+    if dry_run_engine.findings is None:
+        return jsonify({'runs': []})
+    return jsonify({'runs': dry_run_engine.findings.runs()})
+
+@app.route('/api/findings/<run_id>')
+def api_findings_run(run_id):
+    """API endpoint returning the summary index of a dry run's findings: every child check and its record count"""
+    run = dry_run_engine.findings.index(run_id) if dry_run_engine.findings else None
+    if run is None:
+        return jsonify({'error': 'Findings not found'}), 404
+    for entry in run['children']:
+        entry.pop('chunks')
+    return jsonify(run)
+
+@app.route('/api/findings/<run_id>/records')
+def api_findings_records(run_id):
+    """API endpoint returning one page of a dry run's flagged records and the cursor of the next page"""
+    if dry_run_engine.findings is None:
+        return jsonify({'error': 'Findings not found'}), 404
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        return jsonify(dry_run_engine.findings.page(run_id, cursor=request.args.get('cursor'), limit=limit,
+                                                    **findings_filters()))
+    except KeyError:
+        return jsonify({'error': 'Findings not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/recommend_scenarios', methods=['POST'])
 def recommend_scenarios():
     """Get scenario recommendations based on study data patterns and characteristics"""
@@ -363,118 +592,32 @@ def recommend_scenarios():
             flash('Please select at least one domain or tag for recommendations.', 'warning')
             return redirect(url_for('index', tab='recommend'))
         
-        # Find matching scenarios with enhanced scoring
-        recommendations = []
-        
-        for scenario in storage.get_all_scenarios():
-            if not scenario.is_active:
-                continue
-                
-            score = 0
-            reasons = []
-            
-            # Check domain matches (higher weight)
-            scenario_domains = set()
-            for child in scenario.child_scenarios:
-                scenario_domains.update(child.domains)
-            
-            domain_matches = scenario_domains.intersection(set(selected_domains))
-            if domain_matches:
-                score += len(domain_matches) * 25
-                reasons.append(f"Primary domain alignment: {', '.join(domain_matches)}")
-            
-            # Check tag matches
-            scenario_tag_names = set()
-            if scenario.tag:
-                scenario_tag_names.add(scenario.tag.name)
-            for child in scenario.child_scenarios:
-                if child.tag:
-                    scenario_tag_names.add(child.tag.name)
-            
-            tag_matches = scenario_tag_names.intersection(set(selected_tags))
-            if tag_matches:
-                score += len(tag_matches) * 15
-                reasons.append(f"Risk category match: {', '.join(tag_matches)}")
-            
-            # Study type specific scoring
-            if study_type:
-                if study_type in ['phase1', 'phase2'] and 'Safety' in scenario_tag_names:
-                    score += 20
-                    reasons.append("Critical for early-phase safety monitoring")
-                elif study_type == 'phase3' and 'Efficacy' in scenario_tag_names:
-                    score += 20
-                    reasons.append("Essential for confirmatory efficacy studies")
-                elif study_type == 'observational' and 'Data Quality' in scenario_tag_names:
-                    score += 15
-                    reasons.append("Important for observational data integrity")
-            
-            # Therapeutic area specific scoring
-            if therapeutic_area:
-                if therapeutic_area == 'oncology' and ('AE' in scenario_domains or 'Safety' in scenario_tag_names):
-                    score += 15
-                    reasons.append("Critical for oncology safety monitoring")
-                elif therapeutic_area == 'cardiology' and ('VS' in scenario_domains or 'EG' in scenario_domains):
-                    score += 15
-                    reasons.append("Essential for cardiovascular assessments")
-                elif therapeutic_area == 'neurology' and ('AE' in scenario_domains or 'MH' in scenario_domains):
-                    score += 15
-                    reasons.append("Important for neurological safety tracking")
-            
-            # Data quality focus bonuses
-            if critical_endpoints and 'Efficacy' in scenario_tag_names:
-                score += 10
-                reasons.append("Supports critical endpoint validation")
-            
-            if regulatory_compliance and 'Compliance' in scenario_tag_names:
-                score += 10
-                reasons.append("Enhances regulatory compliance")
-            
-            if safety_monitoring and ('Safety' in scenario_tag_names or 'AE' in scenario_domains):
-                score += 10
-                reasons.append("Strengthens safety monitoring")
-            
-            # Bonus for comprehensive scenarios (multiple child scenarios)
-            if len(scenario.child_scenarios) >= 3:
-                score += 5
-                reasons.append("Comprehensive validation coverage")
-            
-            # Convert to percentage and add relevance boost
-            if score > 0:
-                final_score = min(100, score)
-                recommendations.append({
-                    'scenario': scenario,
-                    'score': final_score,
-                    'reasons': reasons
-                })
+        limit = request.form.get('limit', RECOMMENDATION_LIMIT, type=int)
+        if limit < 1:
+            flash('The number of recommendations must be at least 1.', 'warning')
+            return redirect(url_for('index', tab='recommend'))
         
-        # Sort by score
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
+        # Score every active scenario in one vectorized pass and keep the top matches
+        total, recommendations = storage.recommend_scenarios(
+            selected_domains,
+            selected_tags,
+            limit=min(limit, MAX_SCENARIO_PAGE_SIZE),
+            study_type=study_type,
+            therapeutic_area=therapeutic_area,
+            critical_endpoints=critical_endpoints,
+            regulatory_compliance=regulatory_compliance,
+            safety_monitoring=safety_monitoring
+        )
         
-        if recommendations:
-            flash(f'Found {len(recommendations)} scenario recommendations.', 'success')
+        if len(recommendations) < total:
+            flash(f'Found {total} scenario recommendations. Showing the top {len(recommendations)}.', 'success')
+        elif recommendations:
+            flash(f'Found {total} scenario recommendations.', 'success')
         else:
             flash('No scenarios match the selected criteria.', 'info')
         
-        # Get all unique domains and tags for filters
-        all_domains_set = set()
-        all_tags_set = set()
-        
-        for scenario in storage.get_all_scenarios():
-            for child in scenario.child_scenarios:
-                all_domains_set.update(child.domains)
-            # Add parent tag
-            if scenario.tag:
-                all_tags_set.add(scenario.tag.name)
-            # Add child tags
-            for child in scenario.child_scenarios:
-                if child.tag:
-                    all_tags_set.add(child.tag.name)
-        
         return render_template('index.html',
-                             scenarios=storage.get_all_scenarios(),
-                             available_tags=Tag.get_available_tags(),
-                             all_domains=sorted(list(all_domains_set)),
-                             all_tags=sorted(list(all_tags_set)),
+                             **scenario_table_context(scenario_listing({})),
                              current_tab='recommend',
                              recommendations=recommendations,
                              selected_domains=selected_domains,
@@ -510,12 +653,10 @@ def generate_child_scenarios(parent_id):
             return redirect(url_for('index', tab='create'))
         
         # Convert to ChildScenario objects
-        available_tags = Tag.get_available_tags()
-        child_scenarios = scenario_generator.create_child_scenario_objects(generated_scenarios, available_tags)
+        child_scenarios = scenario_generator.create_child_scenario_objects(generated_scenarios)
         
         # Add to parent scenario
-        parent.child_scenarios.extend(child_scenarios)
-        parent.updated_at = datetime.now()
+        storage.add_child_scenarios(parent_id, child_scenarios)
         
         flash(f'Successfully generated {len(child_scenarios)} child scenarios for "{parent.name}".', 'success')
         
@@ -524,6 +665,49 @@ def generate_child_scenarios(parent_id):
     
     return redirect(url_for('index', tab='create'))
 
+@app.route('/api/generate-child-scenarios/batch', methods=['POST'])
+def generate_child_scenarios_batch():
+    """API endpoint to generate child scenarios for many parent scenarios concurrently"""
+    try:
+        data = request.get_json() or {}
+        parent_ids = data.get('parent_ids', [])
+        
+        if not parent_ids:
+            return jsonify({'error': 'Parent scenario IDs are required'}), 400
+        
+        max_concurrency = min(int(data.get('max_concurrency', MAX_CONCURRENCY)), MAX_CONCURRENCY)
+        
+        results = []
+        parents = []
+        found = {scenario.id: scenario for scenario in storage.get_many(parent_ids)}
+        for parent_id in parent_ids:
+            parent = found.get(parent_id)
+            if not parent:
+                results.append({'parent_id': parent_id, 'success': False, 'error': 'Parent scenario not found'})
+            elif parent.is_ootb:
+                results.append({'parent_id': parent_id, 'success': False,
+                                'error': 'Cannot generate child scenarios for Out of the Box scenarios'})
+            else:
+                parents.append(parent)
+        
+        # Attach each parent's children as soon as its generation completes
+        for parent, generated_scenarios, error in scenario_generator.generate_child_scenarios_batch(
+                parents, max_concurrency=max_concurrency):
+            child_scenarios = scenario_generator.create_child_scenario_objects(generated_scenarios)
+            storage.add_child_scenarios(parent.id, child_scenarios)
+            results.append({
+                'parent_id': parent.id,
+                'name': parent.name,
+                'success': True,
+                'generated': len(child_scenarios),
+                'fallback': error is not None,
+                'error': error
+            })
+        
+        return jsonify({'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/apply_scenario/<scenario_id>', methods=['POST'])
 def apply_scenario(scenario_id):
     """Apply recommended scenario to study"""
@@ -698,17 +882,7 @@ def suggest_child_scenarios_api():
         )
         
         # Convert to JSON serializable format
-        suggestions = []
-        for scenario in suggested_scenarios:
-            suggestion = {
-                'scenario_text': scenario.get('description', scenario.get('rule_description', scenario.get('name', 'Unnamed scenario'))),
-                'reasoning_template': scenario.get('reasoning_template', 'No reasoning template provided'),
-                'domains': scenario.get('domains', ['General']),
-                'required_cdash_items': scenario.get('required_cdash_items', ['SUBJID']),
-                'tag': scenario.get('tag', 'Other'),
-                'pseudo_code': scenario.get('pseudo_code', '')
-            }
-            suggestions.append(suggestion)
+        suggestions = [suggestion_from_generated(scenario) for scenario in suggested_scenarios]
         
         return jsonify({
             'success': True,
@@ -721,6 +895,78 @@ def suggest_child_scenarios_api():
             'error': f'Failed to generate suggestions: {str(e)}'
         })
 
+def suggestion_from_generated(scenario):
+    """Convert a generated child scenario into the suggestion format used by the UI"""
+    return {
+        'scenario_text': scenario.get('description', scenario.get('rule_description', scenario.get('name', 'Unnamed scenario'))),
+        'reasoning_template': scenario.get('reasoning_template', 'No reasoning template provided'),
+        'domains': scenario.get('domains', ['General']),
+        'required_cdash_items': scenario.get('required_cdash_items', ['SUBJID']),
+        'tag': scenario.get('tag', 'Other'),
+        'pseudo_code': scenario.get('pseudo_code', '')
+    }
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Stream an iterable of server-sent events without buffering"""
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/suggest-child-scenarios/stream', methods=['POST'])
+def suggest_child_scenarios_stream():
+    """Stream child scenario suggestions as server-sent events, one per completed scenario"""
+    data = request.get_json() or {}
+    parent_name = data.get('name', '')
+    parent_description = data.get('description', '')
+    
+    if not parent_description:
+        return jsonify({'success': False, 'error': 'Description is required'}), 400
+    
+    def events():
+        count = 0
+        try:
+            for scenario in scenario_generator.stream_child_scenarios(parent_name, parent_description):
+                yield sse_event('suggestion', {'index': count, 'suggestion': suggestion_from_generated(scenario)})
+                count += 1
+            yield sse_event('done', {'count': count})
+        except Exception as e:
+            yield sse_event('error', {'error': f'Failed to generate suggestions: {str(e)}'})
+    
+    return sse_response(events())
+
+@app.route('/api/update-scenario-code/stream', methods=['POST'])
+def update_scenario_code_stream():
+    """Stream the query text and Python code of the first generated scenario as soon as it is complete"""
+    data = request.get_json() or {}
+    description = data.get('description', '')
+    
+    if not description or len(description) < 20:
+        return jsonify({'error': 'Description too short'}), 400
+    
+    def events():
+        try:
+            # Only the first scenario is needed; closing the generator stops the upstream stream
+            scenarios = scenario_generator.stream_child_scenarios("Updated Scenario", description)
+            first_scenario = next(scenarios, None)
+            scenarios.close()
+            if first_scenario:
+                yield sse_event('code', {
+                    'query_text': first_scenario.get('reasoning_template', 'Find subjects meeting the specified validation criteria'),
+                    'python_code': first_scenario.get('pseudo_code', 'def check_validation_rule(df):\n    # Generated code\n    return df')
+                })
+            else:
+                yield sse_event('error', {'error': 'Failed to generate updated code'})
+        except Exception as e:
+            print(f"Error streaming scenario code: {e}")
+            yield sse_event('error', {'error': 'Failed to update code'})
+    
+    return sse_response(events())
+
 @app.route('/api/generate-domain-analysis', methods=['POST'])
 def generate_domain_analysis():
     """API endpoint to generate domain analysis for recommendation"""
@@ -737,8 +983,7 @@ def generate_domain_analysis():
             return jsonify({'error': 'Scenario not found'}), 404
         
         # Generate domain analysis using AI
-        generator = ScenarioGenerator()
-        analysis = generator._generate_domain_analysis(scenario)
+        analysis = scenario_generator._generate_domain_analysis(scenario)
         
         return jsonify(analysis)
     except Exception as e:
@@ -760,14 +1005,14 @@ def generate_model_thinking():
             return jsonify({'error': 'Scenario not found'}), 404
         
         # Generate model thinking using AI
-        generator = ScenarioGenerator()
-        thinking = generator._generate_model_thinking(scenario)
+        thinking = scenario_generator._generate_model_thinking(scenario)
         
         return jsonify(thinking)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/suggest-ootb-scenarios', methods=['POST'])
+@conditional
 def suggest_ootb_scenarios():
     """API endpoint to suggest OOTB scenarios based on DRP domains"""
     try:
@@ -775,23 +1020,12 @@ def suggest_ootb_scenarios():
         domains = data.get('domains', [])
         exclude_existing = data.get('exclude_existing', True)
         
-        # Get all OOTB scenarios from storage
-        all_scenarios = storage.get_all_scenarios()
-        ootb_scenarios = [s for s in all_scenarios if s.is_ootb]
-        
-        # Filter by domains if specified
+        # Filter by domains if specified, via the storage domain posting lists
         if domains:
-            relevant_scenarios = []
-            for scenario in ootb_scenarios:
-                scenario_domains = set()
-                for child in scenario.child_scenarios:
-                    scenario_domains.update(child.domains)
-                
-                # Check if scenario covers any of the requested domains
-                if any(domain in scenario_domains for domain in domains):
-                    relevant_scenarios.append(scenario)
+            candidates = storage.get_scenarios_by_domains(domains)
         else:
-            relevant_scenarios = ootb_scenarios
+            candidates = storage.get_all_scenarios()
+        relevant_scenarios = [s for s in candidates if s.is_ootb]
         
         # Convert to suggestion format
         suggestions = []
@@ -800,7 +1034,7 @@ def suggest_ootb_scenarios():
                 'id': scenario.id,
                 'name': scenario.name,
                 'description': scenario.description,
-                'domain': list(set([d for child in scenario.child_scenarios for d in child.domains]))[0] if scenario.child_scenarios else 'General',
+                'domain': (storage.get_scenario_domains(scenario.id) or ('General',))[0],
                 'childCount': len(scenario.child_scenarios),
                 'priority': 'High' if len(scenario.child_scenarios) > 5 else 'Medium'
             }
@@ -811,6 +1045,7 @@ def suggest_ootb_scenarios():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/get-ootb-scenarios', methods=['POST'])
+@conditional
 def get_ootb_scenarios():
     """API endpoint to retrieve specific OOTB scenarios by IDs"""
     try:
@@ -822,15 +1057,14 @@ def get_ootb_scenarios():
         
         # Get scenarios from storage
         scenarios = []
-        for scenario_id in scenario_ids:
-            scenario = storage.get_scenario_by_id(scenario_id)
-            if scenario and scenario.is_ootb:
+        for scenario in storage.get_many(scenario_ids):
+            if scenario.is_ootb:
                 # Convert to parent-child format
                 scenario_data = {
                     'id': scenario.id,
                     'name': scenario.name,
                     'description': scenario.description,
-                    'domain': list(set([d for child in scenario.child_scenarios for d in child.domains]))[0] if scenario.child_scenarios else 'General',
+                    'domain': (storage.get_scenario_domains(scenario.id) or ('General',))[0],
                     'tag': scenario.tag.name if scenario.tag else 'Other',
                     'childScenarios': [
                         {
@@ -852,3 +1086,8 @@ def get_ootb_scenarios():
         return jsonify({'scenarios': scenarios})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, storage and AI generation metrics in the Prometheus text format"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
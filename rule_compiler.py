@@ -0,0 +1,520 @@
+import operator
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from study_data import STUDY_DOMAINS
+
+# Compiled rules kept per (child id, child version, rule text)
+RULE_CACHE_SIZE = 4096
+
+KEYWORDS = ('AND', 'BUT', 'OR', 'NOT', 'IN', 'IS', 'ARE', 'THEN', 'MISSING', 'BLANK', 'NULL', 'EMPTY')
+MISSING_WORDS = ('MISSING', 'BLANK', 'NULL', 'EMPTY')
+
+# Comparisons written out in words, as the catalogue's rule texts state them
+_PHRASES = (
+    (r'is\s+greater\s+than\s+or\s+equal\s+to', '>='),
+    (r'is\s+(?:less|lower)\s+than\s+or\s+equal\s+to', '<='),
+    (r'is\s+not\s+equal\s+to', '!='),
+    (r'is\s+(?:greater|higher)\s+than|is\s+above|exceeds', '>'),
+    (r'is\s+(?:less|lower)\s+than|is\s+below|falls\s+below', '<'),
+    (r'is\s+equal\s+to|equals', '=='),
+    (r'is\s+marked(?:\s+as)?|is\s+(?:recorded|documented|identified|reported)\s+as', 'IS'),
+    (r'is\s+(?:provided|recorded|documented|reported|present|available)', 'IS NOT MISSING'),
+)
+
+_TOKEN = re.compile(r"""
+    # A column with its label, "Label" (COLUMN), or with a description, 'COLUMN' (description)
+    (?:"[^"]*"|“[^”]*”)\s*\(\s*(?P<labelled>[A-Z][A-Z0-9_]+)\s*\)
+  | (?P<quote>'?)(?P<described>(?!(?:%s)\b)[A-Z][A-Z0-9_]+)(?P=quote)\s*\([^()=<>]*\)
+  | (?P<string>'[^']*'|"[^"]*"|‘[^’]*’|“[^”]*”)
+  | (?P<number>-?\d+(?:\.\d+)?(?![A-Za-z_]))
+  | (?P<op><=|>=|!=|<>|==|=|<|>)
+  | (?i:\b(?P<phrase>%s)\b)
+  | (?P<punct>[(),\[\]])
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<other>\S)
+""" % ('|'.join(KEYWORDS), '|'.join(pattern for pattern, _ in _PHRASES)), re.VERBOSE)
+
+# Yes/no answers match every spelling of the CDISC NY code list
+YES_NO = {'YES': ('Y', 'YES', 'Yes', 'yes'), 'NO': ('N', 'NO', 'No', 'no')}
+
+# Column names are upper case variable names such as AEACN or CTCAE_GRADE
+_COLUMN = re.compile(r'[A-Z][A-Z0-9_]+$')
+
+# Where a rule condition can start inside free text, after any "both the values in"
+_RULE_START = re.compile(r'\b(?:flag\s+(?:records\s+)?(?:where|when)|when|where|(?P<conditional>if))\b'
+                         r'(?:\s+both\b)?(?:\s+the\b)?(?:\s+values?\s+(?:in|of)\b)?', re.IGNORECASE)
+
+# SDTM domains with no study dataset here, whose variables no rule can read
+# next to a study domain's (PRTRT, EGDESC, PETEST, ...)
+OTHER_DOMAINS = ('DS', 'EG', 'FA', 'IE', 'MB', 'PC', 'PE', 'PR', 'QS', 'RS', 'SC', 'TR', 'TU')
+
+_COMPARISONS = {
+    '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+class RuleError(ValueError):
+    """Rule text that cannot be parsed, or a frame it cannot be evaluated on"""
+
+
+def _phrase_op(phrase):
+    return next(op for pattern, op in _PHRASES if re.fullmatch(pattern, phrase, re.IGNORECASE))
+
+
+def tokenize(text):
+    """(kind, value) tokens of a rule condition, and the text offset where each ends"""
+    tokens, ends = [], []
+    for match in _TOKEN.finditer(text):
+        kind, value = match.lastgroup, match.group()
+        if kind in ('labelled', 'described'):
+            tokens.append(('column', match.group(kind)))
+        elif kind == 'phrase':
+            op = _phrase_op(value)
+            if op[0].isalpha():
+                tokens.extend(('keyword', word) for word in op.split())
+                ends.extend([match.end()] * (len(op.split()) - 1))
+            else:
+                tokens.append(('op', op))
+        elif kind == 'string':
+            tokens.append(('literal', value[1:-1]))
+        elif kind == 'number':
+            tokens.append(('literal', float(value) if '.' in value else int(value)))
+        elif kind == 'op':
+            tokens.append(('op', {'=': '==', '<>': '!='}.get(value, value)))
+        elif kind == 'word' and value.upper() in KEYWORDS:
+            tokens.append(('keyword', value.upper()))
+        elif kind == 'word' and _COLUMN.match(value):
+            tokens.append(('column', value))
+        else:
+            tokens.append((kind, value))
+        ends.append(match.end())
+    return tokens, ends
+
+
+def _is_variable(value):
+    return isinstance(value, str) and bool(_COLUMN.match(value)) and value not in KEYWORDS
+
+
+def _answers(values):
+    """Literals with each yes/no answer replaced by every spelling of it"""
+    expanded = []
+    for value in values:
+        expanded.extend(YES_NO.get(value.upper(), (value,)) if isinstance(value, str) else (value,))
+    return tuple(dict.fromkeys(expanded))
+
+
+def _comparison(op, left, right):
+    """A comparison node; equality with a yes/no answer becomes a test for any spelling of it"""
+    for column, other in ((left, right), (right, left)):
+        if (op in ('==', '!=') and column[0] == 'column' and other[0] == 'literal'
+                and isinstance(other[1], str) and other[1].upper() in YES_NO):
+            return ('in', column, YES_NO[other[1].upper()], op == '!=')
+    return ('compare', op, left, right)
+
+
+class _Parser:
+    """Recursive descent parser producing nested tuples
+
+    expression := conjunction (OR conjunction)*
+    conjunction := negation ((AND | BUT) negation)*
+    negation := NOT negation | '(' expression ')' | predicate
+    predicate := operand (op operand | [NOT] IN list | IS [NOT] (missing (OR missing)* | literal (OR literal)*))
+               | operand (AND operand)* (IS | ARE) [NOT] missing (OR missing)*
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, kind, *values):
+        token_kind, value = self.peek()
+        if token_kind == kind and (not values or value in values):
+            self.position += 1
+            return value
+        return None
+
+    def expect(self, kind, *values):
+        value = self.accept(kind, *values)
+        if value is None:
+            raise RuleError(f"Expected {' or '.join(values) or kind} at {self.peek()[1]!r}")
+        return value
+
+    def expression(self):
+        node = self.conjunction()
+        while self.accept('keyword', 'OR'):
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept('keyword', 'AND', 'BUT'):
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.accept('keyword', 'NOT'):
+            return ('not', self.negation())
+        if self.accept('punct', '('):
+            node = self.expression()
+            self.expect('punct', ')')
+            return node
+        return self.predicate()
+
+    def operand(self, column=False):
+        """A column or value; with column, a quoted variable name such as 'AETERM' is read as a column"""
+        kind, value = self.take()
+        if kind == 'word' and value.upper() in YES_NO:
+            kind = 'literal'
+        elif column and kind == 'literal' and _is_variable(value):
+            kind = 'column'
+        if kind not in ('column', 'literal'):
+            raise RuleError(f"Expected a column or value at {value!r}")
+        return (kind, value)
+
+    def is_column(self, offset):
+        kind, value = self.peek(offset)
+        return kind == 'column' or (kind == 'literal' and _is_variable(value))
+
+    def is_literal(self, offset):
+        kind, value = self.peek(offset)
+        return kind == 'literal' or (kind == 'word' and value.upper() in YES_NO)
+
+    def predicate(self):
+        left = self.operand(column=True)
+        op = self.accept('op')
+        if op:
+            # Ordering against an upper case name only makes sense for a column
+            return _comparison(op, left, self.operand(column=op not in ('==', '!=')))
+
+        negated = bool(self.accept('keyword', 'NOT'))
+        if self.accept('keyword', 'IN'):
+            return ('in', left, self.values(), negated)
+        if negated:
+            raise RuleError("Expected IN after NOT")
+
+        operands = self.column_list(left)
+        self.expect('keyword', 'IS', 'ARE')
+        negated = bool(self.accept('keyword', 'NOT'))
+        if self.accept('keyword', *MISSING_WORDS):
+            # 'is blank or missing' is one test
+            while self.peek() == ('keyword', 'OR') and self.peek(1)[0] == 'keyword' and self.peek(1)[1] in MISSING_WORDS:
+                self.position += 2
+            node = ('missing', operands[0], negated)
+            for operand in operands[1:]:
+                node = ('and', node, ('missing', operand, negated))
+            return node
+        if len(operands) > 1:
+            raise RuleError("Expected MISSING after a list of columns")
+
+        # 'is A or B' lists the values the column may take
+        values = [self.operand()]
+        while (self.peek() == ('keyword', 'OR') and self.is_literal(1)
+               and self.peek(2)[0] != 'op' and self.peek(2) not in (('keyword', 'IS'), ('keyword', 'ARE'))):
+            self.position += 1
+            values.append(self.operand())
+        if len(values) == 1:
+            return _comparison('!=' if negated else '==', left, values[0])
+        return ('in', left, _answers(value for _, value in values), negated)
+
+    def column_list(self, left):
+        """The columns of 'A and B are not null', or just left when no such list follows"""
+        start = self.position
+        operands = [left]
+        while self.peek() == ('keyword', 'AND') and self.is_column(1):
+            self.position += 1
+            operands.append(self.operand(column=True))
+        if self.peek() in (('keyword', 'IS'), ('keyword', 'ARE')):
+            return operands
+        self.position = start
+        return [left]
+
+    def values(self):
+        closing = ')' if self.expect('punct', '(', '[') == '(' else ']'
+        values = [self.expect('literal')]
+        while self.accept('punct', ','):
+            values.append(self.expect('literal'))
+        self.expect('punct', closing)
+        return _answers(values)
+
+    def at_boundary(self):
+        """Whether the condition ends here: end of text, punctuation or ordinary prose"""
+        kind, value = self.peek()
+        return kind in (None, 'word', 'other') or (kind == 'punct' and value == ',')
+
+
+def parse_condition(text):
+    """Parse a complete rule condition such as "AEACN = 'DRUG WITHDRAWN' and AEOUT != 'RECOVERED'" """
+    parser = _Parser(tokenize(text)[0])
+    tree = parser.expression()
+    if parser.peek()[0] is not None:
+        raise RuleError(f"Unexpected {parser.peek()[1]!r}")
+    return tree
+
+
+def _parse_prefix(text, conditional):
+    """(tree, length) of the condition at the start of text, or None if it does not start with one
+
+    For 'if' rules the flagged records are those meeting the premise but not the
+    THEN clause.
+    """
+    tokens, ends = tokenize(text)
+    parser = _Parser(tokens)
+    try:
+        tree = parser.expression()
+    except RuleError:
+        return None
+    if conditional:
+        premise_end = parser.position
+        try:
+            parser.accept('punct', ',')
+            parser.expect('keyword', 'THEN')
+            tree = ('and', tree, ('not', parser.expression()))
+        except RuleError:
+            # A consequence that is no condition ("then CMINDC must align with
+            # AETERM") leaves the premise: the records the check applies to
+            parser.position = premise_end
+            if parser.peek() == ('keyword', 'THEN'):
+                return tree, ends[parser.position - 1]
+    if not parser.at_boundary():
+        return None
+    return tree, ends[parser.position - 1]
+
+
+def _columns(tree, found):
+    """Column names referenced by a tree, in order of appearance"""
+    kind = tree[0]
+    if kind == 'column':
+        if tree[1] not in found:
+            found.append(tree[1])
+    elif kind in ('and', 'or'):
+        _columns(tree[1], found)
+        _columns(tree[2], found)
+    elif kind in ('not', 'in', 'missing'):
+        _columns(tree[1], found)
+    elif kind == 'compare':
+        _columns(tree[2], found)
+        _columns(tree[3], found)
+    return found
+
+
+class _Columns:
+    """Per-evaluation cache of the frame's columns and their missing masks"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._series = {}
+        self._missing = {}
+
+    def series(self, name, numeric=False, plain=False):
+        """Column as stored, or with plain (or numeric) its values decoded from categorical codes"""
+        plain = plain or numeric
+        key = (name, numeric, plain)
+        if key not in self._series:
+            if name not in self.frame.columns:
+                raise RuleError(f"Missing column: {name}")
+            series = self.frame[name]
+            if plain and isinstance(series.dtype, pd.CategoricalDtype):
+                # Code-list columns load as categoricals, which neither order
+                # nor convert to numbers
+                series = series.astype(object)
+            if numeric and not pd.api.types.is_numeric_dtype(series):
+                series = pd.to_numeric(series, errors='coerce')
+            self._series[key] = series
+        return self._series[key]
+
+    def missing(self, name):
+        """Mask of null or empty-string values"""
+        if name not in self._missing:
+            series = self.series(name)
+            missing = series.isna().to_numpy()
+            if series.dtype == object or pd.api.types.is_string_dtype(series):
+                missing = missing | (series == '').to_numpy(dtype=bool, na_value=False)
+            self._missing[name] = missing
+        return self._missing[name]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _literal_for(series, literal):
+    """A string literal converted to a number when compared against a numeric column"""
+    if isinstance(literal, str) and series.dtype.kind in 'iuf':
+        try:
+            return float(literal)
+        except ValueError:
+            return literal
+    return literal
+
+
+def _compile(tree):
+    """Turn a parsed tree into a function of a _Columns returning a boolean mask"""
+    kind = tree[0]
+    if kind in ('and', 'or'):
+        left, right = _compile(tree[1]), _compile(tree[2])
+        if kind == 'and':
+            return lambda columns: left(columns) & right(columns)
+        return lambda columns: left(columns) | right(columns)
+    if kind == 'not':
+        inner = _compile(tree[1])
+        return lambda columns: ~inner(columns)
+
+    if kind == 'missing':
+        _, operand, negated = tree
+        if operand[0] != 'column':
+            raise RuleError("IS MISSING needs a column")
+        name = operand[1]
+        if negated:
+            return lambda columns: ~columns.missing(name)
+        return lambda columns: columns.missing(name).copy()
+
+    if kind == 'in':
+        _, operand, literals, negated = tree
+        if operand[0] != 'column':
+            raise RuleError("IN needs a column")
+        name = operand[1]
+
+        def is_in(columns):
+            series = columns.series(name)
+            matches = series.isin([_literal_for(series, literal) for literal in literals]).to_numpy()
+            return ~matches & ~columns.missing(name) if negated else matches
+        return is_in
+
+    _, op, left, right = tree
+    literals = [value for operand_kind, value in (left, right) if operand_kind == 'literal']
+    if len(literals) == 2:
+        raise RuleError("Comparison needs a column")
+    column_names = [value for operand_kind, value in (left, right) if operand_kind == 'column']
+    # Ordering compares numbers, except ISO 8601 date columns (--DTC) and
+    # string literals, which order correctly as text
+    numeric = (op not in ('==', '!=') and not any(isinstance(value, str) for value in literals)
+               and not all(name.endswith('DTC') for name in column_names))
+    numeric = numeric or any(_is_number(value) for value in literals)
+    # pandas comparisons are already false for nulls, except != and text
+    # ordering, which also need nulls and empty strings masked out
+    mask_missing = op == '!=' or (op != '==' and not numeric)
+    # Equality against a literal can stay on categorical codes
+    plain = op not in ('==', '!=') or len(column_names) == 2
+    compare = _COMPARISONS[op]
+
+    def comparison(columns):
+        left_value = columns.series(left[1], numeric, plain) if left[0] == 'column' else left[1]
+        right_value = columns.series(right[1], numeric, plain) if right[0] == 'column' else right[1]
+        if left[0] == 'literal':
+            left_value = _literal_for(right_value, left_value)
+        if right[0] == 'literal':
+            right_value = _literal_for(left_value, right_value)
+        try:
+            result = compare(left_value, right_value).to_numpy(dtype=bool, na_value=False)
+        except TypeError as e:
+            raise RuleError(f"Cannot compare {left[1]} and {right[1]}: {e}")
+        if mask_missing:
+            for name in column_names:
+                result = result & ~columns.missing(name)
+        return result
+    return comparison
+
+
+class CompiledRule:
+    """A rule condition compiled to vectorized mask arithmetic over one domain frame"""
+
+    def __init__(self, source, tree):
+        self.source = source
+        self.tree = tree
+        self.columns = tuple(_columns(tree, []))
+        others = sorted({name[:2] for name in self.columns if name[:2] in OTHER_DOMAINS})
+        if others:
+            raise RuleError(f"Rule reads {', '.join(others)} variables, which have no study dataset")
+        domains = sorted({name[:2] for name in self.columns if name[:2] in STUDY_DOMAINS})
+        if len(domains) > 1:
+            raise RuleError(f"Rule spans several domains: {', '.join(domains)}")
+        self.domain = domains[0] if domains else None
+        self._predicate = _compile(tree)
+
+    def __reduce__(self):
+        # Closures do not pickle; pool workers rebuild them from the tree
+        return (CompiledRule, (self.source, self.tree))
+
+    def evaluate(self, frame):
+        """Boolean mask of the frame rows the rule flags"""
+        return np.asarray(self._predicate(_Columns(frame)), dtype=bool)
+
+    def __repr__(self):
+        return f"CompiledRule({self.source!r})"
+
+
+def compile_condition(text):
+    """Compile a complete rule condition"""
+    return CompiledRule(text.strip(), parse_condition(text))
+
+
+def extract_rule(text):
+    """Compile the first rule condition found in free rule text, or None
+
+    Finds conditions such as "When AEACN = 'DRUG WITHDRAWN' but AEOUT !=
+    'RECOVERED'", "Flag where LBORRES > LBORNRHI" or "If AESER = 'Y' then
+    AEOUT is not missing", as well as text that starts with a condition.
+    Columns may be quoted or labelled ("Outcome" (AEOUT)), and comparisons
+    written out ("'LBORRES' exceeds 'LBORNRHI'", "AECONTRT is marked as yes").
+    An 'if' whose consequence is no condition keeps the premise alone. Only
+    the first 'when', 'where' or 'if' is tried: once it cannot be read, a
+    later condition may only qualify it ("..., then: if LBORNRHI is null").
+    """
+    if not text:
+        return None
+    starts = [(0, False)]
+    match = _RULE_START.search(text)
+    if match:
+        starts.append((match.end(), match.group('conditional') is not None))
+    for start, conditional in starts:
+        parsed = _parse_prefix(text[start:], conditional)
+        if parsed is None or not _columns(parsed[0], []):
+            continue
+        tree, length = parsed
+        source = text[start:start + length].strip()
+        if conditional:
+            source = f"if {source}"
+        try:
+            return CompiledRule(source, tree)
+        except RuleError:
+            continue
+    return None
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def rule_for_child(child):
+    """Compiled rule of a child scenario, cached per child version
+
+    The rule comes from the child's scenario text or, failing that, its
+    reasoning template. Returns None when neither states a rule condition.
+    """
+    key = (child.id, child.version, child.scenario_text, child.reasoning_template)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    rule = extract_rule(child.scenario_text) or extract_rule(child.reasoning_template)
+    with _cache_lock:
+        _cache[key] = rule
+        while len(_cache) > RULE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rule
@@ -0,0 +1,309 @@
+from data import ScenarioStorage
+from models import ParentScenario, ChildScenario, Tag
+from ootb_snapshot import load_ootb_scenarios
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_SHARED_STORE_PATH = '.cache/scenario_store.sqlite3'
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)",
+    # Latest state of every scenario changed since the OOTB seed; payload is
+    # NULL once deleted. created_seq keeps the listing order of new scenarios.
+    """CREATE TABLE IF NOT EXISTS scenarios (
+        scenario_id TEXT PRIMARY KEY,
+        created_seq INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        replaces TEXT,
+        payload TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_scenarios_version ON scenarios (version)",
+)
+
+
+def _synced(method):
+    """Wrap a ScenarioStorage read so it first catches up with other workers"""
+    def synced(self, *args, **kwargs):
+        self._sync()
+        return method(self, *args, **kwargs)
+    synced.__name__ = method.__name__
+    synced.__doc__ = method.__doc__
+    return synced
+
+
+class SharedScenarioStorage(ScenarioStorage):
+    """In-memory ScenarioStorage kept coherent across worker processes
+
+    Every mutation is written, under the SQLite write lock, to a shared WAL
+    database that holds a global version counter and the latest state of
+    each changed scenario. Before serving a read a worker asks SQLite for
+    PRAGMA data_version, which only moves when another connection commits;
+    when it moved and the global version is ahead, the worker applies the
+    newer scenario states to its own indexes. Reads therefore stay in memory
+    and a quiet store costs one pragma per call.
+    """
+
+    def __init__(self, path=DEFAULT_SHARED_STORE_PATH):
+        self._path = path
+        self._lock = threading.RLock()
+        self._connection_pid = None
+        self._conn = None
+        self._version = 0
+        self._epoch = 0
+        self._data_version = None
+        super().__init__()
+        self._sync()
+
+    def _connection(self):
+        """SQLite connection of this process, reopened after a fork"""
+        if self._connection_pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self._path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            # Creation time of the store, so a recreated store never repeats a version
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (time.time_ns(),))
+            self._epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+            self._conn = conn
+            self._connection_pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    def _initialize_ootb_scenarios(self):
+        """Load the OOTB catalogue locally; every worker seeds it the same way"""
+        with self._text_index.batch():
+            for parent in load_ootb_scenarios():
+                ScenarioStorage.add_scenario(self, parent)
+
+    def _sync(self):
+        """Apply changes committed by other workers since the last sync"""
+        with self._lock:
+            conn = self._connection()
+            if conn.in_transaction:
+                # Reached from a write, which has already caught up
+                return
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            conn.execute('BEGIN')
+            try:
+                self._apply_changes(conn)
+            finally:
+                conn.execute('COMMIT')
+            self._data_version = data_version
+
+    def _apply_changes(self, conn):
+        """Apply scenario states newer than the local version, inside a transaction"""
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        if version == self._version:
+            return
+
+        rows = conn.execute(
+            "SELECT scenario_id, replaces, payload FROM scenarios WHERE version > ? "
+            "ORDER BY created_seq, version",
+            (self._version,)
+        )
+        for scenario_id, replaces, payload in rows:
+            if payload is None:
+                if scenario_id in self._scenarios:
+                    self._remove_scenario(scenario_id)
+                continue
+
+            scenario = _load_scenario(json.loads(payload))
+            if replaces and replaces in self._scenarios:
+                self._replace_scenario(replaces, scenario)
+            elif scenario_id in self._scenarios:
+                self._replace_scenario(scenario_id, scenario)
+            else:
+                ScenarioStorage.add_scenario(self, scenario)
+        self._version = version
+
+    @contextmanager
+    def _write(self):
+        """Hold the global write lock, caught up with every other worker
+
+        Yields a function that records the new state of a scenario (or None
+        for a deletion) in the shared store.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._apply_changes(conn)
+                version = self._version
+
+                def record(scenario_id, scenario, replaces=None):
+                    nonlocal version
+                    version += 1
+                    payload = json.dumps(_dump_scenario(scenario)) if scenario else None
+                    created_seq = version
+                    if replaces:
+                        # A renamed scenario keeps the listing place of the one it replaces
+                        row = conn.execute("SELECT created_seq FROM scenarios WHERE scenario_id = ?",
+                                           (replaces,)).fetchone()
+                        if row:
+                            created_seq = row[0]
+                    conn.execute(
+                        "INSERT INTO scenarios (scenario_id, created_seq, version, replaces, payload) "
+                        "VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (scenario_id) DO UPDATE SET "
+                        "version = excluded.version, replaces = excluded.replaces, payload = excluded.payload",
+                        (scenario_id, created_seq, version, replaces, payload)
+                    )
+
+                yield record
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+                conn.execute('COMMIT')
+                self._version = version
+            except BaseException:
+                conn.execute('ROLLBACK')
+                # The local mutation may have been applied without being shared
+                self._reload()
+                raise
+
+    def _reload(self):
+        """Rebuild the in-memory state from the OOTB catalogue and the shared store"""
+        self._version = 0
+        self._data_version = None
+        ScenarioStorage.__init__(self)
+        self._sync()
+
+    def add_scenario(self, scenario):
+        """Add new scenario"""
+        with self._write() as record:
+            super().add_scenario(scenario)
+            record(scenario.id, scenario)
+
+    def update_scenario(self, scenario_id, updated_scenario):
+        """Update existing scenario"""
+        with self._write() as record:
+            if not super().update_scenario(scenario_id, updated_scenario):
+                return False
+            if updated_scenario.id == scenario_id:
+                record(scenario_id, updated_scenario)
+            else:
+                record(updated_scenario.id, updated_scenario, replaces=scenario_id)
+                record(scenario_id, None)
+        return True
+
+    def delete_scenario(self, scenario_id):
+        """Delete scenario (only if not OOTB)"""
+        with self._write() as record:
+            if not super().delete_scenario(scenario_id):
+                return False
+            record(scenario_id, None)
+        return True
+
+    def add_child_scenarios(self, parent_id, child_scenarios):
+        """Append child scenarios to a parent scenario"""
+        with self._write() as record:
+            if not super().add_child_scenarios(parent_id, child_scenarios):
+                return False
+            record(parent_id, self._scenarios[parent_id])
+        return True
+
+    def delete_child_scenario(self, parent_id, child_id):
+        """Remove a child scenario from its parent"""
+        with self._write() as record:
+            if not super().delete_child_scenario(parent_id, child_id):
+                return False
+            record(parent_id, self._scenarios[parent_id])
+        return True
+
+    def toggle_scenario_status(self, scenario_id):
+        """Toggle scenario active/inactive status"""
+        with self._write() as record:
+            if not super().toggle_scenario_status(scenario_id):
+                return False
+            record(scenario_id, self._scenarios[scenario_id])
+        return True
+
+    def get_version(self):
+        """Version shared by every worker: the store's creation time plus its global version"""
+        with self._lock:
+            self._sync()
+            return self._epoch + self._version
+
+    get_all_scenarios = _synced(ScenarioStorage.get_all_scenarios)
+    get_scenario_by_id = _synced(ScenarioStorage.get_scenario_by_id)
+    get_created_scenarios = _synced(ScenarioStorage.get_created_scenarios)
+    get_many = _synced(ScenarioStorage.get_many)
+    locate_child = _synced(ScenarioStorage.locate_child)
+    get_all_domains = _synced(ScenarioStorage.get_all_domains)
+    get_all_tags = _synced(ScenarioStorage.get_all_tags)
+    get_facet_counts = _synced(ScenarioStorage.get_facet_counts)
+    get_scenario_domains = _synced(ScenarioStorage.get_scenario_domains)
+    get_scenario_tag_names = _synced(ScenarioStorage.get_scenario_tag_names)
+    get_scenarios_by_domains = _synced(ScenarioStorage.get_scenarios_by_domains)
+    get_child_ids_for_cdash_item = _synced(ScenarioStorage.get_child_ids_for_cdash_item)
+    recommend_scenarios = _synced(ScenarioStorage.recommend_scenarios)
+    search_scenarios = _synced(ScenarioStorage.search_scenarios)
+
+
+def _dump_scenario(scenario):
+    """JSON-ready dict of a parent scenario"""
+    return {
+        'id': scenario.id,
+        'name': scenario.name,
+        'description': scenario.description,
+        'is_active': scenario.is_active,
+        'is_ootb': scenario.is_ootb,
+        'tag': scenario.tag.name if scenario.tag else None,
+        'version': scenario.version,
+        'created_at': scenario.created_at.isoformat(),
+        'updated_at': scenario.updated_at.isoformat(),
+        'child_scenarios': [
+            {
+                'id': child.id,
+                'scenario_text': child.scenario_text,
+                'required_cdash_items': child.required_cdash_items,
+                'domains': child.domains,
+                'tag': child.tag.name if child.tag else None,
+                'reasoning_template': child.reasoning_template,
+                'pseudo_code': child.pseudo_code,
+                'version': child.version,
+                'created_at': child.created_at.isoformat(),
+                'updated_at': child.updated_at.isoformat()
+            }
+            for child in scenario.child_scenarios
+        ]
+    }
+
+
+def _load_scenario(data):
+    """Parent scenario from a _dump_scenario dict"""
+    return ParentScenario(
+        id=data['id'],
+        name=data['name'],
+        description=data['description'],
+        is_active=data['is_active'],
+        is_ootb=data['is_ootb'],
+        tag=Tag.get(data['tag']),
+        version=data['version'],
+        created_at=datetime.fromisoformat(data['created_at']),
+        updated_at=datetime.fromisoformat(data['updated_at']),
+        child_scenarios=[
+            ChildScenario(
+                id=child['id'],
+                scenario_text=child['scenario_text'],
+                required_cdash_items=child['required_cdash_items'],
+                domains=child['domains'],
+                tag=Tag.get(child['tag']),
+                reasoning_template=child['reasoning_template'],
+                pseudo_code=child['pseudo_code'],
+                version=child['version'],
+                created_at=datetime.fromisoformat(child['created_at']),
+                updated_at=datetime.fromisoformat(child['updated_at'])
+            )
+            for child in data['child_scenarios']
+        ]
+    )
@@ -0,0 +1,616 @@
+from models import ParentScenario, ChildScenario, Tag
+from data import SCENARIO_PAGE_SIZE
+from ootb_snapshot import load_ootb_scenarios
+from recommender import RecommendationEngine
+from collections import defaultdict
+from datetime import datetime
+import os
+import time
+
+from sqlalchemy import (BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+                        and_, create_engine, delete, distinct, event, func, insert, or_, select, union, union_all,
+                        update)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+metadata = MetaData()
+
+tags_table = Table(
+    'tags', metadata,
+    Column('name', String(64), primary_key=True),
+    Column('color', String(64), nullable=False)
+)
+
+parents_table = Table(
+    'parent_scenarios', metadata,
+    Column('id', String(64), primary_key=True),
+    Column('position', Integer, nullable=False, index=True),  # listing order
+    Column('name', Text, nullable=False),
+    Column('description', Text, nullable=False),
+    Column('is_active', Boolean, nullable=False, index=True),
+    Column('is_ootb', Boolean, nullable=False),
+    Column('tag_name', String(64), ForeignKey('tags.name'), index=True),
+    Column('version', String(16), nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Column('updated_at', DateTime, nullable=False)
+)
+
+children_table = Table(
+    'child_scenarios', metadata,
+    Column('id', String(64), primary_key=True),
+    Column('parent_id', String(64), ForeignKey('parent_scenarios.id', ondelete='CASCADE'), nullable=False),
+    Column('position', Integer, nullable=False),
+    Column('scenario_text', Text, nullable=False),
+    Column('reasoning_template', Text, nullable=False),
+    Column('pseudo_code', Text, nullable=False),
+    Column('tag_name', String(64), ForeignKey('tags.name'), index=True),
+    Column('version', String(16), nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+    Index('ix_child_scenarios_parent_position', 'parent_id', 'position')
+)
+
+child_domains_table = Table(
+    'child_domains', metadata,
+    Column('child_id', String(64), ForeignKey('child_scenarios.id', ondelete='CASCADE'), primary_key=True),
+    Column('position', Integer, primary_key=True),
+    Column('domain', String(64), nullable=False, index=True)
+)
+
+child_cdash_items_table = Table(
+    'child_cdash_items', metadata,
+    Column('child_id', String(64), ForeignKey('child_scenarios.id', ondelete='CASCADE'), primary_key=True),
+    Column('position', Integer, primary_key=True),
+    Column('item', String(64), nullable=False, index=True)
+)
+
+# Version of the stored scenarios, bumped in every mutating transaction
+storage_meta_table = Table(
+    'storage_meta', metadata,
+    Column('key', String(64), primary_key=True),
+    Column('value', BigInteger, nullable=False)
+)
+
+
+def create_storage_engine(database_url):
+    """Create a pooled engine; pool settings come from DB_POOL_* environment variables"""
+    url = make_url(database_url)
+    options = {'pool_pre_ping': True}
+    if url.get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', '5')),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+            pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT_SECONDS', '30')),
+            pool_recycle=int(os.environ.get('DB_POOL_RECYCLE_SECONDS', '1800'))
+        )
+    engine = create_engine(url, **options)
+
+    if url.get_backend_name() == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def _configure_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA foreign_keys=ON')
+            if url.database and url.database != ':memory:':
+                cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.close()
+
+    # Connections must not be shared with a forked worker
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    return engine
+
+
+class SQLScenarioStorage:
+    """ScenarioStorage backed by a SQL database through SQLAlchemy
+
+    Same interface as data.ScenarioStorage. Filters run in SQL; listings load
+    parents, children, domains and CDASH items with one query each.
+    """
+
+    def __init__(self, database_url=None, engine=None):
+        self._engine = engine or create_storage_engine(database_url)
+        metadata.create_all(self._engine)
+        self._initialize_ootb_scenarios()
+
+    def _initialize_ootb_scenarios(self):
+        """Seed tags and, on first start, the OOTB scenarios in a single transaction"""
+        try:
+            with self._engine.begin() as conn:
+                existing_tags = set(conn.scalars(select(tags_table.c.name)))
+                missing_tags = [{'name': tag.name, 'color': tag.color}
+                                for tag in Tag.get_available_tags() if tag.name not in existing_tags]
+                if missing_tags:
+                    conn.execute(insert(tags_table), missing_tags)
+
+                if conn.scalar(_VERSION_QUERY) is None:
+                    # Starts at the creation time so a recreated database never repeats a version
+                    conn.execute(insert(storage_meta_table).values(key='version', value=time.time_ns()))
+
+                has_ootb = conn.scalar(select(parents_table.c.id).where(parents_table.c.is_ootb).limit(1))
+                if has_ootb is None:
+                    rows = _ScenarioRows()
+                    for position, parent in enumerate(load_ootb_scenarios(map_cold_fields=False)):
+                        rows.add(parent, position)
+                    rows.insert(conn)
+        except IntegrityError:
+            # Another worker seeded the database first
+            pass
+
+    def _load(self, conn, condition=None):
+        """Load parent scenarios matching condition (a parent_scenarios clause), in listing order"""
+        parents_query = select(parents_table).order_by(parents_table.c.position, parents_table.c.id)
+        if condition is not None:
+            parents_query = parents_query.where(condition)
+        parent_rows = conn.execute(parents_query).all()
+        if not parent_rows:
+            return []
+
+        # Children and their codes for exactly the selected parents, one query each
+        matching_ids = select(parents_table.c.id)
+        if condition is not None:
+            matching_ids = matching_ids.where(condition)
+        in_parents = children_table.c.parent_id.in_(matching_ids)
+        child_rows = conn.execute(
+            select(children_table).where(in_parents)
+            .order_by(children_table.c.parent_id, children_table.c.position)
+        ).all()
+        codes = {}
+        for table, column in ((child_domains_table, 'domain'), (child_cdash_items_table, 'item')):
+            codes_by_child = defaultdict(list)
+            for child_id, code in conn.execute(
+                    select(table.c.child_id, table.c[column])
+                    .join(children_table, children_table.c.id == table.c.child_id)
+                    .where(in_parents)
+                    .order_by(table.c.child_id, table.c.position)):
+                codes_by_child[child_id].append(code)
+            codes[column] = codes_by_child
+
+        children_by_parent = defaultdict(list)
+        for row in child_rows:
+            children_by_parent[row.parent_id].append(ChildScenario(
+                id=row.id,
+                scenario_text=row.scenario_text,
+                required_cdash_items=codes['item'].get(row.id, ()),
+                domains=codes['domain'].get(row.id, ()),
+                tag=Tag.get(row.tag_name),
+                reasoning_template=row.reasoning_template,
+                pseudo_code=row.pseudo_code,
+                version=row.version,
+                created_at=row.created_at,
+                updated_at=row.updated_at
+            ))
+
+        return [
+            ParentScenario(
+                id=row.id,
+                name=row.name,
+                description=row.description,
+                is_active=row.is_active,
+                is_ootb=row.is_ootb,
+                child_scenarios=children_by_parent.get(row.id, []),
+                tag=Tag.get(row.tag_name),
+                version=row.version,
+                created_at=row.created_at,
+                updated_at=row.updated_at
+            )
+            for row in parent_rows
+        ]
+
+    def get_all_scenarios(self):
+        """Get all scenarios"""
+        with self._engine.connect() as conn:
+            return self._load(conn)
+
+    def get_scenario_by_id(self, scenario_id):
+        """Get scenario by ID"""
+        with self._engine.connect() as conn:
+            scenarios = self._load(conn, parents_table.c.id == scenario_id)
+        return scenarios[0] if scenarios else None
+
+    def get_many(self, scenario_ids):
+        """Get the scenarios for a list of IDs, in request order, skipping unknown IDs"""
+        scenario_ids = list(scenario_ids)
+        if not scenario_ids:
+            return []
+        with self._engine.connect() as conn:
+            found = {scenario.id: scenario for scenario in self._load(conn, parents_table.c.id.in_(scenario_ids))}
+        return [found[scenario_id] for scenario_id in scenario_ids if scenario_id in found]
+
+    def locate_child(self, child_id):
+        """Get (parent, position) for a child scenario ID, or None"""
+        with self._engine.connect() as conn:
+            parent_id = conn.scalar(select(children_table.c.parent_id).where(children_table.c.id == child_id))
+            if parent_id is None:
+                return None
+            scenarios = self._load(conn, parents_table.c.id == parent_id)
+        parent = scenarios[0]
+        position = next(i for i, child in enumerate(parent.child_scenarios) if child.id == child_id)
+        return parent, position
+
+    def get_all_domains(self):
+        """Get the sorted domains used by any child scenario"""
+        with self._engine.connect() as conn:
+            return list(conn.scalars(
+                select(child_domains_table.c.domain).distinct().order_by(child_domains_table.c.domain)))
+
+    def get_all_tags(self):
+        """Get the sorted tag names used by any parent or child scenario"""
+        with self._engine.connect() as conn:
+            return sorted(conn.scalars(union(
+                select(parents_table.c.tag_name).where(parents_table.c.tag_name.is_not(None)),
+                select(children_table.c.tag_name).where(children_table.c.tag_name.is_not(None))
+            )))
+
+    def get_facet_counts(self):
+        """Get the number of scenarios per domain, tag and CDASH item"""
+        parent_tags = union_all(
+            select(parents_table.c.id.label('parent_id'), parents_table.c.tag_name),
+            select(children_table.c.parent_id, children_table.c.tag_name)
+        ).subquery()
+        with self._engine.connect() as conn:
+            domains = conn.execute(
+                select(child_domains_table.c.domain, func.count(distinct(children_table.c.parent_id)))
+                .join(children_table, children_table.c.id == child_domains_table.c.child_id)
+                .group_by(child_domains_table.c.domain)
+            ).all()
+            tags = conn.execute(
+                select(parent_tags.c.tag_name, func.count(distinct(parent_tags.c.parent_id)))
+                .where(parent_tags.c.tag_name.is_not(None))
+                .group_by(parent_tags.c.tag_name)
+            ).all()
+            cdash_items = conn.execute(
+                select(child_cdash_items_table.c.item, func.count(distinct(child_cdash_items_table.c.child_id)))
+                .group_by(child_cdash_items_table.c.item)
+            ).all()
+        return {
+            'domains': dict(domains),
+            'tags': dict(tags),
+            'cdash_items': dict(cdash_items)
+        }
+
+    def get_scenario_domains(self, scenario_id):
+        """Get the distinct child domains of a scenario, in first-seen order"""
+        with self._engine.connect() as conn:
+            domains = conn.scalars(
+                select(child_domains_table.c.domain)
+                .join(children_table, children_table.c.id == child_domains_table.c.child_id)
+                .where(children_table.c.parent_id == scenario_id)
+                .order_by(children_table.c.position, child_domains_table.c.position)
+            )
+            return tuple(dict.fromkeys(domains))
+
+    def get_scenario_tag_names(self, scenario_id):
+        """Get the distinct parent and child tag names of a scenario"""
+        with self._engine.connect() as conn:
+            parent_tag = conn.scalar(select(parents_table.c.tag_name).where(parents_table.c.id == scenario_id))
+            child_tags = conn.scalars(
+                select(children_table.c.tag_name)
+                .where(children_table.c.parent_id == scenario_id, children_table.c.tag_name.is_not(None))
+                .order_by(children_table.c.position)
+            )
+            return tuple(dict.fromkeys(tag for tag in [parent_tag, *child_tags] if tag))
+
+    def get_scenarios_by_domains(self, domains):
+        """Get scenarios with a child in any of the domains, in listing order"""
+        domains = list(domains)
+        if not domains:
+            return []
+        with self._engine.connect() as conn:
+            return self._load(conn, _has_domain(child_domains_table.c.domain.in_(domains)))
+
+    def get_child_ids_for_cdash_item(self, item):
+        """Get the IDs of child scenarios that require a CDASH item"""
+        with self._engine.connect() as conn:
+            return set(conn.scalars(
+                select(child_cdash_items_table.c.child_id).where(child_cdash_items_table.c.item == item)))
+
+    def add_scenario(self, scenario):
+        """Add new scenario"""
+        with self._engine.begin() as conn:
+            position = conn.scalar(select(parents_table.c.position).where(parents_table.c.id == scenario.id))
+            if position is None:
+                position = _next_position(conn, parents_table.c.position)
+            else:
+                _delete_parent(conn, scenario.id)
+            rows = _ScenarioRows()
+            rows.add(scenario, position)
+            rows.insert(conn)
+            _bump_version(conn)
+
+    def update_scenario(self, scenario_id, updated_scenario):
+        """Update existing scenario"""
+        with self._engine.begin() as conn:
+            position = conn.scalar(select(parents_table.c.position).where(parents_table.c.id == scenario_id))
+            if position is None:
+                return False
+
+            # The replacement may carry a new ID; it keeps the old place in the listing
+            updated_scenario.updated_at = datetime.now()
+            _delete_parent(conn, scenario_id)
+            if updated_scenario.id != scenario_id:
+                _delete_parent(conn, updated_scenario.id)
+            rows = _ScenarioRows()
+            rows.add(updated_scenario, position)
+            rows.insert(conn)
+            _bump_version(conn)
+        return True
+
+    def delete_scenario(self, scenario_id):
+        """Delete scenario (only if not OOTB)"""
+        with self._engine.begin() as conn:
+            is_ootb = conn.scalar(select(parents_table.c.is_ootb).where(parents_table.c.id == scenario_id))
+            if is_ootb is None or is_ootb:
+                return False
+            _delete_parent(conn, scenario_id)
+            _bump_version(conn)
+        return True
+
+    def add_child_scenarios(self, parent_id, child_scenarios):
+        """Append child scenarios to a parent scenario"""
+        with self._engine.begin() as conn:
+            touched = conn.execute(
+                update(parents_table).where(parents_table.c.id == parent_id).values(updated_at=datetime.now())
+            ).rowcount
+            if not touched:
+                return False
+            position = _next_position(conn, children_table.c.position, children_table.c.parent_id == parent_id)
+            rows = _ScenarioRows()
+            for offset, child in enumerate(child_scenarios):
+                rows.add_child(parent_id, child, position + offset)
+            rows.insert(conn)
+            _bump_version(conn)
+        return True
+
+    def delete_child_scenario(self, parent_id, child_id):
+        """Remove a child scenario from its parent"""
+        with self._engine.begin() as conn:
+            child_filter = and_(children_table.c.id == child_id, children_table.c.parent_id == parent_id)
+            if conn.scalar(select(children_table.c.id).where(child_filter)) is None:
+                return False
+            _delete_children(conn, child_filter)
+            conn.execute(update(parents_table).where(parents_table.c.id == parent_id)
+                         .values(updated_at=datetime.now()))
+            _bump_version(conn)
+        return True
+
+    def toggle_scenario_status(self, scenario_id):
+        """Toggle scenario active/inactive status"""
+        with self._engine.begin() as conn:
+            toggled = conn.execute(
+                update(parents_table).where(parents_table.c.id == scenario_id)
+                .values(is_active=~parents_table.c.is_active, updated_at=datetime.now())
+            ).rowcount
+            if toggled:
+                _bump_version(conn)
+        return bool(toggled)
+
+    def recommend_scenarios(self, selected_domains, selected_tags, limit=None, **focus):
+        """Score active scenarios for the recommendation tab
+
+        Returns the total number of matches and the top `limit` recommendations
+        as dicts with the scenario, its score and the reasons behind it. Scores
+        come from the recommendation engine, fed with the facets of the active
+        scenarios read in three queries.
+        """
+        active = parents_table.c.is_active
+        with self._engine.connect() as conn:
+            parents = conn.execute(
+                select(parents_table.c.id, parents_table.c.position, parents_table.c.tag_name).where(active)
+            ).all()
+            child_rows = conn.execute(
+                select(children_table.c.parent_id, children_table.c.tag_name)
+                .join(parents_table, parents_table.c.id == children_table.c.parent_id)
+                .where(active)
+                .order_by(children_table.c.parent_id, children_table.c.position)
+            ).all()
+            domain_rows = conn.execute(
+                select(children_table.c.parent_id, child_domains_table.c.domain)
+                .join(children_table, children_table.c.id == child_domains_table.c.child_id)
+                .join(parents_table, parents_table.c.id == children_table.c.parent_id)
+                .where(active)
+                .order_by(children_table.c.parent_id, children_table.c.position, child_domains_table.c.position)
+            ).all()
+
+            child_counts = defaultdict(int)
+            tags = defaultdict(dict)
+            for parent_id, tag_name in child_rows:
+                child_counts[parent_id] += 1
+                if tag_name:
+                    tags[parent_id][tag_name] = None
+            domains = defaultdict(dict)
+            for parent_id, domain in domain_rows:
+                domains[parent_id][domain] = None
+
+            engine = RecommendationEngine()
+            for parent_id, position, tag_name in parents:
+                tag_names = dict.fromkeys([tag_name] if tag_name else [])
+                tag_names.update(tags[parent_id])
+                engine.add(parent_id, list(domains[parent_id]), list(tag_names),
+                           child_counts[parent_id], True, position)
+            total, results = engine.recommend(selected_domains, selected_tags, limit=limit, **focus)
+
+            found = {scenario.id: scenario
+                     for scenario in self._load(conn, parents_table.c.id.in_([r[0] for r in results]))}
+        recommendations = [
+            {'scenario': found[scenario_id], 'score': score, 'reasons': reasons}
+            for scenario_id, score, reasons in results
+        ]
+        return total, recommendations
+
+    def search_scenarios(self, query, tag_filter=None, domain_filter=None, active_only=False):
+        """Search scenarios with filters"""
+        condition = _search_condition(query, tag_filter, domain_filter, active_only)
+        with self._engine.connect() as conn:
+            return self._load(conn, condition)
+
+    def search_scenarios_page(self, query, tag_filter=None, domain_filter=None, active_only=False,
+                              sort='listing', descending=False, offset=0, limit=SCENARIO_PAGE_SIZE):
+        """Get (total, page) of search results, sorted and sliced by the database"""
+        condition = _search_condition(query, tag_filter, domain_filter, active_only)
+        child_count = (select(func.count(children_table.c.id))
+                       .where(children_table.c.parent_id == parents_table.c.id).scalar_subquery())
+        key = {
+            'listing': parents_table.c.position,
+            'name': func.lower(parents_table.c.name),
+            'children': child_count,
+            'updated': parents_table.c.updated_at,
+        }[sort]
+        page_query = (select(parents_table.c.id)
+                      .order_by(key.desc() if descending else key, parents_table.c.position)
+                      .offset(offset).limit(limit))
+        count_query = select(func.count()).select_from(parents_table)
+        if condition is not None:
+            page_query = page_query.where(condition)
+            count_query = count_query.where(condition)
+        with self._engine.connect() as conn:
+            total = conn.execute(count_query).scalar()
+            page_ids = conn.execute(page_query).scalars().all()
+            if not page_ids:
+                return total, []
+            found = {scenario.id: scenario for scenario in self._load(conn, parents_table.c.id.in_(page_ids))}
+        return total, [found[scenario_id] for scenario_id in page_ids]
+
+    def get_created_scenarios(self):
+        """Get the scenarios that are not out of the box, in listing order"""
+        with self._engine.connect() as conn:
+            return self._load(conn, parents_table.c.is_ootb.is_(False))
+
+    def get_version(self):
+        """Monotonic version of the stored scenarios, bumped by every mutation"""
+        with self._engine.connect() as conn:
+            return conn.scalar(_VERSION_QUERY)
+
+
+def _search_condition(query, tag_filter, domain_filter, active_only):
+    """parent_scenarios clause of a search, or None when nothing is filtered"""
+    conditions = []
+    if tag_filter:
+        conditions.append(or_(
+            parents_table.c.tag_name == tag_filter,
+            select(children_table.c.id).where(children_table.c.parent_id == parents_table.c.id,
+                                              children_table.c.tag_name == tag_filter).exists()
+        ))
+    if domain_filter:
+        conditions.append(_has_domain(child_domains_table.c.domain == domain_filter))
+    if active_only:
+        conditions.append(parents_table.c.is_active)
+    if query:
+        conditions.append(_matches_text(query))
+    return and_(*conditions) if conditions else None
+
+
+class _ScenarioRows:
+    """Rows for the scenario tables, inserted with one executemany per table"""
+
+    def __init__(self):
+        self.parents = []
+        self.children = []
+        self.domains = []
+        self.cdash_items = []
+
+    def add(self, scenario, position):
+        self.parents.append({
+            'id': scenario.id,
+            'position': position,
+            'name': scenario.name,
+            'description': scenario.description,
+            'is_active': scenario.is_active,
+            'is_ootb': scenario.is_ootb,
+            'tag_name': scenario.tag.name if scenario.tag else None,
+            'version': scenario.version,
+            'created_at': scenario.created_at,
+            'updated_at': scenario.updated_at
+        })
+        for child_position, child in enumerate(scenario.child_scenarios):
+            self.add_child(scenario.id, child, child_position)
+
+    def add_child(self, parent_id, child, position):
+        self.children.append({
+            'id': child.id,
+            'parent_id': parent_id,
+            'position': position,
+            'scenario_text': child.scenario_text,
+            'reasoning_template': child.reasoning_template,
+            'pseudo_code': child.pseudo_code,
+            'tag_name': child.tag.name if child.tag else None,
+            'version': child.version,
+            'created_at': child.created_at,
+            'updated_at': child.updated_at
+        })
+        self.domains.extend({'child_id': child.id, 'position': i, 'domain': domain}
+                            for i, domain in enumerate(child.domains))
+        self.cdash_items.extend({'child_id': child.id, 'position': i, 'item': item}
+                                for i, item in enumerate(child.required_cdash_items))
+
+    def insert(self, conn):
+        for table, rows in ((parents_table, self.parents), (children_table, self.children),
+                            (child_domains_table, self.domains), (child_cdash_items_table, self.cdash_items)):
+            if rows:
+                conn.execute(insert(table), rows)
+
+
+_VERSION_QUERY = select(storage_meta_table.c.value).where(storage_meta_table.c.key == 'version')
+
+
+def _bump_version(conn):
+    conn.execute(update(storage_meta_table).where(storage_meta_table.c.key == 'version')
+                 .values(value=storage_meta_table.c.value + 1))
+
+
+def _next_position(conn, column, condition=None):
+    query = select(func.coalesce(func.max(column) + 1, 0))
+    if condition is not None:
+        query = query.where(condition)
+    return conn.scalar(query)
+
+
+def _delete_children(conn, condition):
+    """Delete the child scenarios matching condition together with their codes"""
+    child_ids = select(children_table.c.id).where(condition)
+    conn.execute(delete(child_domains_table).where(child_domains_table.c.child_id.in_(child_ids)))
+    conn.execute(delete(child_cdash_items_table).where(child_cdash_items_table.c.child_id.in_(child_ids)))
+    conn.execute(delete(children_table).where(condition))
+
+
+def _delete_parent(conn, parent_id):
+    _delete_children(conn, children_table.c.parent_id == parent_id)
+    conn.execute(delete(parents_table).where(parents_table.c.id == parent_id))
+
+
+def _has_domain(domain_condition):
+    """Parent has a child with a domain matching domain_condition"""
+    return (
+        select(child_domains_table.c.child_id)
+        .join(children_table, children_table.c.id == child_domains_table.c.child_id)
+        .where(children_table.c.parent_id == parents_table.c.id, domain_condition)
+        .exists()
+    )
+
+
+def _matches_text(query):
+    """SQL version of ParentScenario.matches_search"""
+    query = query.lower()
+
+    def contains(column):
+        return func.lower(column).contains(query, autoescape=True)
+
+    child_matches = (
+        select(children_table.c.id)
+        .where(children_table.c.parent_id == parents_table.c.id, or_(
+            contains(children_table.c.scenario_text),
+            contains(children_table.c.reasoning_template),
+            contains(children_table.c.tag_name),
+            select(child_domains_table.c.child_id).where(
+                child_domains_table.c.child_id == children_table.c.id,
+                contains(child_domains_table.c.domain)).exists(),
+            select(child_cdash_items_table.c.child_id).where(
+                child_cdash_items_table.c.child_id == children_table.c.id,
+                contains(child_cdash_items_table.c.item)).exists()
+        ))
+        .exists()
+    )
+    return or_(
+        contains(parents_table.c.name),
+        contains(parents_table.c.description),
+        contains(parents_table.c.tag_name),
+        child_matches
+    )
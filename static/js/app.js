@@ -32,29 +32,89 @@ function initializeTableFunctionality() {
     console.log('Table functionality initialized');
 }
 
+/**
+ * fetch() for read endpoints that revalidates a cached copy of the response
+ *
+ * Responses with an ETag are kept in sessionStorage, keyed by method, URL and
+ * body. The next request sends If-None-Match and a 304 answer is served from
+ * the cached copy, so unchanged scenarios are not downloaded again.
+ */
+async function fetchRevalidated(url, options = {}) {
+    const cacheKey = `etag:${options.method || 'GET'} ${url} ${options.body || ''}`;
+    let cached = null;
+    try {
+        cached = JSON.parse(sessionStorage.getItem(cacheKey));
+    } catch (error) {
+        cached = null;
+    }
+    
+    const headers = new Headers(options.headers || {});
+    if (cached) {
+        headers.set('If-None-Match', cached.etag);
+    }
+    const response = await fetch(url, { ...options, headers });
+    
+    if (response.status === 304 && cached) {
+        return new Response(cached.body, { status: 200, headers: { 'Content-Type': cached.contentType } });
+    }
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        const body = await response.clone().text();
+        try {
+            sessionStorage.setItem(cacheKey, JSON.stringify({
+                etag: etag,
+                body: body,
+                contentType: response.headers.get('Content-Type')
+            }));
+        } catch (error) {
+            // Storage full or unavailable: the response is still used, just not cached
+        }
+    }
+    return response;
+}
+
 /**
  * Toggle child scenarios visibility
+ *
+ * Child rows are not part of the page; the first expand fetches them from
+ * the server and inserts them below the parent row.
  */
-function toggleChildScenarios(scenarioId) {
-    const childRows = document.querySelectorAll(`tr[data-parent-id="${scenarioId}"]`);
-    const expandButton = document.querySelector(`tr[data-scenario-id="${scenarioId}"] .expand-btn`);
+async function toggleChildScenarios(scenarioId) {
+    const parentRow = document.querySelector(`tr[data-scenario-id="${scenarioId}"]`);
+    const expandButton = parentRow ? parentRow.querySelector('.expand-btn') : null;
     const icon = expandButton ? expandButton.querySelector('i') : null;
     
-    if (childRows.length === 0 || !icon) {
+    if (!icon || expandButton.disabled) {
+        return;
+    }
+    
+    const childRows = document.querySelectorAll(`tr[data-parent-id="${scenarioId}"]`);
+    if (childRows.length === 0) {
+        expandButton.disabled = true;
+        icon.className = 'fas fa-spinner fa-spin';
+        try {
+            const response = await fetchRevalidated(`/scenario_children/${encodeURIComponent(scenarioId)}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            parentRow.insertAdjacentHTML('afterend', await response.text());
+        } catch (error) {
+            console.error('Error loading child scenarios:', error);
+            showToast('Could not load the child scenarios', 'error');
+            icon.className = 'fas fa-chevron-right';
+            return;
+        } finally {
+            expandButton.disabled = false;
+        }
+        icon.className = 'fas fa-chevron-down';
         return;
     }
     
     // Simple visibility check - if any child row is hidden, show all; otherwise hide all
-    const firstRowHidden = childRows[0].style.display === 'none' || 
-                          window.getComputedStyle(childRows[0]).display === 'none' ||
-                          childRows[0].style.display === '';
+    const firstRowHidden = childRows[0].style.display === 'none';
     
     childRows.forEach(row => {
-        if (firstRowHidden) {
-            row.style.display = 'table-row';
-        } else {
-            row.style.display = 'none';
-        }
+        row.style.display = firstRowHidden ? 'table-row' : 'none';
     });
     
     // Update icon
@@ -142,8 +202,38 @@ function suggestChildScenarios() {
     document.getElementById('childSuggestions').style.display = 'block';
     document.getElementById('loadingSuggestions').style.display = 'block';
     document.getElementById('suggestionsContent').innerHTML = '';
-    
-    // Make API call to get suggestions
+    window.currentSuggestions = [];
+    
+    // Stream suggestions so each card appears as soon as the model finishes it
+    postServerSentEvents('/api/suggest-child-scenarios/stream', { name: name, description: description }, (event, data) => {
+        if (event === 'suggestion') {
+            appendChildSuggestion(data.suggestion);
+        } else if (event === 'error') {
+            throw new Error(data.error);
+        }
+    })
+    .then(() => {
+        document.getElementById('loadingSuggestions').style.display = 'none';
+        if (window.currentSuggestions.length === 0) {
+            document.getElementById('suggestionsContent').innerHTML = 
+                '<div class="alert alert-info">No relevant child scenarios found for this description.</div>';
+        }
+    })
+    .catch(error => {
+        console.error('Error streaming suggestions:', error);
+        if (window.currentSuggestions.length === 0) {
+            // Fall back to the non-streaming endpoint
+            fetchChildSuggestions(name, description);
+        } else {
+            document.getElementById('loadingSuggestions').style.display = 'none';
+        }
+    });
+}
+
+/**
+ * Fetch all child scenario suggestions in a single (non-streaming) request
+ */
+function fetchChildSuggestions(name, description) {
     fetch('/api/suggest-child-scenarios', {
         method: 'POST',
         headers: {
@@ -172,15 +262,83 @@ function suggestChildScenarios() {
     });
 }
 
+/**
+ * POST a JSON payload and dispatch each server-sent event of the streamed response.
+ * Returning false from onEvent stops reading; throwing rejects the returned promise.
+ */
+async function postServerSentEvents(url, payload, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify(payload)
+    });
+    
+    if (!response.ok || !response.body) {
+        throw new Error(`Streaming request failed (${response.status})`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            const dataLines = [];
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            
+            if (dataLines.length && onEvent(event, JSON.parse(dataLines.join('\n'))) === false) {
+                await reader.cancel();
+                return;
+            }
+        }
+    }
+}
+
 /**
  * Render child scenario suggestions
  */
 function renderChildSuggestions(suggestions) {
     const container = document.getElementById('suggestionsContent');
-    let html = '';
+    container.innerHTML = suggestions.map((suggestion, index) => childSuggestionCard(suggestion, index)).join('');
     
-    suggestions.forEach((suggestion, index) => {
-        html += `
+    // Store suggestions for form submission
+    window.currentSuggestions = suggestions;
+}
+
+/**
+ * Append one streamed child scenario suggestion
+ */
+function appendChildSuggestion(suggestion) {
+    const index = window.currentSuggestions.length;
+    window.currentSuggestions.push(suggestion);
+    document.getElementById('suggestionsContent').insertAdjacentHTML('beforeend', childSuggestionCard(suggestion, index));
+}
+
+/**
+ * Build the card markup for one child scenario suggestion
+ */
+function childSuggestionCard(suggestion, index) {
+    return `
             <div class="col-md-6">
                 <div class="card h-100 border-2 suggestion-card" style="cursor: pointer;" onclick="toggleSuggestionCard(${index})">
                     <div class="card-header bg-light d-flex align-items-center">
@@ -235,12 +393,6 @@ function renderChildSuggestions(suggestions) {
                 </div>
             </div>
         `;
-    });
-    
-    container.innerHTML = html;
-    
-    // Store suggestions for form submission
-    window.currentSuggestions = suggestions;
 }
 
 /**
@@ -763,6 +915,26 @@ function handleScenarioDescriptionChange() {
  * Generate updated query text and Python code based on scenario description
  */
 async function generateUpdatedQueryAndCode(description, queryField, codeField) {
+    // Stream first so the fields fill in as soon as the first scenario is complete
+    try {
+        let applied = false;
+        await postServerSentEvents('/api/update-scenario-code/stream', { description: description }, (event, data) => {
+            if (event === 'code') {
+                applyGeneratedQueryAndCode(data, queryField, codeField);
+                applied = true;
+                return false;
+            }
+            if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
+        if (applied) {
+            return;
+        }
+    } catch (error) {
+        console.error('Error streaming updated code:', error);
+    }
+    
     try {
         const response = await fetch('/api/update-scenario-code', {
             method: 'POST',
@@ -775,12 +947,7 @@ async function generateUpdatedQueryAndCode(description, queryField, codeField) {
         });
         
         if (response.ok) {
-            const data = await response.json();
-            if (queryField) {
-                queryField.value = data.query_text || 'Find subjects meeting the specified validation criteria';
-                updateQueryCharCount();
-            }
-            codeField.value = data.python_code || 'def check_validation_rule(df):\n    # Generated code\n    return df';
+            applyGeneratedQueryAndCode(await response.json(), queryField, codeField);
         } else {
             // Fallback to basic generation
             generateBasicQueryAndCode(description, queryField, codeField);
@@ -791,6 +958,17 @@ async function generateUpdatedQueryAndCode(description, queryField, codeField) {
     }
 }
 
+/**
+ * Fill the query text and Python code fields from a generated scenario
+ */
+function applyGeneratedQueryAndCode(data, queryField, codeField) {
+    if (queryField) {
+        queryField.value = data.query_text || 'Find subjects meeting the specified validation criteria';
+        updateQueryCharCount();
+    }
+    codeField.value = data.python_code || 'def check_validation_rule(df):\n    # Generated code\n    return df';
+}
+
 /**
  * Generate basic query text and Python code as fallback
  */
@@ -1634,15 +1812,23 @@ function clearFilters() {
 }
 
 /**
- * Export scenarios
+ * Export scenarios in the given format, applying the current list filters
  */
-function exportScenarios() {
+function exportScenarios(format = 'csv') {
     showToast('Preparing export...', 'info');
     
+    const currentParams = new URLSearchParams(window.location.search);
+    const params = new URLSearchParams({ format: format });
+    ['search', 'tag', 'domain', 'active_only'].forEach(name => {
+        if (currentParams.get(name)) {
+            params.set(name, currentParams.get(name));
+        }
+    });
+    
     // Create a temporary link to trigger download
     const link = document.createElement('a');
-    link.href = '/export_scenarios';
-    link.download = 'qad_scenarios.csv';
+    link.href = `/export_scenarios?${params.toString()}`;
+    link.download = '';
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
@@ -1683,32 +1869,20 @@ function highlightSearchTerms(text, searchTerm) {
     return text.replace(regex, '<mark>$1</mark>');
 }
 
+// Maximum number of scenarios expanded after a search; their children are fetched one at a time
+const AUTO_EXPAND_LIMIT = 10;
+
 /**
  * Auto-expand scenarios with search matches
  */
-function autoExpandSearchMatches() {
+async function autoExpandSearchMatches() {
     const searchQuery = new URLSearchParams(window.location.search).get('search');
     if (searchQuery) {
-        // Expand all scenarios that might contain matches
-        document.querySelectorAll('.scenario-row').forEach(row => {
-            const scenarioId = row.dataset.scenarioId;
-            const childRows = document.querySelectorAll(`tr[data-parent-id="${scenarioId}"]`);
-            
-            if (childRows.length > 0) {
-                // Check if any child scenarios contain the search term
-                let hasMatch = false;
-                childRows.forEach(childRow => {
-                    const text = childRow.textContent.toLowerCase();
-                    if (text.includes(searchQuery.toLowerCase())) {
-                        hasMatch = true;
-                    }
-                });
-                
-                if (hasMatch) {
-                    toggleChildScenarios(scenarioId);
-                }
-            }
-        });
+        // The server marks the rows whose match is in a child scenario
+        const rows = [...document.querySelectorAll('.scenario-row[data-child-match="true"]')];
+        for (const row of rows.slice(0, AUTO_EXPAND_LIMIT)) {
+            await toggleChildScenarios(row.dataset.scenarioId);
+        }
     }
 }
 
@@ -3068,7 +3242,7 @@ async function suggestOOTBScenarios() {
         // Get unique domains from processed DRP scenarios
         const drpDomains = [...new Set(processedDRPScenarios.map(s => s.domain))];
         
-        const response = await fetch('/api/suggest-ootb-scenarios', {
+        const response = await fetchRevalidated('/api/suggest-ootb-scenarios', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -3204,7 +3378,7 @@ async function addSelectedOOTBScenarios() {
     }
 
     try {
-        const response = await fetch('/api/get-ootb-scenarios', {
+        const response = await fetchRevalidated('/api/get-ootb-scenarios', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -0,0 +1,335 @@
+import csv
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Study domains the dry run engine can load, one dataset file per domain
+STUDY_DOMAINS = ('AE', 'CM', 'LB', 'VS', 'DM', 'EX', 'MH')
+
+# Dataset formats in order of preference when a domain has several files
+DATASET_EXTENSIONS = ('.arrow', '.feather', '.parquet', '.csv', '.xpt')
+ARROW_EXTENSIONS = ('.arrow', '.feather')
+
+# Text columns with at most this many distinct values (and no more than one
+# per two rows) are code-list columns such as AESEV or LBNRIND and are kept
+# as categoricals. Dates and times stay text so they can be ordered.
+CATEGORY_MAX_VALUES = 1000
+TEMPORAL_SUFFIXES = ('DTC', 'DTM', 'TM')
+
+# Rows per chunk when reading SAS transport files, which cannot skip columns
+XPT_CHUNK_ROWS = 100_000
+
+DEFAULT_CACHE_MB = 512
+
+DEFAULT_STUDY_DATA_DIR = 'study_data'
+
+# Subject identifier: findings and shards are tracked per subject
+SUBJECT_COLUMN = 'USUBJID'
+
+
+def study_data_dir():
+    """Directory of the study datasets, from STUDY_DATA_DIR"""
+    return os.environ.get('STUDY_DATA_DIR') or DEFAULT_STUDY_DATA_DIR
+
+
+def find_dataset(data_dir, domain):
+    """Path of the dataset file for a domain (ae.csv, AE.parquet, ae.xpt, ...), or None"""
+    try:
+        names = {name.lower(): name for name in os.listdir(data_dir)}
+    except OSError:
+        return None
+    for extension in DATASET_EXTENSIONS:
+        name = names.get(f'{domain.lower()}{extension}')
+        if name:
+            return os.path.join(data_dir, name)
+    return None
+
+
+def available_domains(data_dir):
+    """Study domains that have a dataset file in data_dir"""
+    return [domain for domain in STUDY_DOMAINS if find_dataset(data_dir, domain)]
+
+
+def _pyarrow():
+    """pyarrow, or None when it is not installed"""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _is_temporal(name):
+    return name.upper().endswith(TEMPORAL_SUFFIXES)
+
+
+def _categorical_candidate(name):
+    return not _is_temporal(name)
+
+
+def _infer_csv_numbers(table):
+    """Convert the text columns of a CSV table that hold only numbers, as pandas.read_csv does; dates stay text"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for index, field in enumerate(table.schema):
+        if _is_temporal(field.name):
+            continue
+        for numeric_type in (pa.int64(), pa.float64()):
+            try:
+                table = table.set_column(index, field.name, pc.cast(table.column(index), numeric_type))
+                break
+            except pa.ArrowInvalid:
+                continue
+    return table
+
+
+def _encode_arrow_codes(table):
+    """Dictionary-encode the low-cardinality text columns of an Arrow table"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    limit = min(CATEGORY_MAX_VALUES, table.num_rows // 2)
+    for index, field in enumerate(table.schema):
+        if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            continue
+        if not _categorical_candidate(field.name):
+            continue
+        column = table.column(index)
+        if pc.count_distinct(column).as_py() <= limit:
+            table = table.set_column(index, field.name, pc.dictionary_encode(column))
+    return table
+
+
+def _encode_frame_codes(frame):
+    """Convert the low-cardinality text columns of a DataFrame to categoricals"""
+    limit = min(CATEGORY_MAX_VALUES, len(frame) // 2)
+    for name in frame.columns:
+        series = frame[name]
+        if not _categorical_candidate(name) or not (series.dtype == object or pd.api.types.is_string_dtype(series)):
+            continue
+        if series.nunique() <= limit:
+            frame[name] = series.astype('category')
+    return frame
+
+
+def _csv_header(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+
+def _project(available, columns):
+    """The requested columns present in the file, in file order; all of them without a request"""
+    if columns is None:
+        return list(available)
+    wanted = set(columns)
+    return [column for column in available if column in wanted]
+
+
+def subject_shards(subjects, count):
+    """Shard of every row, from a hash of its subject identifier that is the same in every process and domain"""
+    codes, uniques = pd.factorize(subjects, use_na_sentinel=False)
+    # As text, so a subject read as a number in one file and as text in another lands in the same shard
+    hashes = pd.util.hash_array(np.asarray(pd.Index(uniques).astype(str), dtype=object), categorize=False)
+    return (hashes % np.uint64(count)).astype(np.intp)[codes]
+
+
+def _shard_positions(subjects, shard, rows):
+    """Row positions of a shard (index, count); rows without a subject column all belong to shard 0"""
+    index, count = shard
+    if subjects is None:
+        return np.arange(rows if index == 0 else 0)
+    return np.flatnonzero(subject_shards(subjects, count) == index)
+
+
+def _with_subject(columns, shard):
+    """Columns to read: those requested, plus the subject column when a shard is selected"""
+    if shard is None or columns is None or SUBJECT_COLUMN in columns:
+        return columns
+    return list(columns) + [SUBJECT_COLUMN]
+
+
+def _read_arrow(path, columns, shard=None):
+    """Read Arrow IPC/Feather, Parquet or CSV through pyarrow, projected and memory-mapped where the format allows"""
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    extension = os.path.splitext(path)[1].lower()
+    requested, columns = columns, _with_subject(columns, shard)
+    if extension in ARROW_EXTENSIONS:
+        # Zero copy: the table's buffers point into the mapped file
+        try:
+            with pa.memory_map(path) as source:
+                names = ipc.open_file(source).schema.names
+        except pa.ArrowInvalid:
+            # Feather version 1, which is not an IPC file
+            names = feather.read_table(path, columns=[], memory_map=True).schema.names
+        table = feather.read_table(path, columns=_project(names, columns), memory_map=True)
+    elif extension == '.parquet':
+        names = pq.read_schema(path, memory_map=True).names
+        table = pq.read_table(path, columns=_project(names, columns), memory_map=True)
+    else:
+        # Read as text and typed like the pandas reader: pyarrow's own inference
+        # turns --DTC columns into dates, which rules compare with string literals
+        names = _project(_csv_header(path), columns)
+        convert_options = pv.ConvertOptions(include_columns=names, column_types=dict.fromkeys(names, pa.string()),
+                                            strings_can_be_null=True)
+        table = _infer_csv_numbers(pv.read_csv(path, convert_options=convert_options))
+    if shard is None:
+        return _encode_arrow_codes(table).to_pandas()
+
+    # Only the shard's rows reach pandas; they keep their file positions as index
+    subjects = table.column(SUBJECT_COLUMN).to_pandas() if SUBJECT_COLUMN in table.column_names else None
+    positions = _shard_positions(subjects, shard, table.num_rows)
+    table = table.take(positions)
+    if requested is not None and SUBJECT_COLUMN not in requested and subjects is not None:
+        table = table.drop_columns([SUBJECT_COLUMN])
+    frame = _encode_arrow_codes(table).to_pandas()
+    frame.index = positions
+    return frame
+
+
+def _read_pandas(path, columns, shard=None):
+    """Read a dataset with pandas alone"""
+    extension = os.path.splitext(path)[1].lower()
+    requested, columns = columns, _with_subject(columns, shard)
+    if extension == '.xpt':
+        # SAS transport files are read whole; projecting each chunk bounds the peak to one chunk
+        chunks = []
+        with pd.read_sas(path, format='xport', encoding='utf-8', chunksize=XPT_CHUNK_ROWS) as reader:
+            for chunk in reader:
+                chunks.append(chunk[_project(chunk.columns, columns)])
+        frame = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    elif extension == '.parquet':
+        frame = pd.read_parquet(path)
+        frame = frame[_project(frame.columns, columns)]
+    elif extension in ARROW_EXTENSIONS:
+        raise ImportError(f"Reading {os.path.basename(path)} requires pyarrow")
+    else:
+        wanted = set(columns) if columns is not None else None
+        frame = pd.read_csv(path, low_memory=False,
+                            usecols=(lambda column: column in wanted) if wanted is not None else None,
+                            dtype={name: str for name in _csv_header(path) if _is_temporal(name)})
+    if shard is not None:
+        subjects = frame[SUBJECT_COLUMN] if SUBJECT_COLUMN in frame.columns else None
+        positions = _shard_positions(subjects, shard, len(frame))
+        frame = frame.iloc[positions]
+        if requested is not None and SUBJECT_COLUMN not in requested and subjects is not None:
+            frame = frame.drop(columns=SUBJECT_COLUMN)
+        frame.index = positions
+    return _encode_frame_codes(frame)
+
+
+def read_dataset(path, columns=None, shard=None):
+    """Read an Arrow/Feather, Parquet, CSV or SAS transport dataset into a DataFrame
+
+    With columns, only those of them present in the file are read. Arrow and
+    Parquet files are memory-mapped, and low-cardinality code-list columns
+    come back as categoricals. With shard (index, count), only the rows of
+    the subjects that subject_shards assigns to that shard are returned,
+    indexed by their position in the file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension != '.xpt' and _pyarrow() is not None:
+        return _read_arrow(path, columns, shard)
+    return _read_pandas(path, columns, shard)
+
+
+def _frame_bytes(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetCache:
+    """Size-bounded LRU of parsed dataset frames, keyed by file, subject shard and column projection
+
+    A request for columns that a cached frame of the same file version and
+    shard already holds is served from that frame. Concurrent requests for
+    the same uncached frame parse the file once.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()  # (path, mtime, size, shard, columns) -> (frame, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> lock held while that frame is parsed
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, version, columns):
+        """Cached frame of a file version and shard holding the columns, projected to them"""
+        wanted = None if columns is None else set(columns)
+        for key, (frame, _) in self._frames.items():
+            if key[:4] != version:
+                continue
+            if key[4] == columns or (wanted is not None and (key[4] is None or wanted <= set(key[4]))):
+                self._frames.move_to_end(key)
+                if key[4] == columns:
+                    return frame
+                return frame[[column for column in frame.columns if column in wanted]]
+        return None
+
+    def get(self, path, columns=None, shard=None):
+        """Frame of a dataset file restricted to columns and a subject shard, read on a miss"""
+        stat = os.stat(path)
+        version = (path, stat.st_mtime_ns, stat.st_size, shard)
+        columns = None if columns is None else tuple(sorted(set(columns)))
+        key = version + (columns,)
+        with self._lock:
+            frame = self._lookup(version, columns)
+            if frame is not None:
+                self.hits += 1
+                return frame
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                frame = self._lookup(version, columns)
+                if frame is not None:
+                    self.hits += 1
+                    return frame
+                self.misses += 1
+            try:
+                frame = read_dataset(path, columns, shard)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            self._store(key, frame)
+            return frame
+
+    def _store(self, key, frame):
+        size = _frame_bytes(frame)
+        path, mtime, file_size, shard, columns = key
+        with self._lock:
+            # Drop older versions of the file and frames of the shard that the new frame covers
+            for cached in [cached for cached in self._frames if cached[0] == path and (
+                    cached[1:3] != (mtime, file_size) or (cached[3] == shard and (
+                        columns is None or (cached[4] is not None and set(cached[4]) <= set(columns)))))]:
+                self._bytes -= self._frames.pop(cached)[1]
+            if size > self.max_bytes:
+                return
+            self._frames[key] = (frame, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'frames': len(self._frames), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# Frames parsed by this process, reused by every dry run it serves
+dataset_cache = DatasetCache(int(float(os.environ.get('DRY_RUN_CACHE_MB', DEFAULT_CACHE_MB)) * 1024 * 1024))